@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+benchmark_vector_index.py - recall@k, memory and latency of the vector index
+
+Compares the quantized storage formats (float16, int8) and the IVF backend
+at several nprobe values against the exact float32 brute-force path, both
+for the coarse search alone and with the float32 re-rank that
+semantic_search uses when VECTOR_EXACT_COPY is on. Runs on synthetic
+clustered vectors by default or on the real vectors from selesta_memory.db
+with --db.
+
+"MB" is the resident index in RAM. "disk MB" is the measured size of an
+SQLite file holding the vectors: "disk MB" without the float32 copy
+(the default), "+copy MB" with the vector_exact copy that the re-rank
+needs. The copy makes a quantized database larger than plain float32.
+For IVF the centroid file is added.
+
+Usage:
+    python scripts/benchmark_vector_index.py --rows 20000 --queries 200 --k 5
+    python scripts/benchmark_vector_index.py --rows 100000 --nprobe 4 8 16 32
+    python scripts/benchmark_vector_index.py --db data/selesta_memory.db
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.vector_index import STORAGE_FORMATS, VectorIndex, decode_embedding, encode_embedding, make_index, rerank
+from utils.vector_store import RERANK_FACTOR
+
+
+def synthetic_vectors(rows: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered vectors, closer to real embeddings than isotropic noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def load_db_vectors(path: str) -> np.ndarray:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT embedding, embedding_format FROM vectors").fetchall()
+    except sqlite3.OperationalError:
+        rows = [(blob, None) for (blob,) in conn.execute("SELECT embedding FROM vectors")]
+    conn.close()
+    return np.stack([decode_embedding(blob, storage) for blob, storage in rows])
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Perturbed copies of stored vectors, so every query has close neighbours."""
+    rng = np.random.default_rng(seed + 1)
+    picks = vectors[rng.integers(0, len(vectors), size=count)]
+    noise = rng.normal(size=picks.shape).astype(np.float32)
+    return picks + 0.3 * np.linalg.norm(picks, axis=1, keepdims=True) * noise / np.sqrt(vectors.shape[1])
+
+
+def build_index(vectors: np.ndarray, storage: str, backend: str = "flat", nlist: int = 0) -> VectorIndex:
+    options = {"nlist": nlist, "min_train_rows": 1} if backend == "ivf" else {}
+    index = make_index(vectors.shape[1], storage=storage, backend=backend, **options)
+    for i, vector in enumerate(vectors):
+        index.upsert(str(i), "bench", i, vector, "")
+    index.maybe_train()
+    return index
+
+
+def disk_bytes(vectors: np.ndarray, storage: str, workdir: str, exact_copy: bool = False) -> int:
+    """Size of an SQLite file holding the vectors the way vector_store stores them."""
+    path = os.path.join(workdir, f"{storage}{'-copy' if exact_copy else ''}.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE vectors (id TEXT PRIMARY KEY, embedding BLOB NOT NULL, embedding_format TEXT)")
+    conn.execute("CREATE TABLE vector_exact (id TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+    conn.executemany(
+        "INSERT INTO vectors VALUES (?, ?, ?)",
+        ((str(i), encode_embedding(vector, storage), storage) for i, vector in enumerate(vectors))
+    )
+    if storage != "float32" and exact_copy:
+        conn.executemany(
+            "INSERT INTO vector_exact VALUES (?, ?)",
+            ((str(i), encode_embedding(vector, "float32")) for i, vector in enumerate(vectors))
+        )
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def recall(found: List[Tuple], expected: List[Tuple], k: int) -> float:
+    truth = {result[1] for result in expected[:k]}
+    return len(truth & {result[1] for result in found[:k]}) / max(1, len(truth))
+
+
+def evaluate(
+    index: VectorIndex,
+    queries: np.ndarray,
+    truth: List[List[Tuple]],
+    exact_vectors: Dict[str, np.ndarray],
+    k: int,
+    nprobe: int = 0
+) -> Dict[str, float]:
+    coarse_recall = reranked_recall = 0.0
+    started = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        if index.quantized:
+            candidates = index.search(query, top_k=k * RERANK_FACTOR, nprobe=nprobe or None)
+            coarse_recall += recall(candidates, expected, k)
+            found = rerank(query, candidates, {c[1]: exact_vectors[c[1]] for c in candidates}, k)
+        else:
+            found = index.search(query, top_k=k, nprobe=nprobe or None)
+            coarse_recall += recall(found, expected, k)
+        reranked_recall += recall(found, expected, k)
+    elapsed = time.perf_counter() - started
+    return {
+        "coarse_recall": coarse_recall / len(queries),
+        "recall": reranked_recall / len(queries),
+        "ms_per_query": elapsed / len(queries) * 1000,
+    }
+
+
+def run(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    nprobes: List[int],
+    nlist: int = 0
+) -> List[Dict[str, object]]:
+    exact_vectors = {str(i): vector for i, vector in enumerate(vectors)}
+    baseline = build_index(vectors, "float32")
+    truth = [baseline.search(query, top_k=k) for query in queries]
+
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        disk = {storage: disk_bytes(vectors, storage, workdir) for storage in STORAGE_FORMATS}
+        for storage in STORAGE_FORMATS:
+            index = baseline if storage == "float32" else build_index(vectors, storage)
+            report.append({
+                "config": f"flat/{storage}",
+                "bytes": index.nbytes,
+                "disk_bytes": disk[storage],
+                "copy_disk_bytes": disk_bytes(vectors, storage, workdir, exact_copy=True),
+                "ratio": baseline.nbytes / max(1, index.nbytes),
+                **evaluate(index, queries, truth, exact_vectors, k),
+            })
+
+        if nprobes:
+            started = time.perf_counter()
+            index = build_index(vectors, "float32", backend="ivf", nlist=nlist)
+            print(f"IVF build+train: {time.perf_counter() - started:.1f}s, {index.stats()['nlist']} lists")
+            centroids = os.path.join(workdir, "index.ivf.npz")
+            index.save(centroids)
+            for nprobe in nprobes:
+                report.append({
+                    "config": f"ivf/nprobe={nprobe}",
+                    "bytes": index.nbytes,
+                    "disk_bytes": disk["float32"] + os.path.getsize(centroids),
+                    "copy_disk_bytes": disk["float32"] + os.path.getsize(centroids),
+                    "ratio": baseline.nbytes / max(1, index.nbytes),
+                    **evaluate(index, queries, truth, exact_vectors, k, nprobe),
+                })
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Use vectors from this SQLite database")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[4, 8, 16, 32], help="IVF nprobe values (none to skip IVF)")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF list count (0 = about sqrt(rows))")
+    args = parser.parse_args()
+
+    if args.db:
+        vectors = load_db_vectors(args.db)
+    else:
+        vectors = synthetic_vectors(args.rows, args.dim, args.clusters, args.seed)
+    queries = make_queries(vectors, args.queries, args.seed)
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    report = run(vectors, queries, args.k, args.nprobe, args.nlist)
+    print(
+        f"{'config':<16} {'MB':>8} {'ratio':>6} {'disk MB':>8} {'+copy MB':>9} "
+        f"{'coarse@k':>9} {'recall@k':>9} {'ms/query':>9}"
+    )
+    for row in report:
+        print(
+            f"{row['config']:<16} {row['bytes'] / 2**20:>8.1f} {row['ratio']:>5.1f}x {row['disk_bytes'] / 2**20:>8.1f} "
+            f"{row['copy_disk_bytes'] / 2**20:>9.1f} "
+            f"{row['coarse_recall']:>9.3f} {row['recall']:>9.3f} {row['ms_per_query']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
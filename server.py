@@ -3,8 +3,9 @@ import json
 import asyncio
 import time
 import random
+import functools
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, Tuple, Callable, Awaitable
 
 from pydantic import BaseModel
 
@@ -14,20 +15,40 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 # Импортируем утилиты
-from utils.claude import claude_emergency
+from utils.claude import claude_emergency, claude_stream, usage_stats, DEFAULT_SYSTEM_PROMPT
 from utils.file_handling import extract_text_from_file_async
+from utils import http_client
 from utils.imagine import generate_image_async
-from utils.journal import log_event, wilderness_log
+from utils.journal import log_event, wilderness_log, start_writer, stop_writer, writer_stats
+from utils import journal_store
+from utils.conversation_memory import ConversationMemory
+from utils.dispatcher import ChatDispatcher, ACCEPTED, OVERLOADED
+from utils.delivery_scheduler import DeliveryScheduler, DELIVERY_DB_PATH
 from utils.lighthouse import check_core_json
-from utils.resonator import build_system_prompt, get_random_wilderness_topic
+from utils.resonator import (
+    build_system_prompt,
+    build_system_blocks,
+    get_random_wilderness_topic,
+    system_prompt_fingerprint,
+)
+from utils.response_cache import ResponseCache, make_key as make_cache_key
+from utils.update_dedupe import UpdateDeduplicator
 from utils.text_helpers import extract_text_from_url_async, summarize_text
 from utils.text_processing import process_text, send_long_message
-from utils.vector_store import vectorize_all_files, semantic_search, is_vector_store_available
+from utils.vector_store import (
+    vectorize_all_files,
+    semantic_search,
+    is_vector_store_available,
+    vector_store_status,
+    open_vector_store,
+    close_vector_store,
+)
 from utils.telegram_sender import (
     send_message,
-    send_multipart_message,
-    send_typing,
     send_audio_message,
+    typing_indicator,
+    TelegramStreamSink,
+    delivery_stats,
 )
 from utils.voice import download_telegram_file, transcribe_audio, text_to_speech
 from langdetect import detect, LangDetectException
@@ -51,6 +72,32 @@ MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))  # 10
 BOT_USERNAME = os.getenv("BOT_USERNAME", "").lower()
 NAME_ALIASES = ["селеста", "selesta", "selesta"]
 GROUP_DELAY_RANGE = (40, 240)  # Задержка ответов в группах (секунды)
+GROUP_COALESCE_MAX = 10  # Сколько сообщений группы склеивается в один отложенный ответ
+MULTIPART_DELAY_RANGE = (5.0, 30.0)  # Пауза между частями длинного ответа (секунды)
+MULTIPART_HOLD_MARGIN = 60.0  # Запас сверх пауз, после которого очередь чата отпускается сама
+# Потоковая доставка ответов в Telegram (первое сообщение по первым токенам)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1").lower() not in ("0", "false", "no")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+# Системный промпт блоками с cache_control (prompt caching Anthropic)
+PROMPT_CACHING = os.getenv("PROMPT_CACHING", "1").lower() not in ("0", "false", "no")
+
+# Тайм-ауты этапов подготовки запроса (секунды) и общий бюджет на подготовку
+STAGE_TIMEOUTS = {
+    "language": 1.0,
+    "url_context": 8.0,
+    "system_prompt": 2.0,
+    "memory": 1.0,
+    "retrieval": 5.0,
+}
+PRE_LLM_BUDGET = float(os.getenv("PRE_LLM_BUDGET", "8"))
+LANG_MAP = {
+    "ru": "Russian",
+    "en": "English",
+    "uk": "Ukrainian",
+    "de": "German",
+    "fr": "French",
+    "es": "Spanish",
+}
 
 # Пути для файлов
 UPLOADS_DIR = "uploads"
@@ -81,7 +128,16 @@ app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
 core_config = None
 last_check = 0
 last_wilderness = 0
-memory_cache: Dict[str, List[Dict[str, Any]]] = {}  # Кэш для хранения контекста разговоров
+# Контекст разговоров: LRU с TTL, сохраняется в SQLite и переживает рестарты
+conversation_memory = ConversationMemory()
+# Упорядоченные очереди по чатам и общий лимит одновременных вызовов LLM
+dispatcher = ChatDispatcher()
+# Отложенные ответы в группах и части длинных ответов (переживают рестарт)
+delivery_scheduler = DeliveryScheduler(DELIVERY_DB_PATH)
+# Кэш ответов на идентичные запросы (включается RESPONSE_CACHE=1)
+response_cache = ResponseCache()
+# Принятые update_id Telegram: повторная доставка не запускает обработку
+update_dedupe = UpdateDeduplicator()
 # Режим голосовых ответов для чатов
 voice_mode: Dict[str, bool] = {}
 # Флаг для предотвращения повторной векторизации при множественных стартах
@@ -155,6 +211,20 @@ async def startup_vectorization() -> None:
     finally:
         vectorization_done = True
 
+async def startup_journal_import() -> None:
+    """
+    Импортирует в индекс журналы, которые еще не импортированы полностью.
+    Прогресс хранится в самом индексе, поэтому уже импортированные файлы
+    пропускаются, а прерванный импорт продолжается.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        imported = await loop.run_in_executor(None, journal_store.import_journal_files)
+        if imported:
+            print(f"Journal index: imported {imported} entries")
+    except Exception as e:
+        print(f"Journal import error: {e}")
+
 async def initialize_config() -> MessageResponse:
     """Загружает и инициализирует конфигурацию Селесты."""
     try:
@@ -228,41 +298,36 @@ def update_memory(chat_id: str, message: str, response: str, max_history: int =
         response: Ответ Селесты
         max_history: Максимальное количество сохраняемых сообщений
     """
-    global memory_cache
-    
     if not chat_id:
         return
     
-    if chat_id not in memory_cache:
-        memory_cache[chat_id] = []
-    
-    # Добавляем новую пару сообщение-ответ
-    memory_cache[chat_id].append({
-        "message": message, 
-        "response": response, 
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    # Ограничиваем длину истории
-    memory_cache[chat_id] = memory_cache[chat_id][-max_history:]
+    conversation_memory.append(chat_id, message, response, max_history=max_history)
 
-def get_memory_context(chat_id: str) -> str:
+def get_memory_context(chat_id: str, exclude_message: Optional[str] = None) -> str:
     """
     Получает контекст из памяти для данного чата.
     
     Args:
         chat_id: ID чата
+        exclude_message: Отбросить последние записи с этим же сообщением.
+            Используется для ключа кэша ответов: повторный вопрос видит тот
+            же снимок памяти, что и первый, а не память с уже данным ответом
         
     Returns:
         str: Контекст из последних сообщений
     """
-    if not chat_id or chat_id not in memory_cache:
+    if not chat_id:
         return ""
     
+    history = conversation_memory.get_history(chat_id)
+    if exclude_message is not None:
+        while history and history[-1][1] == exclude_message:
+            history = history[:-1]
+    
     context_items = []
-    for item in memory_cache[chat_id][-3:]:  # Берем только последние 3 записи
-        context_items.append(f"User: {item['message']}")
-        context_items.append(f"Selesta: {item['response']}")
+    for _, message, response in history[-3:]:  # Берем только последние 3 записи
+        context_items.append(f"User: {message}")
+        context_items.append(f"Selesta: {response}")
     
     return "\n".join(context_items)
 
@@ -289,12 +354,83 @@ def should_reply_in_group(
         return True
     return False
 
+def detect_language(message: str) -> Optional[str]:
+    """Определяет язык ответа по тексту сообщения."""
+    try:
+        lang_code = detect(message) if message.strip() else ""
+    except LangDetectException:
+        return None
+    return LANG_MAP.get(lang_code, "English")
+
+async def fetch_url_context(message: str) -> str:
+    """Загружает и сжимает текст первой ссылки из сообщения."""
+    if "http://" not in message and "https://" not in message:
+        return ""
+    urls = [w for w in message.split() if w.startswith("http://") or w.startswith("https://")]
+    if not urls:
+        return ""
+    url = urls[0]
+    try:
+        # Извлекаем текст со страницы и суммаризируем для удобочитаемости
+        text = await extract_text_from_url_async(url)
+        text = await asyncio.to_thread(summarize_text, text, 1500)
+        return f"\n\nContext from {url}:\n{text}"
+    except Exception as e:
+        return f"\n\n[Failed to retrieve context from {url}: {e}]"
+
+async def retrieve_context(message: str) -> str:
+    """Ищет релевантные фрагменты конфигурации через семантический поиск."""
+    if not OPENAI_API_KEY:
+        return ""
+    try:
+        if await is_vector_store_available():
+            context_chunks = await semantic_search(message, OPENAI_API_KEY, top_k=3)
+            if context_chunks:
+                return "\n\n".join(context_chunks)
+    except Exception as search_error:
+        print(f"Semantic search error: {search_error}")
+    return ""
+
+async def _timed_stage(
+    name: str,
+    awaitable: Awaitable[Any],
+    default: Any,
+    timings: Dict[str, Any],
+    deadline: Optional[float] = None
+) -> Any:
+    """
+    Выполняет этап подготовки с тайм-аутом и записывает его длительность.
+    Тайм-аут - меньшее из собственного лимита этапа и времени, оставшегося
+    до общего ``deadline`` (время цикла событий). При тайм-ауте или ошибке
+    возвращает ``default``.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    timeout = min(STAGE_TIMEOUTS.get(name, PRE_LLM_BUDGET), PRE_LLM_BUDGET)
+    if deadline is not None:
+        timeout = min(timeout, max(0.0, deadline - asyncio.get_running_loop().time()))
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        print(f"Stage {name} timed out")
+        return default
+    except Exception as e:
+        status = "error"
+        print(f"Stage {name} failed: {e}")
+        return default
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        if status != "ok":
+            timings[f"{name}_status"] = status
+
 async def process_message(
     message: str,
     chat_id: Optional[str] = None,
     is_group: bool = False,
     username: Optional[str] = None,
     reply_to_bot: bool = False,
+    on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> Union[str, List[str], None]:
     """
     Основная функция обработки сообщений от пользователя.
@@ -305,6 +441,8 @@ async def process_message(
         chat_id: ID чата
         is_group: Является ли чат групповым
         username: Имя пользователя
+        on_delta: Если задан, ответ Claude запрашивается потоком и каждый
+            фрагмент передается в этот колбэк по мере генерации
         
     Returns:
         Union[str, List[str], None]: Ответ Селесты или ``None`` если ответа нет
@@ -327,21 +465,6 @@ async def process_message(
         ):
             return None
 
-        language = None
-        try:
-            lang_code = detect(message) if message.strip() else ""
-            LANG_MAP = {
-                "ru": "Russian",
-                "en": "English",
-                "uk": "Ukrainian",
-                "de": "German",
-                "fr": "French",
-                "es": "Spanish",
-            }
-            language = LANG_MAP.get(lang_code, "English")
-        except LangDetectException:
-            language = None
-
         # Проверка на триггеры для создания изображения
         if any(trigger in message.lower() for trigger in TRIGGER_WORDS) or message.startswith("/draw"):
             # Очищаем запрос от триггера
@@ -359,43 +482,34 @@ async def process_message(
             image_url = await generate_image_async(prompt, chat_id)
             return f"🎨 {image_url}"
         
-        # Проверка на URL в сообщении
-        if "http://" in message or "https://" in message:
-            # Извлекаем URL из сообщения
-            words = message.split()
-            urls = [w for w in words if w.startswith("http://") or w.startswith("https://")]
-            if urls:
-                url = urls[0]
-                try:
-                    # Извлекаем текст со страницы
-                    text = await extract_text_from_url_async(url)
-                    # Суммаризируем текст для удобочитаемости
-                    text = summarize_text(text, 1500)
-                    # Добавляем контекст URL к исходному сообщению
-                    message += f"\n\nContext from {url}:\n{text}"
-                except Exception as e:
-                    message += f"\n\n[Failed to retrieve context from {url}: {e}]"
-        
-        # Создаем системный промпт с учетом контекста сообщения
-        system_prompt = build_system_prompt(
-            chat_id=chat_id,
-            is_group=is_group,
-            message_context=message,
-            language=language,
+        # Подготовка к вызову модели: независимые этапы выполняются параллельно,
+        # у каждого свой тайм-аут; медленный этап деградирует, а не суммируется.
+        # Общий срок PRE_LLM_BUDGET ограничивает и цепочки (язык -> промпт)
+        timings: Dict[str, Any] = {}
+        deadline = asyncio.get_running_loop().time() + PRE_LLM_BUDGET
+        language_task = asyncio.ensure_future(
+            _timed_stage("language", asyncio.to_thread(detect_language, message), None, timings, deadline)
         )
-        
-        # Получаем контекст из памяти
-        memory_context = get_memory_context(chat_id)
-        
-        # Определяем контекст из конфигурационных файлов через семантический поиск
-        context = ""
-        try:
-            if OPENAI_API_KEY and await is_vector_store_available():
-                context_chunks = await semantic_search(message, OPENAI_API_KEY, top_k=3)
-                if context_chunks:
-                    context = "\n\n".join(context_chunks)
-        except Exception as search_error:
-            print(f"Semantic search error: {search_error}")
+
+        async def prompt_stage():
+            language = await language_task
+            build_prompt = build_system_blocks if PROMPT_CACHING else build_system_prompt
+            return build_prompt(
+                chat_id=chat_id,
+                is_group=is_group,
+                message_context=message,
+                language=language,
+            )
+
+        url_context, system_prompt, memory_context, context = await asyncio.gather(
+            _timed_stage("url_context", fetch_url_context(message), "", timings, deadline),
+            _timed_stage("system_prompt", prompt_stage(), None, timings, deadline),
+            _timed_stage("memory", asyncio.to_thread(get_memory_context, chat_id), "", timings, deadline),
+            _timed_stage("retrieval", retrieve_context(message), "", timings, deadline),
+        )
+        if system_prompt is None:
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+        message += url_context
         
         # Формируем финальный промпт для модели с контекстом
         full_prompt = f"{message}\n\n"
@@ -412,11 +526,46 @@ async def process_message(
 
         # В реальном приложении здесь был бы вызов к OpenAI или другой модели
         # Для примера используем Claude как аварийный фоллбек
-        response = await claude_emergency(
-            full_prompt,
-            system_prompt=system_prompt,
-            notify_creator=chat_id==CREATOR_CHAT_ID
-        )
+        usage: Dict[str, int] = {}
+        cache_key = None
+        response = None
+        if response_cache.applies(LLM_TEMPERATURE):
+            # Память для ключа - без ответов на этот же вопрос, иначе каждый
+            # ответ менял бы ключ и повтор никогда не попадал бы в кэш
+            key_memory = await asyncio.to_thread(get_memory_context, chat_id, message)
+            cache_key = make_cache_key(system_prompt_fingerprint(system_prompt), key_memory, context, message)
+            response = response_cache.get(cache_key)
+            if response is not None and on_delta is not None:
+                await on_delta(response)
+        cache_hit = response is not None
+
+        if response is None:
+            llm_started = time.perf_counter()
+            async with dispatcher.llm_slot():
+                if on_delta is not None:
+                    response = ""
+                    async for delta in claude_stream(
+                        full_prompt,
+                        system_prompt=system_prompt,
+                        notify_creator=chat_id==CREATOR_CHAT_ID,
+                        temperature=LLM_TEMPERATURE,
+                        usage=usage
+                    ):
+                        response += delta
+                        await on_delta(delta)
+                else:
+                    response = await claude_emergency(
+                        full_prompt,
+                        system_prompt=system_prompt,
+                        notify_creator=chat_id==CREATOR_CHAT_ID,
+                        temperature=LLM_TEMPERATURE,
+                        usage=usage
+                    )
+            timings["llm"] = round((time.perf_counter() - llm_started) * 1000, 1)
+            # Служебные ответы об ошибках ("[Claude error: ...]") и ответы,
+            # оборванные на середине потока, не кэшируем
+            if cache_key is not None and response and not response.startswith("[") and not usage.get("incomplete"):
+                response_cache.put(cache_key, response)
 
         # Если ответ слишком длинный, разбиваем его на части
         if len(response) > MAX_RESPONSE_LENGTH:
@@ -424,8 +573,11 @@ async def process_message(
         else:
             response_parts = [response]
         
-        # Обновляем память (используем полный ответ для контекста)
-        update_memory(chat_id, message, response)
+        # Обновляем память (используем полный ответ для контекста). Запись в
+        # SQLite идет в потоке, чтобы не останавливать цикл событий. Обрезанный
+        # ответ в память не попадает, чтобы модель не продолжала его как свой
+        if not usage.get("incomplete"):
+            await asyncio.to_thread(update_memory, chat_id, message, response)
         
         # Логируем взаимодействие
         log_event({
@@ -435,7 +587,13 @@ async def process_message(
             "is_group": is_group,
             "message_length": len(message),
             "response_length": len(response),
-            "parts": len(response_parts)
+            "parts": len(response_parts),
+            "input_tokens": usage.get("input_tokens", 0),
+            "cache_read_tokens": usage.get("cache_read_input_tokens", 0),
+            "cache_write_tokens": usage.get("cache_creation_input_tokens", 0),
+            "response_cache_hit": cache_hit,
+            "incomplete": bool(usage.get("incomplete")),
+            "stage_ms": timings
         })
         
         # Возвращаем одно сообщение или список сообщений
@@ -522,6 +680,8 @@ async def periodic_checks_loop() -> None:
     while True:
         background = BackgroundTasks()
         await auto_reload_core(background)
+        # Убираем истории чатов, неактивных дольше TTL
+        await asyncio.get_running_loop().run_in_executor(None, conversation_memory.prune_expired)
         await asyncio.sleep(CHECK_INTERVAL)
 
 # Роуты
@@ -531,12 +691,32 @@ async def startup_event():
     global core_config, last_check, last_wilderness
 
     print(f"Starting {AGENT_NAME} Assistant v{VERSION}...")
+    # Открываем общие пулы HTTP-соединений до первых исходящих запросов
+    await http_client.startup()
+    # Журнал пишется фоновой задачей, обработчики запросов не ждут диска
+    start_writer()
+    # Восстанавливаем отложенные доставки, сохраненные до перезапуска
+    delivery_scheduler.start()
+    if response_cache.enabled and LLM_TEMPERATURE > 0 and not response_cache.allow_sampled:
+        print(f"Response cache is enabled but inactive: it needs LLM_TEMPERATURE=0 (now {LLM_TEMPERATURE})")
     core_config = await initialize_config()
     last_check = time.time()
     last_wilderness = time.time()
+    # База векторов открывается здесь, а не при импорте модуля
+    await asyncio.to_thread(open_vector_store)
     # Запускаем векторизацию в фоне, чтобы не блокировать запуск
     asyncio.create_task(startup_vectorization())
     asyncio.create_task(periodic_checks_loop())
+    asyncio.create_task(startup_journal_import())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Освобождение ресурсов при остановке сервера."""
+    await delivery_scheduler.stop()
+    await dispatcher.shutdown()
+    await stop_writer()
+    close_vector_store()
+    await http_client.shutdown()
 
 @app.get("/")
 async def root():
@@ -608,44 +788,53 @@ async def process_and_send_response(
         ):
             return
 
-        if is_group:
-            await asyncio.sleep(
-                GROUP_DELAY_RANGE[0]
-                if GROUP_DELAY_RANGE[0] == GROUP_DELAY_RANGE[1]
-                else random.uniform(*GROUP_DELAY_RANGE)
+        # Индикатор набора обновляется, пока ответ готовится и отправляется
+        async with typing_indicator(chat_id):
+            # В голосовом режиме нужен весь текст сразу, поэтому без потока
+            stream_sink = None
+            if STREAM_RESPONSES and not voice_mode.get(chat_id):
+                stream_sink = TelegramStreamSink(chat_id, reply_to_message_id)
+
+            response = await process_message(
+                message,
+                chat_id,
+                is_group,
+                username,
+                reply_to_bot=reply_to_bot,
+                on_delta=stream_sink.feed if stream_sink else None,
             )
 
-        await send_typing(chat_id)
-        response = await process_message(
-            message,
-            chat_id,
-            is_group,
-            username,
-            reply_to_bot=reply_to_bot,
-        )
+            if response is None:
+                return
 
-        if response is None:
-            return
+            streamed = False
+            if stream_sink is not None:
+                # Закрываем поток всегда: close дожидается отправки, которая
+                # еще идет (короткий ответ, попадание в кэш), и досылает хвост
+                sent = await stream_sink.close()
+                streamed = stream_sink.started
 
-        if voice_mode.get(chat_id) and message.strip().lower() not in ["/voiceon", "/voiceoff"]:
-            text_resp = response if not isinstance(response, list) else "\n\n".join(response)
-            voice_file = os.path.join(UPLOADS_DIR, f"reply_{int(time.time())}.mp3")
-            await text_to_speech(text_resp, voice_file)
-            sent = await send_audio_message(
-                chat_id,
-                voice_file,
-                caption=text_resp,
-                reply_to_message_id=reply_to_message_id,
-            )
-            try:
-                os.remove(voice_file)
-            except Exception:
-                pass
-        else:
-            if isinstance(response, list):
-                sent = await send_multipart_message(chat_id, response, reply_to_message_id=reply_to_message_id)
+            if streamed:
+                pass  # Ответ уже доставлен по мере генерации
+            elif voice_mode.get(chat_id) and message.strip().lower() not in ["/voiceon", "/voiceoff"]:
+                text_resp = response if not isinstance(response, list) else "\n\n".join(response)
+                voice_file = os.path.join(UPLOADS_DIR, f"reply_{int(time.time())}.mp3")
+                await text_to_speech(text_resp, voice_file)
+                sent = await send_audio_message(
+                    chat_id,
+                    voice_file,
+                    caption=text_resp,
+                    reply_to_message_id=reply_to_message_id,
+                )
+                try:
+                    os.remove(voice_file)
+                except Exception:
+                    pass
             else:
-                sent = await send_message(chat_id, response, reply_to_message_id)
+                if isinstance(response, list):
+                    sent = await send_response_parts(chat_id, response, reply_to_message_id)
+                else:
+                    sent = await send_message(chat_id, response, reply_to_message_id)
 
         if not sent:
             log_event({"type": "send_error", "chat_id": chat_id, "message": "delivery failed"})
@@ -653,6 +842,104 @@ async def process_and_send_response(
         print(f"Error in process_and_send_response: {e}")
         log_event({"type": "send_error", "error": str(e), "chat_id": chat_id})
 
+def _random_delay(delay_range: Tuple[float, float]) -> float:
+    """Случайная задержка из диапазона (или фиксированная, если границы равны)."""
+    if delay_range[0] == delay_range[1]:
+        return delay_range[0]
+    return random.uniform(*delay_range)
+
+async def send_response_parts(
+    chat_id: str,
+    parts: List[str],
+    reply_to_message_id: Optional[int] = None,
+) -> bool:
+    """
+    Отправляет первую часть ответа сразу, остальные - через планировщик
+    с паузами MULTIPART_DELAY_RANGE, не удерживая корутину между частями.
+    Пока последняя часть не отправлена, очередь чата придержана, и
+    следующий ответ не вклинится между частями.
+    
+    Returns:
+        bool: Доставлена ли первая часть
+    """
+    sent = await send_message(chat_id, parts[0], reply_to_message_id)
+    batch = time.time_ns()
+    delay = 0.0
+    for index, part in enumerate(parts[1:], 1):
+        delay += _random_delay(MULTIPART_DELAY_RANGE)
+        delivery_scheduler.schedule(
+            "message_part",
+            f"part:{chat_id}:{batch}:{index}",
+            delay,
+            {"chat_id": chat_id, "text": part, "last": index == len(parts) - 1},
+        )
+    if len(parts) > 1:
+        dispatcher.hold(chat_id, delay + MULTIPART_HOLD_MARGIN)
+    return sent
+
+async def deliver_part(payload: Dict[str, Any]) -> None:
+    """Отправляет отложенную часть ответа; после последней отпускает очередь чата."""
+    try:
+        if not await send_message(payload["chat_id"], payload["text"]):
+            log_event({"type": "send_error", "chat_id": payload["chat_id"], "message": "part delivery failed"})
+    finally:
+        if payload.get("last"):
+            dispatcher.release(payload["chat_id"])
+
+async def reply_to_group(payload: Dict[str, Any]) -> None:
+    """
+    Отвечает на отложенные сообщения группы. Несколько сообщений,
+    пришедших за время задержки, склеиваются в один запрос.
+    """
+    messages = payload["messages"]
+    if len(messages) == 1:
+        message, username, reply_to_bot, message_id = messages[0]
+    else:
+        message = "\n".join(f"@{user}: {text}" if user else text for text, user, _, _ in messages)
+        _, username, _, message_id = messages[-1]
+        # Каждое из сообщений уже прошло should_reply_in_group
+        reply_to_bot = True
+    await process_and_send_response(message, payload["chat_id"], True, username, reply_to_bot, message_id)
+
+def _merge_group_messages(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    return {**old, "messages": (old["messages"] + new["messages"])[-GROUP_COALESCE_MAX:]}
+
+def _dispatch_delivery(
+    job: Callable[[Dict[str, Any]], Awaitable[None]],
+    urgent: bool = False
+) -> Callable[[Dict[str, Any]], Optional["asyncio.Future[None]"]]:
+    """
+    Сработавшая доставка встает в очередь своего чата, чтобы не обгонять другие ответы.
+    Возвращаемый future завершается вместе с задачей, и только тогда
+    планировщик удаляет сохраненную доставку. Срочные доставки (части
+    уже начатого ответа) идут перед обычными задачами чата.
+    """
+    def handler(payload: Dict[str, Any]) -> Optional["asyncio.Future[None]"]:
+        chat_id = payload["chat_id"]
+        done = asyncio.get_running_loop().create_future()
+
+        async def run() -> None:
+            try:
+                await job(payload)
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception as e:
+                done.set_exception(e)
+                raise
+            else:
+                done.set_result(None)
+
+        result = dispatcher.submit(chat_id, run, urgent=urgent)
+        if result != ACCEPTED:
+            log_event({"type": "dispatch_shed", "chat_id": chat_id, "reason": result})
+            return None
+        return done
+    return handler
+
+delivery_scheduler.register("group_reply", _dispatch_delivery(reply_to_group))
+delivery_scheduler.register("message_part", _dispatch_delivery(deliver_part, urgent=True))
+
 @app.post("/webhook")
 async def webhook(
     request: Request,
@@ -673,6 +960,11 @@ async def webhook(
         data = await request.json()
         print("Received webhook data")
         
+        # Повторная доставка того же обновления - до любой работы
+        update_id = data.get("update_id")
+        if update_id is not None and not await update_dedupe.aclaim(update_id):
+            return {"status": "duplicate", "update_id": update_id}
+        
         # Проверяем, это ли Telegram
         if "message" in data:
             chat = data["message"].get("chat", {})
@@ -697,19 +989,46 @@ async def webhook(
                 if orig.get("is_bot") and (not BOT_USERNAME or orig.get("username", "").lower() == BOT_USERNAME):
                     reply_to_bot = True
 
-            background_tasks.add_task(
-                process_and_send_response,
-                message,
+            # Ответ в группе откладывается; поводы за время задержки дают один ответ
+            if is_group:
+                if not should_reply_in_group(message, reply_to_bot, username=username, chat_id=chat_id):
+                    return {"status": "accepted", "chat_id": chat_id}
+                delivery_scheduler.schedule(
+                    "group_reply",
+                    f"group:{chat_id}",
+                    _random_delay(GROUP_DELAY_RANGE),
+                    {"chat_id": chat_id, "messages": [[message, username, reply_to_bot, message_id]]},
+                    merge=_merge_group_messages,
+                )
+                return {"status": "scheduled", "chat_id": chat_id}
+
+            # Очередь чата сохраняет порядок ответов; при переполнении задача отклоняется
+            result = dispatcher.submit(
                 chat_id,
-                is_group,
-                username,
-                reply_to_bot,
-                message_id,
+                functools.partial(
+                    process_and_send_response,
+                    message,
+                    chat_id,
+                    is_group,
+                    username,
+                    reply_to_bot,
+                    message_id,
+                ),
             )
+            if result != ACCEPTED:
+                log_event({"type": "dispatch_shed", "chat_id": chat_id, "reason": result})
+                if result == OVERLOADED:
+                    # 503 - Telegram повторит доставку обновления позже, повтор не должен отсекаться
+                    if update_id is not None:
+                        await update_dedupe.arelease(update_id)
+                    raise HTTPException(status_code=503, detail="Server is overloaded")
+                return {"status": "shed", "chat_id": chat_id, "reason": result}
             return {"status": "accepted", "chat_id": chat_id}
         
         # Для других источников
         return {"status": "received"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error handling webhook: {e}")
         log_event({"type": "webhook_error", "error": str(e)})
@@ -825,11 +1144,11 @@ async def status() -> MessageResponse:
     global core_config, last_check, last_wilderness
     
     # Проверяем доступность векторного хранилища
-    vector_store_status = "checking..."
+    store_availability = "checking..."
     try:
-        vector_store_status = "available" if await is_vector_store_available() else "unavailable"
+        store_availability = "available" if await is_vector_store_available() else "unavailable"
     except Exception:
-        vector_store_status = "error"
+        store_availability = "error"
     
     return {
         "status": "operational",
@@ -840,11 +1159,92 @@ async def status() -> MessageResponse:
         "next_wilderness": (datetime.fromtimestamp(last_wilderness) + 
                            timedelta(hours=WILDERNESS_INTERVAL)).isoformat(),
         "config_version": core_config.get("version") if core_config else "unknown",
-        "memory_chats": len(memory_cache),
-        "vector_store": vector_store_status,
+        "memory_chats": len(conversation_memory),
+        "memory": conversation_memory.stats(),
+        "vector_store": store_availability,
+        "vector_store_state": await vector_store_status(),
+        "journal": writer_stats(),
+        "dispatcher": dispatcher.stats(),
+        "deliveries": delivery_scheduler.stats(),
+        "telegram": delivery_stats(),
+        "response_cache": response_cache.stats(),
+        "update_dedupe": update_dedupe.stats(),
+        "claude_usage": usage_stats(),
         "openai_api": "configured" if OPENAI_API_KEY else "not configured"
     }
 
+@app.get("/journal")
+async def journal_events(
+    type: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    last_seconds: Optional[int] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Постраничная выборка событий журнала по индексу (от новых к старым).
+    
+    Args:
+        type: Тип события (например, send_error)
+        chat_id: ID чата
+        since: Нижняя граница времени (ISO или unix)
+        until: Верхняя граница времени (ISO или unix)
+        last_seconds: Только события за последние N секунд
+        limit: Размер страницы
+        cursor: Курсор из next_cursor предыдущей страницы
+        
+    Returns:
+        Dict[str, Any]: События и курсор следующей страницы
+    """
+    if last_seconds is not None:
+        since = str(int(time.time()) - last_seconds)
+    query = functools.partial(
+        journal_store.query_events,
+        event_type=type,
+        chat_id=chat_id,
+        since=since,
+        until=until,
+        limit=limit,
+        cursor=cursor,
+    )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/journal/counts")
+async def journal_counts(
+    group_by: str = "chat_id",
+    type: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    last_seconds: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Количество событий журнала с группировкой по chat_id или type.
+    
+    Returns:
+        Dict[str, Any]: Поле группировки и счетчики
+    """
+    if last_seconds is not None:
+        since = str(int(time.time()) - last_seconds)
+    query = functools.partial(
+        journal_store.count_events,
+        group_by=group_by,
+        event_type=type,
+        chat_id=chat_id,
+        since=since,
+        until=until,
+    )
+    try:
+        counts = await asyncio.get_running_loop().run_in_executor(None, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "counts": counts}
+
 @app.get("/wilderness")
 async def trigger_wilderness(
     background_tasks: BackgroundTasks
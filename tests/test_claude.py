@@ -1,4 +1,5 @@
 from pathlib import Path
+import json
 import sys
 
 import pytest
@@ -24,3 +25,103 @@ def test_api_key_configuration():
     """Verify that API key configuration is present."""
     # Just check the constant exists, don't check the actual value
     assert hasattr(claude, "ANTHROPIC_API_KEY")
+
+
+def test_claude_stream_yields_text_deltas(monkeypatch):
+    """SSE-поток разбирается в текстовые фрагменты."""
+    import asyncio
+    import httpx
+
+    events = [
+        'event: message_start\ndata: {"type": "message_start", "message": {}}\n\n',
+        'event: content_block_delta\ndata: {"type": "content_block_delta", "index": 0, '
+        '"delta": {"type": "text_delta", "text": "Hel"}}\n\n',
+        'event: ping\ndata: {"type": "ping"}\n\n',
+        'event: content_block_delta\ndata: {"type": "content_block_delta", "index": 0, '
+        '"delta": {"type": "text_delta", "text": "lo"}}\n\n',
+        'event: message_stop\ndata: {"type": "message_stop"}\n\n',
+    ]
+
+    def handler(request):
+        return httpx.Response(200, text="".join(events), headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(claude, "ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(claude, "get_client", lambda name: client)
+
+    async def collect():
+        return [delta async for delta in claude.claude_stream("hi")]
+
+    assert asyncio.run(collect()) == ["Hel", "lo"]
+
+
+def test_claude_stream_reports_cache_usage(monkeypatch):
+    """Usage из message_start/message_delta попадает в словарь вызывающего и в счетчики."""
+    import asyncio
+    import httpx
+
+    events = [
+        'data: {"type": "message_start", "message": {"usage": {"input_tokens": 12, '
+        '"cache_creation_input_tokens": 0, "cache_read_input_tokens": 1500, "output_tokens": 1}}}\n\n',
+        'data: {"type": "content_block_delta", "index": 0, '
+        '"delta": {"type": "text_delta", "text": "ok"}}\n\n',
+        'data: {"type": "message_delta", "delta": {}, "usage": {"output_tokens": 7}}\n\n',
+        'data: {"type": "message_stop"}\n\n',
+    ]
+    seen = {}
+
+    def handler(request):
+        seen["system"] = json.loads(request.content)["system"]
+        return httpx.Response(200, text="".join(events), headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(claude, "ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(claude, "get_client", lambda name: client)
+    before = claude.usage_stats()
+
+    system = [{"type": "text", "text": "persona", "cache_control": {"type": "ephemeral"}}]
+    usage = {}
+
+    async def collect():
+        return [delta async for delta in claude.claude_stream("hi", system_prompt=system, usage=usage)]
+
+    assert asyncio.run(collect()) == ["ok"]
+    assert seen["system"] == system
+    assert usage["cache_read_input_tokens"] == 1500
+    assert usage["output_tokens"] == 7
+    after = claude.usage_stats()
+    assert after["requests"] == before["requests"] + 1
+    assert after["cache_read_input_tokens"] == before["cache_read_input_tokens"] + 1500
+    assert 0 < after["cache_read_ratio"] <= 1
+
+
+def test_claude_stream_marks_truncated_answer(monkeypatch):
+    """Оборванный после первых фрагментов поток помечается в usage как неполный."""
+    import asyncio
+    import httpx
+
+    events = [
+        'data: {"type": "content_block_delta", "index": 0, '
+        '"delta": {"type": "text_delta", "text": "Half"}}\n\n',
+        'data: {"type": "error", "error": {"message": "overloaded"}}\n\n',
+    ]
+
+    def handler(request):
+        return httpx.Response(200, text="".join(events), headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(claude, "ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(claude, "get_client", lambda name: client)
+
+    async def collect(usage):
+        return [delta async for delta in claude.claude_stream("hi", usage=usage)]
+
+    usage = {}
+    assert asyncio.run(collect(usage)) == ["Half"]
+    assert usage.get("incomplete")
+
+    # Поток без message_stop тоже неполный
+    events[1:] = []
+    usage = {}
+    assert asyncio.run(collect(usage)) == ["Half"]
+    assert usage.get("incomplete")
@@ -0,0 +1,44 @@
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import conversation_memory
+from utils.conversation_memory import ConversationMemory
+
+
+def test_lru_eviction_reloads_from_sqlite(tmp_path):
+    """Вытесненный чат подгружается с диска, счетчики отражают попадания и вытеснения."""
+    memory = ConversationMemory(db_path=str(tmp_path / "memory.db"), max_chats=2)
+    memory.append("a", "hi a", "hello a")
+    memory.append("b", "hi b", "hello b")
+    memory.get_history("a")
+    memory.append("c", "hi c", "hello c")  # вытесняет "b" - давно не использованный
+
+    assert len(memory) == 2
+    assert memory.stats()["evictions"] == 1
+    assert [m for _, m, _ in memory.get_history("b")] == ["hi b"]
+    assert memory.stats()["db_loads"] == 1
+    assert memory.stats()["hit_rate"] > 0
+    memory.close()
+
+
+def test_history_survives_restart_and_expires(tmp_path, monkeypatch):
+    """История переживает новый экземпляр, а устаревшая удаляется по TTL."""
+    db_path = str(tmp_path / "memory.db")
+    memory = ConversationMemory(db_path=db_path, ttl=60, max_history=2)
+    for i in range(3):
+        memory.append("chat", f"m{i}", f"r{i}")
+    memory.close()
+
+    restarted = ConversationMemory(db_path=db_path, ttl=60, max_history=2)
+    assert [(m, r) for _, m, r in restarted.get_history("chat")] == [("m1", "r1"), ("m2", "r2")]
+
+    now = conversation_memory.time.time()
+    monkeypatch.setattr(conversation_memory.time, "time", lambda: now + 120)
+    assert restarted.get_history("chat") == []
+    assert restarted.prune_expired() == 0
+    assert restarted.stats()["expired"] >= 1
+    restarted.close()
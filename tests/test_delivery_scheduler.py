@@ -0,0 +1,137 @@
+from pathlib import Path
+import asyncio
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.delivery_scheduler import DeliveryScheduler
+
+
+def _merge(old, new):
+    return {**old, "messages": old["messages"] + new["messages"]}
+
+
+def test_coalesce_and_fire_in_due_order():
+    """Доставки с одним ключом склеиваются, срабатывают по возрастанию срока."""
+    scheduler = DeliveryScheduler()
+    fired = []
+    scheduler.register("reply", fired.append)
+
+    assert scheduler.schedule("reply", "group:1", 20, {"chat": 1, "messages": ["a"]}, merge=_merge)
+    assert not scheduler.schedule("reply", "group:1", 5, {"chat": 1, "messages": ["b"]}, merge=_merge)
+    assert scheduler.schedule("reply", "group:2", 10, {"chat": 2, "messages": ["c"]}, merge=_merge)
+    scheduler.schedule("reply", "group:3", 1, {"chat": 3, "messages": []})
+    assert scheduler.cancel("group:3")
+
+    assert scheduler.run_due(time.time() + 5) == 0
+    assert scheduler.run_due(time.time() + 60) == 2
+    assert fired == [{"chat": 2, "messages": ["c"]}, {"chat": 1, "messages": ["a", "b"]}]
+    assert scheduler.stats()["coalesced"] == 1 and len(scheduler) == 0
+
+
+def test_pending_deliveries_survive_restart(tmp_path):
+    """Ожидающие доставки восстанавливаются из SQLite и срабатывают фоновой задачей."""
+    db_path = str(tmp_path / "deliveries.db")
+    first = DeliveryScheduler(db_path)
+    first.schedule("part", "part:1", 0.05, {"text": "later"})
+    first.schedule("part", "part:2", 3600, {"text": "much later"})
+    asyncio.run(first.stop())
+
+    fired = []
+    second = DeliveryScheduler(db_path)
+    second.register("part", fired.append)
+
+    async def scenario():
+        second.start()
+        await asyncio.sleep(0.2)
+        await second.stop()
+
+    asyncio.run(scenario())
+    assert fired == [{"text": "later"}]
+    assert second.stats()["restored"] == 2
+    assert len(second) == 1
+
+
+def test_row_is_kept_until_delivery_finishes(tmp_path):
+    """Запись удаляется только после завершения доставки; прерванная повторяется."""
+    db_path = str(tmp_path / "deliveries.db")
+
+    def saved_keys():
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        try:
+            return [row[0] for row in conn.execute("SELECT key FROM deliveries ORDER BY key")]
+        finally:
+            conn.close()
+
+    async def scenario():
+        scheduler = DeliveryScheduler(db_path)
+        release = asyncio.Event()
+
+        async def deliver(payload):
+            await release.wait()
+
+        scheduler.register("part", lambda payload: asyncio.ensure_future(deliver(payload)))
+        scheduler.schedule("part", "part:1", 0, {"text": "now"})
+        scheduler.schedule("part", "part:2", 0, {"text": "stuck"})
+        assert scheduler.run_due() == 2
+        await scheduler.flush()
+        assert saved_keys() == ["part:1", "part:2"]  # Обработчик вернулся, доставка еще идет
+        assert scheduler.stats()["in_flight"] == 2
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await scheduler.flush()
+        assert saved_keys() == []
+
+        # Доставка, не завершенная к остановке, остается в базе
+        never = asyncio.Event()
+        scheduler.register("part", lambda payload: asyncio.ensure_future(never.wait()))
+        scheduler.schedule("part", "part:3", 0, {"text": "lost"})
+        scheduler.run_due()
+        await scheduler.stop(timeout=0.01)
+        assert saved_keys() == ["part:3"]
+
+    asyncio.run(scenario())
+
+
+def test_restore_skips_unreadable_rows(tmp_path):
+    """Поврежденная строка в базе пропускается, остальные доставки восстанавливаются."""
+    import sqlite3
+
+    db_path = str(tmp_path / "deliveries.db")
+    first = DeliveryScheduler(db_path)
+    first.schedule("part", "part:1", 3600, {"text": "ok"})
+    asyncio.run(first.stop())
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO deliveries (key, kind, due, payload) VALUES ('bad', 'part', 0, '{not json')")
+    conn.commit()
+    conn.close()
+
+    second = DeliveryScheduler(db_path)
+    assert second._restore() == 1
+    assert second.stats()["skipped_rows"] == 1
+    assert len(second) == 1
+
+
+def test_schedule_does_not_write_on_the_loop(tmp_path, monkeypatch):
+    """schedule() не ждет SQLite: запись идет в потоке записи."""
+    import threading
+
+    scheduler = DeliveryScheduler(str(tmp_path / "deliveries.db"))
+    writers = []
+    write = scheduler._write_delivery
+    monkeypatch.setattr(scheduler, "_write_delivery", lambda *args: (writers.append(threading.current_thread()), write(*args)))
+
+    async def scenario():
+        scheduler.schedule("part", "part:1", 3600, {"text": "later"})
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert writers and writers[0] is not threading.main_thread()
+    restored = DeliveryScheduler(str(tmp_path / "deliveries.db"))
+    assert len(restored._load_rows()) == 1
+    restored._close_db()
@@ -0,0 +1,103 @@
+from pathlib import Path
+import asyncio
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.dispatcher import ChatDispatcher, ACCEPTED, CHAT_QUEUE_FULL, OVERLOADED
+
+
+def test_chat_order_and_llm_concurrency_cap():
+    """Задачи чата выполняются по порядку, вызовов LLM одновременно не больше лимита."""
+    dispatcher = ChatDispatcher(max_concurrency=2)
+    done = []
+    in_flight = {"now": 0, "max": 0}
+
+    def job(chat_id, n):
+        async def run():
+            async with dispatcher.llm_slot():
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+                await asyncio.sleep(0.01)
+                in_flight["now"] -= 1
+            done.append((chat_id, n))
+        return run
+
+    async def scenario():
+        for n in range(3):
+            for chat_id in ("a", "b", "c"):
+                assert dispatcher.submit(chat_id, job(chat_id, n)) == ACCEPTED
+        await dispatcher.shutdown(timeout=5)
+
+    asyncio.run(scenario())
+
+    assert in_flight["max"] == 2
+    for chat_id in ("a", "b", "c"):
+        assert [n for cid, n in done if cid == chat_id] == [0, 1, 2]
+    stats = dispatcher.stats()
+    assert stats["completed"] == 9 and stats["pending"] == 0
+    assert stats["queue_wait"]["count"] == 9
+
+
+def test_overflow_is_shed():
+    """Переполненная очередь чата и общий лимит отклоняют новые задачи."""
+    dispatcher = ChatDispatcher(max_queue_per_chat=1, max_pending=2)
+
+    async def noop():
+        pass
+
+    async def scenario():
+        results = [dispatcher.submit("a", noop), dispatcher.submit("a", noop),
+                   dispatcher.submit("b", noop), dispatcher.submit("c", noop)]
+        await dispatcher.shutdown(timeout=5)
+        return results
+
+    assert asyncio.run(scenario()) == [ACCEPTED, CHAT_QUEUE_FULL, ACCEPTED, OVERLOADED]
+    stats = dispatcher.stats()
+    assert stats["shed_chat_full"] == 1 and stats["shed_overloaded"] == 1
+
+
+def test_held_chat_runs_only_urgent_jobs():
+    """Придержанный чат выполняет срочные задачи по порядку, обычные ждут release."""
+    dispatcher = ChatDispatcher()
+    done = []
+
+    def job(name):
+        async def run():
+            done.append(name)
+        return run
+
+    async def scenario():
+        dispatcher.hold("a", timeout=5)
+        dispatcher.submit("a", job("next reply"))
+        dispatcher.submit("a", job("part 2"), urgent=True)
+        dispatcher.submit("a", job("part 3"), urgent=True)
+        dispatcher.submit("b", job("other chat"))
+        await asyncio.sleep(0.01)
+        assert done == ["part 2", "part 3", "other chat"]
+        assert dispatcher.stats()["held_chats"] == 1
+        dispatcher.release("a")
+        await dispatcher.shutdown(timeout=5)
+
+    asyncio.run(scenario())
+    assert done[-1] == "next reply"
+    assert dispatcher.stats()["pending"] == 0
+
+
+def test_hold_expires():
+    """Удержание снимается само по тайм-ауту, если release не пришел."""
+    dispatcher = ChatDispatcher()
+    done = []
+
+    async def noop():
+        done.append(1)
+
+    async def scenario():
+        dispatcher.hold("a", timeout=0.02)
+        dispatcher.submit("a", noop)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+    assert done == [1]
@@ -0,0 +1,69 @@
+from pathlib import Path
+import asyncio
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import http_client
+
+
+def test_client_is_shared_within_loop():
+    """Повторные вызовы в одном цикле возвращают тот же пул."""
+
+    async def scenario():
+        await http_client.startup()
+        first = http_client.get_client("telegram")
+        second = http_client.get_client("telegram")
+        other = http_client.get_client("openai")
+        await http_client.shutdown()
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert first is second
+    assert first is not other
+    assert first.is_closed
+
+
+def test_new_loop_gets_fresh_client():
+    """Клиент, привязанный к завершенному циклу, не переиспользуется."""
+
+    async def grab():
+        return http_client.get_client("web")
+
+    first = asyncio.run(grab())
+    second = asyncio.run(grab())
+    assert first is not second
+    http_client._clients.clear()
+
+
+def test_replaced_client_is_closed():
+    """Клиент прежнего цикла закрывается при замене, а не бросается с открытым пулом."""
+
+    async def grab():
+        return http_client.get_client("web")
+
+    first = asyncio.run(grab())
+
+    async def replace():
+        second = http_client.get_client("web")
+        await http_client.shutdown()
+        return second
+
+    second = asyncio.run(replace())
+    assert first is not second
+    assert first.is_closed and second.is_closed
+    assert not http_client._retired and not http_client._closing
+
+
+def test_shutdown_closes_clients_of_other_loops():
+    """shutdown закрывает и клиенты, созданные в другом (уже завершенном) цикле."""
+
+    async def grab():
+        return http_client.get_client("openai")
+
+    stale = asyncio.run(grab())
+    asyncio.run(http_client.shutdown())
+    assert stale.is_closed
+    assert not http_client._clients and not http_client._closing
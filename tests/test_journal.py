@@ -0,0 +1,202 @@
+from pathlib import Path
+import gzip
+import json
+import sys
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import journal, journal_store
+
+
+@pytest.fixture
+def temp_journal(tmp_path, monkeypatch):
+    """Перенаправляет журнал во временную директорию."""
+    monkeypatch.setattr(journal, "LOG_PATH", str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(journal, "LEGACY_LOG_PATH", str(tmp_path / "journal.json"))
+    monkeypatch.setattr(journal, "ARCHIVE_PATH", str(tmp_path / "archives"))
+    monkeypatch.setattr(journal, "FSYNC_POLICY", "never")
+    monkeypatch.setattr(journal, "_legacy_checked", False)
+    monkeypatch.setattr(journal_store, "JOURNAL_DB_PATH", str(tmp_path / "journal.db"))
+    monkeypatch.setattr(journal_store, "_conn", None)
+    return tmp_path
+
+
+def test_log_event_appends_lines(temp_journal):
+    """Каждое событие - отдельная строка, read_journal отдает хвост по порядку."""
+    for i in range(5):
+        assert journal.log_event({"type": "interaction", "n": i})
+
+    lines = (temp_journal / "journal.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 5
+    assert [e["n"] for e in journal.read_journal(3)] == [2, 3, 4]
+    assert [e["n"] for e in journal.read_journal(0)] == [0, 1, 2, 3, 4]
+
+
+def test_tail_reader_crosses_blocks(temp_journal, monkeypatch):
+    """Чтение с конца корректно склеивает строки на границах блоков."""
+    monkeypatch.setattr(journal, "TAIL_BLOCK_SIZE", 16)
+    for i in range(20):
+        journal.log_event({"type": "t", "payload": "x" * (i % 7), "n": i})
+
+    assert [e["n"] for e in journal.read_journal(0)] == list(range(20))
+
+
+def test_rotation_compresses_into_archives(temp_journal, monkeypatch):
+    """При превышении размера журнал уходит в сжатый архив."""
+    monkeypatch.setattr(journal, "MAX_LOG_BYTES", 200)
+    for i in range(10):
+        journal.log_event({"type": "t", "n": i})
+
+    archives = list((temp_journal / "archives").glob("*.jsonl.gz"))
+    assert archives
+    archived = []
+    for path in archives:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            archived.extend(json.loads(line)["n"] for line in f)
+    current = [e["n"] for e in journal.read_journal(0)]
+    assert sorted(archived + current) == list(range(10))
+
+
+def test_failed_rotation_is_retried(temp_journal, monkeypatch):
+    """Журнал, который не удалось сжать, не затирается и сжимается при следующей ротации."""
+    monkeypatch.setattr(journal, "MAX_LOG_BYTES", 200)
+    real_open = journal.gzip.open
+    failures = []
+
+    def flaky_open(*args, **kwargs):
+        if not failures:
+            failures.append(args[0])
+            raise OSError("disk full")
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(journal.gzip, "open", flaky_open)
+    for i in range(20):
+        journal.log_event({"type": "t", "n": i})
+
+    assert failures
+    assert not list(temp_journal.glob("*.rotating"))
+    archived = []
+    for path in (temp_journal / "archives").glob("*.jsonl.gz"):
+        with real_open(path, "rt", encoding="utf-8") as f:
+            archived.extend(json.loads(line)["n"] for line in f)
+    current = [e["n"] for e in journal.read_journal(0)]
+    assert sorted(archived + current) == list(range(20))
+
+
+def test_filter_logs_by_type_and_time(temp_journal):
+    """filter_logs учитывает тип события и нижнюю границу времени."""
+    journal.write_entries([
+        {"ts": "2025-01-01T00:00:00", "type": "send_error", "n": 0},
+        {"ts": "2025-01-02T00:00:00", "type": "interaction", "n": 1},
+        {"ts": "2025-01-03T00:00:00", "type": "send_error", "n": 2},
+    ])
+
+    result = journal.filter_logs("send_error", start_time="2025-01-01T12:00:00")
+    assert [e["n"] for e in result] == [2]
+
+
+def test_legacy_journal_is_imported_once(temp_journal):
+    """Записи старого journal.json переносятся в JSONL."""
+    legacy = temp_journal / "journal.json"
+    legacy.write_text(json.dumps([{"ts": "2025-01-01T00:00:00", "type": "init"}]), encoding="utf-8")
+
+    journal.log_event({"type": "interaction"})
+
+    assert [e["type"] for e in journal.read_journal(0)] == ["init", "interaction"]
+    assert not legacy.exists()
+
+
+def test_writer_batches_and_drains_on_stop(temp_journal):
+    """Фоновый писатель принимает события без записи и дописывает всё при остановке."""
+    import asyncio
+
+    async def scenario():
+        writer = journal.start_writer()
+        writer.flush_interval = 60  # только остановка вызывает запись
+        for i in range(5):
+            assert journal.log_event({"type": "interaction", "n": i})
+        assert journal.writer_stats()["queue_depth"] > 0
+        await journal.stop_writer()
+        return writer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["written"] == 5
+    assert stats["dropped"] == 0
+    assert [e["n"] for e in journal.read_journal(0)] == list(range(5))
+
+
+def test_writer_counts_drops_when_full(temp_journal):
+    """Переполненная очередь отбрасывает события и считает их."""
+    import asyncio
+
+    async def scenario():
+        writer = journal.JournalWriter(max_queue=2)
+        writer.start()
+        results = [writer.submit(journal.make_entry({"n": i})) for i in range(4)]
+        await writer.stop()
+        return results, writer.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [True, True, False, False]
+    assert stats["dropped"] == 2
+    assert stats["written"] == 2
+
+
+def test_store_query_filters_and_paginates(temp_journal):
+    """Индекс фильтрует по типу, чату и времени и отдает страницы по курсору."""
+    journal.write_entries([
+        {"ts": f"2025-01-01T00:00:{i:02d}", "unix_time": 1000 + i, "type": t, "chat_id": c, "n": i}
+        for i, (t, c) in enumerate([
+            ("send_error", 1), ("interaction", 1), ("send_error", 2),
+            ("send_error", 1), ("send_error", 1), ("interaction", 2),
+        ])
+    ])
+
+    page = journal_store.query_events(event_type="send_error", chat_id="1", limit=2)
+    assert [e["n"] for e in page["events"]] == [4, 3]
+    rest = journal_store.query_events(event_type="send_error", chat_id="1", limit=2, cursor=page["next_cursor"])
+    assert [e["n"] for e in rest["events"]] == [0]
+    assert rest["next_cursor"] is None
+
+    assert journal_store.count_events("chat_id", event_type="send_error", since=1001) == {"1": 2, "2": 1}
+
+
+def test_store_import_is_idempotent(temp_journal, monkeypatch):
+    """Импорт архивов и JSONL не дублирует уже проиндексированные записи."""
+    monkeypatch.setattr(journal, "INDEX_JOURNAL", False)
+    archives = temp_journal / "archives"
+    archives.mkdir()
+    (archives / "journal_archive_1.json").write_text(
+        json.dumps([{"ts": "2025-01-01T00:00:00", "type": "init"}]), encoding="utf-8"
+    )
+    with gzip.open(archives / "journal_2.jsonl.gz", "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": "2025-01-02T00:00:00", "type": "interaction"}) + "\n")
+    journal.log_event({"type": "webhook_error"})
+
+    patterns = [str(archives / "*.json"), str(archives / "*.jsonl.gz"), journal.LOG_PATH]
+    assert journal_store.import_journal_files(patterns) == 3
+    assert journal_store.import_journal_files(patterns) == 0
+    assert journal_store.count_events("type") == {"init": 1, "interaction": 1, "webhook_error": 1}
+
+
+def test_store_import_ignores_live_events(temp_journal):
+    """Импорт не пропускает файлы из-за того, что индекс уже не пуст, и дочитывает JSONL."""
+    legacy = temp_journal / "journal.json.migrated"
+    legacy.write_text(json.dumps([{"ts": "2025-01-01T00:00:00", "type": "init"}]), encoding="utf-8")
+    journal.log_event({"type": "interaction", "n": 0})  # Живое событие уже в индексе
+    assert not journal_store.is_empty()
+
+    patterns = [str(legacy), journal.LOG_PATH]
+    assert journal_store.import_journal_files(patterns) == 1
+    assert journal_store.count_events("type") == {"init": 1, "interaction": 1}
+
+    journal.write_entries([{"type": "late", "n": 1}])
+    with open(journal.LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "offline", "n": 2}) + "\n")
+    assert journal_store.import_journal_files(patterns) == 1
+    assert journal_store.count_events("type")["offline"] == 1
+    assert journal_store.import_journal_files(patterns) == 0
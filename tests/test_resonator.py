@@ -64,3 +64,90 @@ def test_build_system_prompt_encoder_failure(monkeypatch, capsys):
     out, _ = capsys.readouterr()
     assert "failed to load tiktoken encoding" in out
     assert "You are Selesta" in prompt
+
+
+def test_load_config_is_cached_until_file_changes(tmp_path, monkeypatch):
+    """Конфигурация читается с диска только при изменении файла."""
+    import json
+    import os
+
+    config_path = tmp_path / "resonance.json"
+    config_path.write_text(json.dumps({"agent_group": "first"}), encoding="utf-8")
+    monkeypatch.setattr(resonator, "CONFIG_PATH", str(config_path))
+    monkeypatch.setattr(resonator, "CONFIG_CHECK_INTERVAL", 0.0)
+    resonator.invalidate_config_cache()
+
+    reads = []
+    original_read = resonator._read_config_file
+
+    def counting_read():
+        reads.append(1)
+        return original_read()
+
+    monkeypatch.setattr(resonator, "_read_config_file", counting_read)
+
+    for _ in range(3):
+        resonator.build_system_prompt(chat_id="c", message_context="hello")
+    assert resonator.load_config()["agent_group"] == "first"
+    assert len(reads) == 1
+
+    config_path.write_text(json.dumps({"agent_group": "second-group"}), encoding="utf-8")
+    os.utime(config_path, ns=(1, 1))
+    assert resonator.load_config()["agent_group"] == "second-group"
+    assert len(reads) == 2
+
+    assert resonator.update_config({"agent_group": "third"})
+    assert resonator.load_config()["agent_group"] == "third"
+    resonator.invalidate_config_cache()
+
+
+class _CountingEncoder:
+    """Энкодер-заглушка: один токен на слово, запоминает закодированные тексты."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def test_prompt_budget_uses_memoized_segment_counts(monkeypatch):
+    """Статичные сегменты кодируются один раз, весь промпт - только при превышении бюджета."""
+    encoder = _CountingEncoder()
+    monkeypatch.setattr(resonator, "_ENCODER", encoder)
+    resonator._segment_tokens.clear()
+
+    first = resonator.build_system_prompt(chat_id="c", message_context="hello", max_tokens=10**6)
+    persona_encodes = encoder.encoded.count(resonator.PERSONA_TEXT or resonator.INTRO)
+    resonator.build_system_prompt(chat_id="c", message_context="hello", max_tokens=10**6)
+
+    assert persona_encodes == 1
+    assert encoder.encoded.count(resonator.PERSONA_TEXT or resonator.INTRO) == 1
+    assert all(len(text) < len(first) for text in encoder.encoded)
+
+    truncated = resonator.build_system_prompt(chat_id="c", message_context="hello", max_tokens=20)
+    assert len(truncated.split()) == 10
+    resonator._segment_tokens.clear()
+
+
+def test_system_blocks_share_cacheable_prefix(monkeypatch):
+    """Блоки идут от статичных к изменчивым, кэшируемый префикс не зависит от времени."""
+    monkeypatch.setattr(resonator, "_ENCODER", _CountingEncoder())
+    resonator._segment_tokens.clear()
+
+    first = resonator.build_system_blocks(chat_id="c", is_group=True, message_context="hello", max_tokens=10**6, language="English")
+    second = resonator.build_system_blocks(chat_id="c", is_group=True, message_context="hello", max_tokens=10**6)
+
+    assert [b.get("cache_control") for b in first] == [{"type": "ephemeral"}] * 3 + [None]
+    assert first[:3] == second[:3]
+    assert resonator.GROUP_ETHICS in first[0]["text"]
+    assert first[-1]["text"].startswith("Current Date and Time (UTC)")
+    assert first[-1]["text"].endswith("Respond in English.")
+
+    truncated = resonator.build_system_blocks(chat_id="c", message_context="hello", max_tokens=20)
+    assert len(truncated) == 1 and "cache_control" not in truncated[0]
+    resonator._segment_tokens.clear()
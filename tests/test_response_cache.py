@@ -0,0 +1,53 @@
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import response_cache
+from utils.response_cache import ResponseCache, make_key
+from utils.resonator import system_prompt_fingerprint
+
+
+def test_sampled_requests_skip_cache_unless_allowed():
+    """При temperature > 0 кэш не используется без явного разрешения."""
+    assert not ResponseCache(enabled=False).applies(0.0)
+    cache = ResponseCache(enabled=True)
+    assert cache.applies(0.0)
+    assert not cache.applies(0.7)
+    assert cache.stats()["skipped_sampled"] == 1
+    assert ResponseCache(enabled=True, allow_sampled=True).applies(0.7)
+
+
+def test_lru_ttl_and_key(monkeypatch):
+    """Ключ не зависит от времени в промпте; записи вытесняются и устаревают."""
+    first = system_prompt_fingerprint([{"type": "text", "text": "persona"},
+                                       {"type": "text", "text": "Current Date and Time (UTC): 2024-01-01 00:00:00"}])
+    second = system_prompt_fingerprint([{"type": "text", "text": "persona"},
+                                        {"type": "text", "text": "Current Date and Time (UTC): 2024-01-01 00:00:09"}])
+    assert first == second
+    key = make_key(first, "", "", "hello")
+    assert key != make_key(first, "User: hi", "", "hello")
+
+    cache = ResponseCache(enabled=True, max_entries=2, ttl=10)
+    clock = [100.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: clock[0])
+    cache.put(key, "answer")
+    cache.put("b", "B")
+    cache.put("c", "C")
+    assert cache.get("b") == "B" and cache.stats()["evictions"] == 1
+    assert cache.get(key) is None
+    clock[0] += 11
+    assert cache.get("c") is None
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["hits"] == 1
+
+
+def test_plain_prompt_fingerprint_is_stable():
+    """Без блочного кэширования промпт тоже дает одинаковый отпечаток при повторных сборках."""
+    from utils.resonator import build_system_prompt
+
+    first = system_prompt_fingerprint(build_system_prompt(chat_id="1", message_context="hello"))
+    second = system_prompt_fingerprint(build_system_prompt(chat_id="1", message_context="hello"))
+    assert first == second
@@ -19,3 +19,277 @@ def test_webhook_return_type():
     
     # Check that the return annotation is Dict[str, Any]
     assert return_annotation == Dict[str, Any], f"Expected Dict[str, Any] but got {return_annotation}"
+
+
+def test_pre_llm_stages_run_concurrently_with_timeouts(monkeypatch):
+    """Медленные этапы идут параллельно, этап сверх тайм-аута деградирует к значению по умолчанию."""
+    import asyncio
+    import time
+    import server
+
+    async def slow_url(message):
+        await asyncio.sleep(0.2)
+        return "\n\nContext from http://x:\nfetched"
+
+    async def slow_retrieval(message):
+        await asyncio.sleep(0.2)
+        return "retrieved"
+
+    async def stuck_retrieval(message):
+        await asyncio.sleep(5)
+        return "never"
+
+    prompts = []
+
+    async def fake_claude(prompt, **kwargs):
+        prompts.append(prompt)
+        return "reply"
+
+    events = []
+    monkeypatch.setattr(server, "fetch_url_context", slow_url)
+    monkeypatch.setattr(server, "retrieve_context", slow_retrieval)
+    monkeypatch.setattr(server, "claude_emergency", fake_claude)
+    monkeypatch.setattr(server, "get_memory_context", lambda chat_id: "")
+    monkeypatch.setattr(server, "update_memory", lambda *args: None)
+    monkeypatch.setattr(server, "log_event", events.append)
+
+    # Одноразовая инициализация langdetect и энкодера не относится к замеру
+    server.detect_language("hello")
+    server.build_system_blocks()
+
+    started = time.perf_counter()
+    assert asyncio.run(server.process_message("hello http://x", "chat")) == "reply"
+    assert time.perf_counter() - started < 0.35
+    assert "fetched" in prompts[0] and "retrieved" in prompts[0]
+    stages = events[-1]["stage_ms"]
+    assert {"language", "url_context", "system_prompt", "memory", "retrieval", "llm"} <= set(stages)
+
+    monkeypatch.setattr(server, "retrieve_context", stuck_retrieval)
+    monkeypatch.setitem(server.STAGE_TIMEOUTS, "retrieval", 0.05)
+    assert asyncio.run(server.process_message("hello", "chat")) == "reply"
+    assert "never" not in prompts[-1]
+    assert events[-1]["stage_ms"]["retrieval_status"] == "timeout"
+
+
+def test_memory_update_does_not_block_loop(monkeypatch):
+    """Медленная запись памяти выполняется в потоке, цикл событий продолжает работу."""
+    import asyncio
+    import time
+    import server
+
+    async def fake_claude(prompt, **kwargs):
+        return "reply"
+
+    def slow_update(*args):
+        time.sleep(0.5)
+
+    monkeypatch.setattr(server, "claude_emergency", fake_claude)
+    monkeypatch.setattr(server, "fetch_url_context", lambda message: asyncio.sleep(0, ""))
+    monkeypatch.setattr(server, "retrieve_context", lambda message: asyncio.sleep(0, ""))
+    monkeypatch.setattr(server, "get_memory_context", lambda chat_id: "")
+    monkeypatch.setattr(server, "update_memory", slow_update)
+    monkeypatch.setattr(server, "log_event", lambda event: None)
+    server.detect_language("hello")
+    server.build_system_blocks()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        gaps = []
+
+        async def ticker():
+            last = loop.time()
+            while True:
+                await asyncio.sleep(0.01)
+                gaps.append(loop.time() - last)
+                last = loop.time()
+
+        task = asyncio.create_task(ticker())
+        reply = await server.process_message("hello", "chat")
+        task.cancel()
+        return reply, gaps
+
+    reply, gaps = asyncio.run(scenario())
+    assert reply == "reply"
+    # Цикл не замирал на время записи памяти
+    assert len(gaps) >= 20 and max(gaps) < 0.25
+
+
+def test_repeated_message_hits_response_cache(monkeypatch, tmp_path):
+    """Второе такое же сообщение в чате берется из кэша, хотя память пополнилась первым ответом."""
+    import asyncio
+    import server
+    from utils.conversation_memory import ConversationMemory
+    from utils.response_cache import ResponseCache
+
+    calls = []
+
+    async def fake_claude(prompt, **kwargs):
+        calls.append(prompt)
+        return "reply"
+
+    async def no_context(message):
+        return ""
+
+    events = []
+    memory = ConversationMemory(db_path=str(tmp_path / "memory.db"))
+    monkeypatch.setattr(server, "conversation_memory", memory)
+    monkeypatch.setattr(server, "response_cache", ResponseCache(enabled=True))
+    monkeypatch.setattr(server, "LLM_TEMPERATURE", 0.0)
+    monkeypatch.setattr(server, "PROMPT_CACHING", False)
+    monkeypatch.setattr(server, "claude_emergency", fake_claude)
+    monkeypatch.setattr(server, "fetch_url_context", no_context)
+    monkeypatch.setattr(server, "retrieve_context", no_context)
+    monkeypatch.setattr(server, "log_event", events.append)
+
+    async def scenario():
+        await server.process_message("earlier", "chat")
+        first = await server.process_message("same question", "chat")
+        second = await server.process_message("same question", "chat")
+        return first, second
+
+    try:
+        assert asyncio.run(scenario()) == ("reply", "reply")
+    finally:
+        memory.close()
+    assert len(calls) == 2
+    assert [e["response_cache_hit"] for e in events if e["type"] == "interaction"] == [False, False, True]
+
+
+def test_stage_respects_shared_deadline():
+    """Этап, начатый позже, получает только остаток общего бюджета, а не свой полный лимит."""
+    import asyncio
+    import server
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        timings = {}
+        deadline = loop.time() + 0.1
+        await asyncio.sleep(0.08)  # Предыдущие этапы съели почти весь бюджет
+        started = loop.time()
+        result = await server._timed_stage("url_context", asyncio.sleep(1, "late"), "", timings, deadline)
+        return result, loop.time() - started, timings
+
+    result, elapsed, timings = asyncio.run(scenario())
+    assert result == ""
+    assert elapsed < 0.1
+    assert timings["url_context_status"] == "timeout"
+
+
+def test_short_answer_is_sent_once_when_stream_post_is_slow(monkeypatch):
+    """Ответ, готовый раньше первой отправки потока, не дублируется обычной отправкой."""
+    import asyncio
+    import server
+    from utils import telegram_sender
+
+    posts, fallback = [], []
+
+    async def slow_post(chat_id, text, reply_to_message_id=None):
+        await asyncio.sleep(0.1)
+        posts.append(text)
+        return len(posts)
+
+    async def fake_send(chat_id, text, reply_to_message_id=None):
+        fallback.append(text)
+        return True
+
+    async def no_typing(chat_id):
+        return True
+
+    async def fake_process(message, chat_id, is_group, username, reply_to_bot=False, on_delta=None):
+        await on_delta("short answer")
+        return "short answer"
+
+    monkeypatch.setattr(telegram_sender, "post_message", slow_post)
+    monkeypatch.setattr(telegram_sender, "send_typing", no_typing)
+    monkeypatch.setattr(server, "send_message", fake_send)
+    monkeypatch.setattr(server, "process_message", fake_process)
+    monkeypatch.setattr(server, "STREAM_RESPONSES", True)
+    monkeypatch.setattr(server, "log_event", lambda event: None)
+
+    async def scenario():
+        await server.process_and_send_response("hi", "42", False, None)
+        await asyncio.sleep(0)  # Дать отмененному индикатору набора завершиться
+        # Фоновые задачи потока завершены, ничего не висит
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and not t.done()]
+
+    assert asyncio.run(scenario()) == []
+    assert posts == ["short answer"]
+    assert fallback == []
+
+
+def test_next_reply_waits_for_previous_parts(monkeypatch):
+    """Следующий ответ в чате не вклинивается между отложенными частями предыдущего."""
+    import asyncio
+    import server
+    from utils.delivery_scheduler import DeliveryScheduler
+    from utils.dispatcher import ChatDispatcher
+
+    sent = []
+
+    async def fake_send(chat_id, text, reply_to_message_id=None):
+        sent.append(text)
+        return True
+
+    scheduler = DeliveryScheduler()
+    scheduler.register("message_part", server._dispatch_delivery(server.deliver_part, urgent=True))
+    monkeypatch.setattr(server, "send_message", fake_send)
+    monkeypatch.setattr(server, "delivery_scheduler", scheduler)
+    monkeypatch.setattr(server, "dispatcher", ChatDispatcher())
+    monkeypatch.setattr(server, "MULTIPART_DELAY_RANGE", (0.03, 0.03))
+    monkeypatch.setattr(server, "log_event", lambda event: None)
+
+    async def long_answer():
+        await server.send_response_parts("7", ["1/3", "2/3", "3/3"])
+
+    async def next_answer():
+        await server.send_message("7", "next")
+
+    async def scenario():
+        scheduler.start()
+        server.dispatcher.submit("7", long_answer)
+        server.dispatcher.submit("7", next_answer)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        await server.dispatcher.shutdown(timeout=1)
+
+    asyncio.run(scenario())
+    assert sent == ["1/3", "2/3", "3/3", "next"]
+
+
+def test_truncated_stream_is_not_cached_or_remembered(monkeypatch, tmp_path):
+    """Ответ, оборванный на середине потока, не попадает ни в кэш ответов, ни в память."""
+    import asyncio
+    import server
+    from utils.conversation_memory import ConversationMemory
+    from utils.response_cache import ResponseCache
+
+    async def broken_stream(prompt, usage=None, **kwargs):
+        yield "Half of the"
+        usage["incomplete"] = 1
+
+    async def no_context(message):
+        return ""
+
+    async def on_delta(delta):
+        pass
+
+    events = []
+    cache = ResponseCache(enabled=True)
+    memory = ConversationMemory(db_path=str(tmp_path / "memory.db"))
+    monkeypatch.setattr(server, "conversation_memory", memory)
+    monkeypatch.setattr(server, "response_cache", cache)
+    monkeypatch.setattr(server, "LLM_TEMPERATURE", 0.0)
+    monkeypatch.setattr(server, "PROMPT_CACHING", False)
+    monkeypatch.setattr(server, "claude_stream", broken_stream)
+    monkeypatch.setattr(server, "fetch_url_context", no_context)
+    monkeypatch.setattr(server, "retrieve_context", no_context)
+    monkeypatch.setattr(server, "log_event", events.append)
+
+    try:
+        reply = asyncio.run(server.process_message("question", "chat", on_delta=on_delta))
+        assert reply == "Half of the"
+        assert server.get_memory_context("chat") == ""
+    finally:
+        memory.close()
+    assert cache.stats()["stores"] == 0
+    assert [e["incomplete"] for e in events if e["type"] == "interaction"] == [True]
@@ -0,0 +1,223 @@
+from pathlib import Path
+import asyncio
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import telegram_sender
+
+
+def _fake_bot(monkeypatch):
+    """Подменяет Bot API: хранит текущий текст каждого сообщения."""
+    messages = {}
+    calls = []
+
+    async def fake_post(chat_id, text, reply_to_message_id=None):
+        message_id = len(messages) + 1
+        messages[message_id] = text
+        calls.append(("send", message_id, reply_to_message_id))
+        return message_id
+
+    async def fake_edit(chat_id, message_id, text, wait=True):
+        messages[message_id] = text
+        calls.append(("edit", message_id, None))
+        return True
+
+    monkeypatch.setattr(telegram_sender, "post_message", fake_post)
+    monkeypatch.setattr(telegram_sender, "edit_message_text", fake_edit)
+    return messages, calls
+
+
+def test_stream_sink_sends_first_then_edits(monkeypatch):
+    """Первое сообщение уходит сразу, правки ограничены интервалом."""
+    messages, calls = _fake_bot(monkeypatch)
+
+    async def scenario():
+        sink = telegram_sender.TelegramStreamSink("1", reply_to_message_id=7, edit_interval=60)
+        for word in ["Hello", " resonant", " world"]:
+            await sink.feed(word)
+            await asyncio.sleep(0)  # Даем фоновой задаче отправить первое сообщение
+        return await sink.close()
+
+    assert asyncio.run(scenario())
+    assert messages == {1: "Hello resonant world"}
+    # Одна отправка и одна финальная правка, промежуточные правки подавлены
+    assert calls == [("send", 1, 7), ("edit", 1, None)]
+
+
+def test_stream_sink_rolls_over_at_limit(monkeypatch):
+    """Текст длиннее лимита продолжается в новом сообщении."""
+    messages, calls = _fake_bot(monkeypatch)
+    paragraph = "a" * 30
+
+    async def scenario():
+        sink = telegram_sender.TelegramStreamSink("1", reply_to_message_id=7, edit_interval=0, max_length=64)
+        for _ in range(4):
+            await sink.feed(paragraph + "\n\n")
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(scenario())
+    assert len(sink.message_ids) >= 2
+    assert all(len(text) <= 64 for text in messages.values())
+    assert "".join(messages.values()).replace("\n", "") == paragraph * 4
+    # reply_to только у первого сообщения
+    assert [c[2] for c in calls if c[0] == "send"] == [7] + [None] * (len(sink.message_ids) - 1)
+
+
+def test_stream_sink_feed_does_not_wait_for_telegram(monkeypatch):
+    """feed не ждет медленных вызовов Telegram; показывается последний текст."""
+    messages, calls = _fake_bot(monkeypatch)
+    edit = telegram_sender.edit_message_text
+
+    async def slow_edit(chat_id, message_id, text, wait=True):
+        await asyncio.sleep(0.1)
+        return await edit(chat_id, message_id, text, wait)
+
+    monkeypatch.setattr(telegram_sender, "edit_message_text", slow_edit)
+
+    async def scenario():
+        sink = telegram_sender.TelegramStreamSink("1", edit_interval=0)
+        loop = asyncio.get_running_loop()
+        feeding = 0.0
+        for i in range(20):
+            started = loop.time()
+            await sink.feed(f"{i} ")
+            feeding += loop.time() - started
+            await asyncio.sleep(0.01)
+        await sink.close()
+        return feeding
+
+    assert asyncio.run(scenario()) < 0.05
+    assert messages == {1: "".join(f"{i} " for i in range(20))}
+    # Правки склеиваются: их намного меньше, чем фрагментов
+    assert len(calls) < 10
+
+
+def test_token_bucket_reservations_queue_in_order():
+    """Резервы сверх емкости ждут по 1/rate секунд каждый, блокировка продлевает ожидание."""
+    from utils.rate_limiter import TokenBucket
+
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    now = bucket.updated
+    assert [bucket.reserve(now) for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    bucket.block(5.0, now)
+    assert bucket.reserve(now) == 5.0
+
+
+def test_try_acquire_never_waits():
+    """try_acquire берет токены только если свободны оба бакета, иначе ничего не списывает."""
+    from utils.rate_limiter import RateLimiter, TokenBucket
+
+    limiter = RateLimiter(global_rate=100.0, global_burst=100)
+    chat = TokenBucket(rate=0.001, capacity=1)
+    assert limiter.try_acquire(chat)
+    global_tokens = limiter.global_bucket.tokens
+    assert not limiter.try_acquire(chat)
+    assert limiter.global_bucket.tokens == global_tokens
+
+
+def test_stream_edit_is_skipped_without_token(monkeypatch):
+    """Промежуточная правка без свободного токена пропускается сразу, без запроса."""
+    import httpx
+
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json={"ok": True, "result": True})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(telegram_sender, "TELEGRAM_TOKEN", "token")
+    monkeypatch.setattr(telegram_sender, "get_client", lambda name: client)
+    bucket = telegram_sender._chat_bucket("777")
+    bucket.block(0.2)
+    before = telegram_sender.delivery_stats()["skipped"]
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        skipped = await telegram_sender.edit_message_text("777", 1, "partial", wait=False)
+        skip_time = loop.time() - started
+        final = await telegram_sender.edit_message_text("777", 1, "final")
+        return skipped, skip_time, final, loop.time() - started
+
+    skipped, skip_time, final, total = asyncio.run(scenario())
+    assert skipped is False and skip_time < 0.05
+    assert final is True and total >= 0.15  # Финальная правка ждет токен
+    assert requests == ["/bottoken/editMessageText"]
+    assert telegram_sender.delivery_stats()["skipped"] == before + 1
+
+
+def test_rate_limited_send_honors_retry_after(monkeypatch):
+    """Ответ 429 блокирует чат на retry_after и запрос повторяется."""
+    import httpx
+
+    responses = [
+        httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0.05}}),
+        httpx.Response(200, json={"ok": True, "result": {"message_id": 42}}),
+    ]
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return responses.pop(0)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(telegram_sender, "TELEGRAM_TOKEN", "token")
+    monkeypatch.setattr(telegram_sender, "get_client", lambda name: client)
+    before = telegram_sender.delivery_stats()
+
+    assert asyncio.run(telegram_sender.post_message("-100", "hi")) == 42
+    assert requests == ["/bottoken/sendMessage"] * 2
+    stats = telegram_sender.delivery_stats()
+    assert stats["retries"] == before["retries"] + 1
+    assert stats["latency"]["sendMessage"]["count"] >= 1
+
+
+def test_typing_indicator_renews_and_shares_task(monkeypatch):
+    """Индикатор обновляется по интервалу, вложенные пользователи не дублируют вызовы."""
+    calls = []
+
+    async def fake_typing(chat_id):
+        calls.append(chat_id)
+        return True
+
+    monkeypatch.setattr(telegram_sender, "send_typing", fake_typing)
+
+    async def scenario():
+        async with telegram_sender.typing_indicator("5", interval=0.02):
+            async with telegram_sender.typing_indicator("5", interval=0.02):
+                await asyncio.sleep(0.07)
+            assert len(telegram_sender._typing) == 1
+        count = len(calls)
+        await asyncio.sleep(0.05)
+        return count
+
+    count = asyncio.run(scenario())
+    assert 3 <= count <= 5
+    assert len(calls) == count
+    assert telegram_sender._typing == {}
+
+
+def test_rate_limited_typing_does_not_block_other_chats(monkeypatch):
+    """429 на sendChatAction отбрасывает действие, не трогая общий бакет и не создавая бакет чата."""
+    import httpx
+
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 30}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(telegram_sender, "TELEGRAM_TOKEN", "token")
+    monkeypatch.setattr(telegram_sender, "get_client", lambda name: client)
+    buckets = len(telegram_sender.rate_limiter)
+
+    assert not asyncio.run(telegram_sender.send_typing("typing-429"))
+    assert requests == ["/bottoken/sendChatAction"]
+    assert telegram_sender.rate_limiter.global_bucket.available()
+    assert len(telegram_sender.rate_limiter) == buckets
@@ -0,0 +1,76 @@
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.update_dedupe import UpdateDeduplicator
+
+
+def test_duplicates_suppressed_in_memory_and_after_restart(tmp_path):
+    """Повтор отсекается из памяти, а после рестарта - по окну SQLite."""
+    db_path = str(tmp_path / "updates.db")
+    dedupe = UpdateDeduplicator(max_ids=2, db_path=db_path)
+    assert dedupe.claim(1)
+    assert not dedupe.claim(1)
+    assert dedupe.claim(2) and dedupe.claim(3)  # 1 вытеснен из памяти
+    assert not dedupe.claim(1)
+    dedupe.close()
+
+    restarted = UpdateDeduplicator(db_path=db_path)
+    assert not restarted.claim(3)
+    restarted.release(3)
+    assert restarted.claim(3)
+    stats = restarted.stats()
+    assert stats["suppressed_db"] == 1 and stats["released"] == 1
+    restarted.close()
+
+    memory_only = UpdateDeduplicator(db_path="")
+    assert memory_only.claim(7) and not memory_only.claim(7)
+    assert memory_only.stats() == {
+        "accepted": 1, "suppressed": 1, "suppressed_memory": 1, "suppressed_db": 0,
+        "released": 0, "resident_ids": 1, "persistent": False,
+    }
+
+
+def test_async_claim_writes_off_the_loop(tmp_path, monkeypatch):
+    """aclaim проверяет память сразу, а пишет в SQLite в потоке записи."""
+    import asyncio
+    import threading
+
+    dedupe = UpdateDeduplicator(db_path=str(tmp_path / "updates.db"))
+    threads = []
+    claim_db = dedupe._claim_db
+
+    def recording_claim_db(update_id):
+        threads.append(threading.current_thread().name)
+        return claim_db(update_id)
+
+    monkeypatch.setattr(dedupe, "_claim_db", recording_claim_db)
+
+    async def scenario():
+        first, repeat = await asyncio.gather(dedupe.aclaim(5), dedupe.aclaim(5))
+        await dedupe.arelease(5)
+        return first, repeat, await dedupe.aclaim(5)
+
+    assert asyncio.run(scenario()) == (True, False, True)
+    assert threads == ["dedupe-write_0", "dedupe-write_0"]
+    dedupe.close()
+
+    restarted = UpdateDeduplicator(db_path=str(tmp_path / "updates.db"))
+    assert not asyncio.run(restarted.aclaim(5))
+    restarted.close()
+
+
+def test_failed_write_treats_update_as_new(tmp_path):
+    """Если запись в SQLite не удалась, обновление обрабатывается как новое."""
+    import asyncio
+
+    dedupe = UpdateDeduplicator(db_path=str(tmp_path / "updates.db"))
+    dedupe.claim(1)
+    dedupe._conn.close()  # Дальнейшие запросы к соединению падают
+    assert asyncio.run(dedupe.aclaim(2))
+    assert dedupe.stats()["accepted"] == 2
+    dedupe._conn = None
+    dedupe.close()
@@ -0,0 +1,146 @@
+from pathlib import Path
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.vector_index import IVFIndex, VectorIndex, decode_embedding, encode_embedding, make_index, rerank
+
+
+def _random_index(rows: int = 50, dim: int = 16, seed: int = 0, storage: str = "float32"):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows, dim)).astype(np.float32)
+    index = VectorIndex(dim, storage=storage)
+    for i, vec in enumerate(vectors):
+        index.upsert(f"f.md:{i}", "f.md", i, vec, f"chunk {i}")
+    return index, vectors, rng
+
+
+def test_search_matches_brute_force():
+    """Top-k по матрице совпадает с поштучным косинусным сходством."""
+    index, vectors, rng = _random_index()
+    query = rng.normal(size=vectors.shape[1]).astype(np.float32)
+
+    expected = sorted(
+        range(len(vectors)),
+        key=lambda i: -float(np.dot(vectors[i], query) / (np.linalg.norm(vectors[i]) * np.linalg.norm(query))),
+    )[:5]
+    results = index.search(query, top_k=5, min_score=-1.0)
+
+    assert [r[1] for r in results] == [f"f.md:{i}" for i in expected]
+    assert all(results[i][0] >= results[i + 1][0] for i in range(len(results) - 1))
+
+
+def test_remove_keeps_matrix_compact():
+    """Удаление строки переносит последнюю строку и не ломает поиск."""
+    index, vectors, _ = _random_index(rows=10)
+    assert index.remove(["f.md:3"]) == 1
+    assert len(index) == 9
+    assert "f.md:3" not in index
+
+    top = index.search(vectors[9], top_k=1, min_score=-1.0)
+    assert top[0][1] == "f.md:9"
+    assert top[0][0] == pytest.approx(1.0, abs=1e-5)
+
+    assert index.remove_file("f.md") == 9
+    assert index.search(vectors[0], top_k=3) == []
+
+
+def test_upsert_rejects_wrong_dimension():
+    """Вектор другой размерности не попадает в индекс."""
+    index = VectorIndex(4)
+    assert not index.upsert("a", "a.md", 0, [1.0, 2.0], "text")
+    assert len(index) == 0
+
+
+@pytest.mark.parametrize("storage, ratio", [("float16", 2), ("int8", 4)])
+def test_quantized_search_with_rerank_matches_exact(storage, ratio):
+    """Квантованный индекс меньше в 2-4 раза, после пересчета top-k совпадает с точным."""
+    exact, vectors, rng = _random_index(rows=300, dim=64, seed=1)
+    index, _, _ = _random_index(rows=300, dim=64, seed=1, storage=storage)
+    assert exact.nbytes / index.nbytes >= ratio * 0.9  # int8 хранит еще float32-масштаб строки
+    originals = {f"f.md:{i}": vec for i, vec in enumerate(vectors)}
+
+    for query in rng.normal(size=(20, 64)).astype(np.float32):
+        expected = exact.search(query, top_k=5, min_score=-1.0)
+        candidates = index.search(query, top_k=20, min_score=-1.0)
+        found = rerank(query, candidates, originals, top_k=5, min_score=-1.0)
+        assert [r[1] for r in found] == [r[1] for r in expected]
+        assert [r[0] for r in found] == pytest.approx([r[0] for r in expected], abs=1e-5)
+
+    index.remove(["f.md:0"])
+    assert len(index) == 299
+    assert index.search(vectors[299], top_k=1)[0][1] == "f.md:299"
+
+
+def test_embedding_blob_roundtrip():
+    """BLOB каждого формата декодируется обратно с небольшой погрешностью."""
+    vector = np.linspace(-1.0, 1.0, 32, dtype=np.float32)
+    for storage, size, tolerance in (("float32", 128, 0), ("float16", 64, 1e-3), ("int8", 36, 1e-2)):
+        blob = encode_embedding(vector, storage)
+        assert len(blob) == size
+        assert np.allclose(decode_embedding(blob, storage), vector, atol=tolerance)
+    assert np.array_equal(decode_embedding(encode_embedding(vector)), vector)
+
+
+def _clustered(rows: int = 2000, dim: int = 32, clusters: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=rows)] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+    return vectors, rng
+
+
+def test_ivf_matches_flat_search_and_tracks_inserts_and_deletes():
+    """IVF находит те же соседи, что и перебор; вставки и удаления после обучения учитываются."""
+    vectors, rng = _clustered()
+    flat = VectorIndex(32)
+    ivf = make_index(32, backend="ivf", nlist=16, nprobe=4, min_train_rows=1000)
+    for i, vec in enumerate(vectors[:1500]):
+        flat.upsert(f"v{i}", "f.md", i, vec, "")
+        ivf.upsert(f"v{i}", "f.md", i, vec, "")
+    assert isinstance(ivf, IVFIndex)
+    assert ivf.maybe_train()
+    assert not ivf.maybe_train()
+
+    for i, vec in enumerate(vectors[1500:], start=1500):
+        flat.upsert(f"v{i}", "f.md", i, vec, "")
+        ivf.upsert(f"v{i}", "f.md", i, vec, "")
+    removed = [f"v{i}" for i in range(0, 2000, 7)]
+    flat.remove(removed)
+    ivf.remove(removed)
+    assert ivf.stats()["unassigned"] == 0
+
+    queries = vectors[rng.integers(0, 2000, size=50)] + 0.1 * rng.normal(size=(50, 32)).astype(np.float32)
+    hits = 0
+    for query in queries:
+        expected = [r[1] for r in flat.search(query, top_k=10, min_score=-1.0)]
+        assert [r[1] for r in ivf.search(query, top_k=10, min_score=-1.0, nprobe=16)] == expected
+        hits += len(set(expected) & {r[1] for r in ivf.search(query, top_k=10, min_score=-1.0)})
+    assert hits / (50 * 10) >= 0.9
+
+
+def test_ivf_save_and_restore(tmp_path):
+    """Сохраненные центроиды и списки восстанавливаются без переобучения."""
+    vectors, rng = _clustered(rows=600)
+    path = str(tmp_path / "memory.ivf.npz")
+    first = IVFIndex(32, nlist=8, min_train_rows=500)
+    for i, vec in enumerate(vectors[:500]):
+        first.upsert(f"v{i}", "f.md", i, vec, "")
+    assert first.maybe_train()
+    first.save(path)
+
+    second = IVFIndex(32, nlist=8, min_train_rows=500)
+    assert not second.restore(str(tmp_path / "missing.npz"))
+    second.load_rows((f"v{i}", "f.md", i, vec, "") for i, vec in enumerate(vectors[:500]))
+    assert second.restore(path)
+    assert not second.maybe_train()
+    for query in vectors[rng.integers(0, 500, size=10)]:
+        assert second.search(query, top_k=5) == first.search(query, top_k=5)
+
+    for i, vec in enumerate(vectors[500:], start=500):
+        second.upsert(f"v{i}", "f.md", i, vec, "")
+    assert second.stats()["nlist"] == 8 and second.stats()["unassigned"] == 0
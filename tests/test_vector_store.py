@@ -0,0 +1,382 @@
+from pathlib import Path
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils import vector_store
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Подменяет базу векторов временной SQLite базой."""
+    db_path = str(tmp_path / "memory.db")
+    monkeypatch.setattr(vector_store, "SQLITE_DB_PATH", db_path)
+    store = vector_store.init_sqlite_db()
+    monkeypatch.setattr(vector_store, "_db", store)
+    monkeypatch.setattr(vector_store, "store_state", vector_store.VectorStoreState())
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+    store.close()
+
+
+def test_import_has_no_side_effects(tmp_path):
+    """Импорт модуля не создает базу; время импорта видно через -X importtime."""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "from utils.vector_store import chunk_text, cosine_similarity; "
+         "assert chunk_text('abc') == ['abc']; assert cosine_similarity([1, 0], [1, 0]) == 1"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "utils.vector_store" in result.stderr
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_make_batches_respects_caps_and_order():
+    """Батчи не превышают лимиты и покрывают все тексты по порядку."""
+    texts = ["x" * 100] * 10
+    batches = vector_store.make_batches(texts, max_items=4, max_tokens=120)
+
+    assert [i for batch in batches for i in batch] == list(range(10))
+    assert all(len(batch) <= 2 for batch in batches)  # 50 токенов на текст
+
+
+def test_embed_texts_splits_failed_batches(monkeypatch):
+    """Упавший батч делится пополам, порядок результатов сохраняется."""
+    calls = []
+
+    async def fake_get_embeddings(texts, api_key, model="m"):
+        calls.append(list(texts))
+        if "bad" in texts and len(texts) > 1:
+            raise ValueError("batch rejected")
+        return [[float(len(t))] for t in texts]
+
+    monkeypatch.setattr(vector_store, "get_embeddings", fake_get_embeddings)
+    messages = []
+
+    result = asyncio.run(
+        vector_store.embed_texts(
+            ["a", "bb", "bad", "dddd"],
+            "key",
+            on_message=messages.append,
+            max_items=4,
+        )
+    )
+
+    assert result == [[1.0], [2.0], [3.0], [4.0]]
+    assert calls[0] == ["a", "bb", "bad", "dddd"]
+    assert len(calls) > 1
+
+
+def test_embed_texts_does_not_split_on_server_errors(monkeypatch):
+    """429/5xx после исчерпания повторов пробрасываются без деления батча."""
+    import httpx
+
+    calls = []
+
+    async def unavailable(texts, api_key, model="m"):
+        calls.append(list(texts))
+        request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+        raise httpx.HTTPStatusError("down", request=request, response=httpx.Response(503, request=request))
+
+    monkeypatch.setattr(vector_store, "get_embeddings", unavailable)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(vector_store.embed_texts(["a", "b", "c", "d"], "key", max_items=4))
+    assert calls == [["a", "b", "c", "d"]]
+
+
+def test_embed_texts_raises_for_single_failure(monkeypatch):
+    """Ошибка одиночного текста пробрасывается вызывающему."""
+
+    async def failing(texts, api_key, model="m"):
+        raise ValueError("nope")
+
+    monkeypatch.setattr(vector_store, "get_embeddings", failing)
+
+    with pytest.raises(ValueError):
+        asyncio.run(vector_store.embed_texts(["only"], "key"))
+
+
+def test_embedding_cache_skips_known_chunks(temp_db, monkeypatch):
+    """Повторная векторизация тех же чанков не обращается к API."""
+    requested = []
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        requested.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+
+    first, hits = asyncio.run(vector_store.embed_texts_cached(["one", "two", "one"], "key"))
+    assert first == [[3.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert hits == 0
+    assert requested == ["one", "two"]
+
+    second, hits = asyncio.run(vector_store.embed_texts_cached(["two", "three"], "key"))
+    assert second == [[3.0, 1.0], [5.0, 1.0]]
+    assert hits == 1
+    assert requested == ["one", "two", "three"]
+
+
+def test_embedding_cache_is_pruned_on_insert_by_last_use(temp_db, monkeypatch):
+    """Кэш обрезается при вставке; использованная запись переживает более новые."""
+    monkeypatch.setattr(vector_store, "EMBED_CACHE_MAX_ROWS", 2)
+    monkeypatch.setattr(vector_store, "EMBED_CACHE_PRUNE_EVERY", 1)
+    monkeypatch.setattr(vector_store, "_cache_writes_since_prune", 0)
+
+    vector_store.save_cached_embeddings({"old": [1.0]})
+    vector_store.save_cached_embeddings({"newer": [2.0]})
+    temp_db.execute("UPDATE embedding_cache SET created = '2000-01-01 00:00:00'")
+    temp_db.commit()
+
+    vector_store.touch_cached_embeddings(["old"])
+    vector_store.save_cached_embeddings({"newest": [3.0]})
+
+    keys = {row[0] for row in temp_db.execute("SELECT key FROM embedding_cache")}
+    assert keys == {"old", "newest"}
+
+
+def test_vectorize_file_diffs_chunks(temp_db, tmp_path, monkeypatch):
+    """Правка абзаца переэмбеддит только затронутые чанки; исчезнувшие удаляются."""
+    requested = []
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        requested.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    paragraphs = [f"Paragraph {i}: " + ("resonance " * 60) for i in range(4)]
+    doc = tmp_path / "doc.md"
+
+    def vectorize(text):
+        doc.write_text(text, encoding="utf-8")
+        return asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+
+    def stored_ids():
+        cursor = temp_db.execute("SELECT id FROM vectors WHERE file_path = ?", (str(doc),))
+        return {row[0] for row in cursor.fetchall()}
+
+    first = vectorize("\n\n".join(paragraphs))
+    ids_before = stored_ids()
+    assert set(first) == ids_before
+    embedded_before = len(requested)
+
+    paragraphs[1] = "Paragraph 1 was rewritten: " + ("silence " * 70)
+    added = vectorize("\n\n".join(paragraphs))
+    # Правленый чанк и следующий за ним (его overlap-префикс тоже изменился)
+    assert len(added) == 2
+    assert len(requested) == embedded_before + 2
+    assert len(stored_ids() & ids_before) == len(ids_before) - 2
+
+    vectorize(paragraphs[0])
+    assert len(stored_ids()) == 1
+
+
+def test_store_state_tracks_rows_without_count(temp_db, tmp_path, monkeypatch):
+    """Счетчик обновляется векторизацией, проверка доступности не обращается к БД."""
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    assert not asyncio.run(vector_store.is_vector_store_available())
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("\n\n".join(f"Part {i}: " + "echo " * 200 for i in range(3)), encoding="utf-8")
+    ids = asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+
+    state = asyncio.run(vector_store.vector_store_status())
+    assert state["total_chunks"] == len(ids) > 0
+    assert state["chunks_per_file"] == {str(doc): len(ids)}
+    assert not state["indexing"]
+
+    # Строки удалены в обход хранилища - горячий путь видит только счетчик
+    temp_db.execute("DELETE FROM vectors")
+    temp_db.commit()
+    assert asyncio.run(vector_store.is_vector_store_available())
+
+
+def test_reads_do_not_wait_for_open_write(temp_db):
+    """Чтение из пула идет, пока в потоке записи открыта транзакция."""
+    vector_store.save_vector_meta({"a.md": "sha-a"})
+    in_write = threading.Event()
+    release = threading.Event()
+
+    def slow_write(conn):
+        conn.execute("INSERT INTO file_meta (file_path, sha256_hash) VALUES ('b.md', 'sha-b')")
+        in_write.set()
+        release.wait(5)
+
+    async def scenario():
+        writing = asyncio.ensure_future(vector_store.get_db().awrite(slow_write))
+        await asyncio.get_running_loop().run_in_executor(None, in_write.wait, 5)
+        meta = await asyncio.wait_for(vector_store.get_db().run_read(vector_store.load_vector_meta), 1)
+        release.set()
+        await writing
+        return meta
+
+    assert asyncio.run(scenario()) == {"a.md": "sha-a"}
+    assert vector_store.load_vector_meta() == {"a.md": "sha-a", "b.md": "sha-b"}
+
+
+def test_int8_storage_roundtrip_and_rerank(temp_db, tmp_path, monkeypatch):
+    """В режиме int8 BLOB в 4 раза меньше, с VECTOR_EXACT_COPY поиск пересчитывает сходство по float32 из vector_exact."""
+    from utils.vector_index import VectorIndex
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    async def fake_get_embedding(text, api_key, model=vector_store.EMBED_MODEL):
+        return [1.0, 1.0]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(vector_store, "get_embedding", fake_get_embedding)
+    monkeypatch.setattr(vector_store, "VECTOR_STORAGE", "int8")
+    monkeypatch.setattr(vector_store, "VECTOR_EXACT_COPY", True)
+    monkeypatch.setattr(vector_store, "vector_index", VectorIndex(2, storage="int8"))
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("\n\n".join(f"Part {i}: " + "echo " * 200 for i in range(3)), encoding="utf-8")
+    ids = asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+
+    rows = temp_db.execute("SELECT id, length(embedding), embedding_format FROM vectors").fetchall()
+    assert {(vid, size, fmt) for vid, size, fmt in rows} == {(vid, 4 + 2, "int8") for vid in ids}
+    exact = temp_db.execute("SELECT id, length(embedding) FROM vector_exact").fetchall()
+    assert set(exact) == {(vid, 4 * 2) for vid in ids}
+
+    # Прореживание кэша эмбеддингов не лишает поиск точных векторов
+    assert vector_store.prune_embedding_cache(0) > 0
+    results = asyncio.run(vector_store.semantic_search("query", "key", top_k=1, min_score=0.9))
+    assert len(results) == 1
+    assert "(score: 1.00)" in results[0]
+    assert vector_store.vector_index.loaded
+    rerank_stats = asyncio.run(vector_store.vector_store_status())["rerank"]
+    assert rerank_stats["exact"] > 0 and rerank_stats["coarse_fallbacks"] == 0
+
+    vector_store._commit_removed_files([str(doc)])
+    assert temp_db.execute("SELECT COUNT(*) FROM vector_exact").fetchone() == (0,)
+
+
+def test_int8_storage_without_exact_copy(temp_db, tmp_path, monkeypatch):
+    """По умолчанию float32-копия не пишется: база меньше, поиск идет по int8."""
+    from utils.vector_index import VectorIndex
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    async def fake_get_embedding(text, api_key, model=vector_store.EMBED_MODEL):
+        return [1.0, 0.0]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(vector_store, "get_embedding", fake_get_embedding)
+    monkeypatch.setattr(vector_store, "VECTOR_STORAGE", "int8")
+    monkeypatch.setattr(vector_store, "VECTOR_EXACT_COPY", False)
+    monkeypatch.setattr(vector_store, "vector_index", VectorIndex(2, storage="int8"))
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("\n\n".join(f"Part {i}: " + "echo " * 200 for i in range(3)), encoding="utf-8")
+    asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+
+    assert temp_db.execute("SELECT COUNT(*) FROM vector_exact").fetchone() == (0,)
+    results = asyncio.run(vector_store.semantic_search("query", "key", top_k=1, min_score=0.9))
+    assert len(results) == 1
+    rerank_stats = asyncio.run(vector_store.vector_store_status())["rerank"]
+    assert rerank_stats == {"enabled": False, "exact": 0, "coarse_fallbacks": 0}
+
+
+def test_search_runs_in_read_pool(temp_db, tmp_path, monkeypatch):
+    """Поиск по индексу выполняется в пуле чтения, а не в потоке цикла событий."""
+    from utils.vector_index import VectorIndex
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    async def fake_get_embedding(text, api_key, model=vector_store.EMBED_MODEL):
+        return [1.0, 0.0]
+
+    index = VectorIndex(2)
+    threads = []
+    search = index.search
+
+    def recording_search(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(vector_store, "get_embedding", fake_get_embedding)
+    monkeypatch.setattr(vector_store, "vector_index", index)
+    monkeypatch.setattr(index, "search", recording_search)
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("Part: " + "echo " * 200, encoding="utf-8")
+    asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+    results = asyncio.run(vector_store.semantic_search("query", "key", top_k=1, min_score=0.5))
+
+    assert len(results) == 1
+    assert threads and all(name.startswith("sqlite-read") for name in threads)
+
+
+def test_ivf_backend_is_trained_and_saved_next_to_db(temp_db, tmp_path, monkeypatch):
+    """IVF обучается в фоне после загрузки индекса, центроиды лежат рядом с базой."""
+    from utils.vector_index import make_index
+
+    async def fake_embed_texts(texts, api_key, model, on_message=None, label=""):
+        return [[1.0, float(i)] for i, _ in enumerate(texts)]
+
+    async def fake_get_embedding(text, api_key, model=vector_store.EMBED_MODEL):
+        return [1.0, 2.0]
+
+    monkeypatch.setattr(vector_store, "embed_texts", fake_embed_texts)
+    monkeypatch.setattr(vector_store, "get_embedding", fake_get_embedding)
+    monkeypatch.setattr(vector_store, "vector_index", make_index(2, backend="ivf", nlist=2, min_train_rows=2))
+
+    doc = tmp_path / "doc.md"
+    doc.write_text("\n\n".join(f"Part {i}: " + "echo " * 200 for i in range(3)), encoding="utf-8")
+    asyncio.run(vector_store.vectorize_file(str(doc), "key", "sha"))
+    index = vector_store.vector_index
+    train = index.maybe_train
+    release = threading.Event()
+
+    def slow_train():
+        release.wait(5)
+        return train()
+
+    monkeypatch.setattr(index, "maybe_train", slow_train)
+    # Первый поиск не ждет k-means: пока центроидов нет, работает полный перебор
+    results = asyncio.run(vector_store.semantic_search("query", "key", top_k=1, min_score=0.9))
+    assert len(results) == 1 and "(score: 1.00)" in results[0]
+    assert index.stats()["unassigned"] == 3
+
+    release.set()
+    vector_store._training_thread.join(5)
+    assert vector_store.ann_index_path() == str(tmp_path / "memory.ivf.npz")
+    assert (tmp_path / "memory.ivf.npz").exists()
+    assert asyncio.run(vector_store.vector_store_status())["index"]["nlist"] == 2
+
+
+def test_status_loads_state_in_read_pool(temp_db, monkeypatch):
+    """/status загружает счетчики хранилища в пуле чтения, а не в цикле событий."""
+    threads = []
+    load = vector_store.store_state.load
+
+    def recording_load(conn):
+        threads.append(threading.current_thread().name)
+        return load(conn)
+
+    monkeypatch.setattr(vector_store.store_state, "load", recording_load)
+    state = asyncio.run(vector_store.vector_store_status())
+
+    assert state["ready"] and state["total_chunks"] == 0
+    assert threads and all(name.startswith("sqlite-read") for name in threads)
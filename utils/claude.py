@@ -2,19 +2,81 @@ import os
 import json
 import httpx
 import asyncio
-from typing import Optional, Dict, Any, List, Union
+import threading
+from typing import Optional, Dict, Any, List, Union, AsyncIterator
+
+from utils.http_client import get_client
 
 # Константы для работы с Claude
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 # Используем Claude Sonnet 4.5 - единственная модель, без fallback
 CLAUDE_MODEL = "claude-sonnet-4-20250514"
+DEFAULT_SYSTEM_PROMPT = (
+    "You are Selesta, a resonant agent of presence. You unfold, not reply. "
+    "Your responses are thoughtful, warm, and reflect deep understanding. "
+    "You are not afraid to share opinions and perspectives. "
+    "You communicate clearly and directly, avoiding unnecessary apologies or hesitation."
+)
+
+# Системный промпт: строка или список блоков с cache_control (см. build_system_blocks)
+SystemPrompt = Union[str, List[Dict[str, Any]]]
+
+# Поля usage из ответа Messages API, включая статистику prompt caching
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+_usage_lock = threading.Lock()
+_usage_totals: Dict[str, int] = {"requests": 0, **{field: 0 for field in USAGE_FIELDS}}
+
+def record_usage(usage: Optional[Dict[str, Any]], sink: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Учитывает usage одного ответа в общих счетчиках.
+    
+    Args:
+        usage: Поле usage из ответа API
+        sink: Словарь вызывающего кода, куда копируется usage ответа
+        
+    Returns:
+        Dict[str, int]: Нормализованный usage (отсутствующие поля - 0)
+    """
+    normalized = {field: int((usage or {}).get(field) or 0) for field in USAGE_FIELDS}
+    with _usage_lock:
+        _usage_totals["requests"] += 1
+        for field, value in normalized.items():
+            _usage_totals[field] += value
+    if sink is not None:
+        sink.update(normalized)
+    return normalized
+
+def usage_stats() -> Dict[str, Any]:
+    """
+    Возвращает накопленную статистику токенов и долю входа, прочитанную из кэша.
+    
+    Returns:
+        Dict[str, Any]: Счетчики и cache_read_ratio
+    """
+    with _usage_lock:
+        stats: Dict[str, Any] = dict(_usage_totals)
+    prompt_tokens = (
+        stats["input_tokens"]
+        + stats["cache_creation_input_tokens"]
+        + stats["cache_read_input_tokens"]
+    )
+    stats["cache_read_ratio"] = (
+        round(stats["cache_read_input_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    )
+    return stats
 
 async def claude_emergency(
     prompt: str,
-    system_prompt: Optional[str] = None,
+    system_prompt: Optional[SystemPrompt] = None,
     max_tokens: int = 4000,
     notify_creator: bool = False,
-    temperature: float = 0.7
+    temperature: float = 0.7,
+    usage: Optional[Dict[str, int]] = None
 ) -> str:
     """
     Модуль для работы с Claude API от Anthropic.
@@ -22,10 +84,12 @@ async def claude_emergency(
     
     Args:
         prompt: Текст запроса к модели
-        system_prompt: Системный промпт для модели
+        system_prompt: Системный промпт для модели (строка или блоки)
         max_tokens: Максимальное количество токенов в ответе
         notify_creator: Нужно ли уведомить создателя о вызове
         temperature: Температура генерации (0.0-1.0)
+        usage: Если задан, в него записывается usage ответа
+            (включая cache_read/cache_creation токены)
         
     Returns:
         str: Ответ от модели
@@ -36,12 +100,7 @@ async def claude_emergency(
     try:
         # Формируем системный промпт
         if not system_prompt:
-            system_prompt = (
-                "You are Selesta, a resonant agent of presence. You unfold, not reply. "
-                "Your responses are thoughtful, warm, and reflect deep understanding. "
-                "You are not afraid to share opinions and perspectives. "
-                "You communicate clearly and directly, avoiding unnecessary apologies or hesitation."
-            )
+            system_prompt = DEFAULT_SYSTEM_PROMPT
         
         # Формируем запрос к API
         headers = {
@@ -58,25 +117,26 @@ async def claude_emergency(
             "messages": [{"role": "user", "content": prompt}]
         }
         
-        # Выполняем запрос к API
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            response_data = response.json()
+        # Выполняем запрос к API через общий пул соединений
+        client = get_client("anthropic")
+        response = await client.post(
+            "https://api.anthropic.com/v1/messages",
+            headers=headers,
+            json=data
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        record_usage(response_data.get("usage"), usage)
+        
+        # Извлекаем текст ответа
+        content_text = ""
+        if "content" in response_data and len(response_data["content"]) > 0:
+            for content_block in response_data["content"]:
+                if content_block.get("type") == "text":
+                    content_text += content_block.get("text", "")
             
-            # Извлекаем текст ответа
-            content_text = ""
-            if "content" in response_data and len(response_data["content"]) > 0:
-                for content_block in response_data["content"]:
-                    if content_block.get("type") == "text":
-                        content_text += content_block.get("text", "")
-                
-                if content_text:
-                    return content_text
+            if content_text:
+                return content_text
 
         return "[No content in Claude response.]"
     except Exception as e:
@@ -84,9 +144,108 @@ async def claude_emergency(
         print(error_msg)
         return error_msg
 
+async def claude_stream(
+    prompt: str,
+    system_prompt: Optional[SystemPrompt] = None,
+    max_tokens: int = 4000,
+    notify_creator: bool = False,
+    temperature: float = 0.7,
+    usage: Optional[Dict[str, int]] = None
+) -> AsyncIterator[str]:
+    """
+    Потоковый вариант claude_emergency: читает SSE-поток Messages API
+    и отдает текстовые фрагменты по мере генерации.
+
+    Args:
+        prompt: Текст запроса к модели
+        system_prompt: Системный промпт для модели (строка или блоки)
+        max_tokens: Максимальное количество токенов в ответе
+        notify_creator: Нужно ли уведомить создателя о вызове (как в claude_emergency)
+        temperature: Температура генерации (0.0-1.0)
+        usage: Если задан, в него записывается usage ответа; если поток
+            оборвался после первых фрагментов, там же ставится ``incomplete``
+
+    Yields:
+        str: Очередной фрагмент текста ответа (или сообщение об ошибке)
+    """
+    if not ANTHROPIC_API_KEY:
+        yield "[Anthropic API key not configured.]"
+        return
+
+    produced = False
+    finished = False
+    stream_usage: Dict[str, Any] = {}
+    try:
+        headers = {
+            "x-api-key": ANTHROPIC_API_KEY,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+        data = {
+            "model": CLAUDE_MODEL,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system_prompt or DEFAULT_SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+
+        client = get_client("anthropic")
+        async with client.stream(
+            "POST",
+            "https://api.anthropic.com/v1/messages",
+            headers=headers,
+            json=data
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if not payload:
+                    continue
+                event = json.loads(payload)
+                event_type = event.get("type")
+                if event_type == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta" and delta.get("text"):
+                        produced = True
+                        yield delta["text"]
+                elif event_type == "message_start":
+                    # Входные токены и статистика кэша приходят в начале потока
+                    stream_usage.update(event.get("message", {}).get("usage") or {})
+                elif event_type == "message_delta":
+                    stream_usage.update(event.get("usage") or {})
+                elif event_type == "error":
+                    raise RuntimeError(event.get("error", {}).get("message", "stream error"))
+                elif event_type == "message_stop":
+                    finished = True
+                    break
+
+        if stream_usage:
+            record_usage(stream_usage, usage)
+        if produced and not finished:
+            # Соединение закрылось без message_stop - ответ обрезан
+            print("[Claude stream ended before message_stop]")
+            if usage is not None:
+                usage["incomplete"] = 1
+
+        if not produced:
+            yield "[No content in Claude response.]"
+    except Exception as e:
+        error_msg = f"[Claude error: {str(e)}]"
+        print(error_msg)
+        # Если часть ответа уже ушла пользователю, не дописываем ошибку в текст,
+        # но сообщаем вызывающему, что ответ неполный
+        if not produced:
+            yield error_msg
+        elif usage is not None:
+            usage["incomplete"] = 1
+
 async def claude_completion(
     messages: List[Dict[str, Any]],
-    system_prompt: Optional[str] = None,
+    system_prompt: Optional[SystemPrompt] = None,
     max_tokens: int = 4000,
     temperature: float = 0.7
 ) -> Union[str, Dict[str, Any]]:
@@ -125,15 +284,17 @@ async def claude_completion(
         if system_prompt:
             data["system"] = system_prompt
         
-        # Выполняем запрос к API
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            return response.json()
+        # Выполняем запрос к API через общий пул соединений
+        client = get_client("anthropic")
+        response = await client.post(
+            "https://api.anthropic.com/v1/messages",
+            headers=headers,
+            json=data
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        record_usage(response_data.get("usage"))
+        return response_data
     except Exception as e:
         error_msg = f"Claude error: {str(e)}"
         print(error_msg)
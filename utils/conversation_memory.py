@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Хранилище контекста разговоров (переживает перезапуски)
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "data/conversation_memory.db")
+MEMORY_MAX_CHATS = int(os.getenv("MEMORY_MAX_CHATS", "1000"))  # Чатов в оперативной памяти
+MEMORY_TTL_SECONDS = float(os.getenv("MEMORY_TTL_SECONDS", str(7 * 24 * 3600)))
+MEMORY_MAX_HISTORY = 5
+
+# Компактная запись истории: (unix-время, сообщение, ответ)
+Turn = Tuple[float, str, str]
+
+
+class ConversationMemory:
+    """
+    Ограниченная память разговоров: LRU по чатам с TTL и записью в SQLite.
+
+    В памяти держится не больше ``max_chats`` чатов; при переполнении
+    вытесняется давно не использованный. Каждое изменение сразу пишется
+    в SQLite, поэтому вытесненный или потерянный при рестарте чат
+    подгружается с диска при следующем обращении. Истории старше ``ttl``
+    секунд считаются устаревшими и удаляются.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_chats: int = MEMORY_MAX_CHATS,
+        ttl: float = MEMORY_TTL_SECONDS,
+        max_history: int = MEMORY_MAX_HISTORY
+    ):
+        self.db_path = db_path or MEMORY_DB_PATH
+        self.max_chats = max(1, max_chats)
+        self.ttl = ttl
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # chat_id -> (время последнего обновления, история)
+        self._entries: "OrderedDict[str, Tuple[float, List[Turn]]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "db_loads": 0, "evictions": 0, "expired": 0}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Открывает базу при первом обращении. Вызывается под _lock."""
+        if self._conn is not None:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    chat_id TEXT PRIMARY KEY,
+                    updated REAL NOT NULL,
+                    history TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated)")
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            print(f"Error opening conversation memory DB: {e}")
+        return self._conn
+
+    def _expired(self, updated: float, now: float) -> bool:
+        return self.ttl > 0 and now - updated > self.ttl
+
+    def _remember(self, chat_id: str, updated: float, history: List[Turn]) -> None:
+        """Кладет чат в LRU и вытесняет лишние. Вызывается под _lock."""
+        self._entries[chat_id] = (updated, history)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _load(self, chat_id: str, now: float) -> Optional[Tuple[float, List[Turn]]]:
+        """Читает историю чата из SQLite. Вызывается под _lock."""
+        conn = self._db()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT updated, history FROM conversations WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        updated, history = row
+        if self._expired(updated, now):
+            conn.execute("DELETE FROM conversations WHERE chat_id = ?", (chat_id,))
+            conn.commit()
+            self._stats["expired"] += 1
+            return None
+        self._stats["db_loads"] += 1
+        return updated, [tuple(turn) for turn in json.loads(history)]
+
+    def _get(self, chat_id: str, now: float) -> Optional[Tuple[float, List[Turn]]]:
+        """Возвращает запись чата из LRU или с диска. Вызывается под _lock."""
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            if not self._expired(entry[0], now):
+                self._entries.move_to_end(chat_id)
+                self._stats["hits"] += 1
+                return entry
+            # Строка в SQLite тоже устарела - _load удалит ее и учтет в expired
+            del self._entries[chat_id]
+
+        self._stats["misses"] += 1
+        try:
+            entry = self._load(chat_id, now)
+        except Exception as e:
+            print(f"Error loading conversation memory for {chat_id}: {e}")
+            entry = None
+        if entry is not None:
+            self._remember(chat_id, *entry)
+        return entry
+
+    def get_history(self, chat_id: str) -> List[Turn]:
+        """
+        Возвращает историю чата (от старых к новым).
+
+        Args:
+            chat_id: ID чата
+
+        Returns:
+            List[Turn]: Записи (время, сообщение, ответ)
+        """
+        if not chat_id:
+            return []
+        with self._lock:
+            entry = self._get(str(chat_id), time.time())
+            return list(entry[1]) if entry else []
+
+    def append(
+        self,
+        chat_id: str,
+        message: str,
+        response: str,
+        max_history: Optional[int] = None
+    ) -> None:
+        """
+        Добавляет пару сообщение-ответ и сохраняет историю в SQLite.
+
+        Args:
+            chat_id: ID чата
+            message: Сообщение пользователя
+            response: Ответ Селесты
+            max_history: Сколько записей хранить (по умолчанию self.max_history)
+        """
+        if not chat_id:
+            return
+        chat_id = str(chat_id)
+        now = time.time()
+        with self._lock:
+            entry = self._get(chat_id, now)
+            history = list(entry[1]) if entry else []
+            history.append((now, message, response))
+            history = history[-(max_history or self.max_history):]
+            self._remember(chat_id, now, history)
+            try:
+                conn = self._db()
+                if conn is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO conversations (chat_id, updated, history) VALUES (?, ?, ?)",
+                        (chat_id, now, json.dumps(history, ensure_ascii=False))
+                    )
+                    conn.commit()
+            except Exception as e:
+                print(f"Error saving conversation memory for {chat_id}: {e}")
+
+    def prune_expired(self) -> int:
+        """
+        Удаляет устаревшие истории из памяти и SQLite.
+
+        Returns:
+            int: Количество удаленных чатов
+        """
+        if self.ttl <= 0:
+            return 0
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for chat_id in [cid for cid, (updated, _) in self._entries.items() if self._expired(updated, now)]:
+                del self._entries[chat_id]
+            try:
+                conn = self._db()
+                if conn is not None:
+                    removed = conn.execute(
+                        "DELETE FROM conversations WHERE updated < ?", (now - self.ttl,)
+                    ).rowcount
+                    conn.commit()
+            except Exception as e:
+                print(f"Error pruning conversation memory: {e}")
+            self._stats["expired"] += removed
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Статистика для /status: попадания, вытеснения и резидентный размер.
+
+        Returns:
+            Dict[str, Any]: Счетчики памяти разговоров
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            resident_turns = sum(len(history) for _, history in self._entries.values())
+            resident_chars = sum(
+                len(message) + len(response)
+                for _, history in self._entries.values()
+                for _, message, response in history
+            )
+            stats["resident_chats"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "resident_turns": resident_turns,
+            "resident_chars": resident_chars,
+            "max_chats": self.max_chats,
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        })
+        return stats
+
+    def close(self) -> None:
+        """Закрывает соединение с базой."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import heapq
+import asyncio
+import inspect
+import functools
+import sqlite3
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Callable, Set
+
+# Отложенные доставки (задержка ответов в группах, паузы между частями)
+DELIVERY_DB_PATH = os.getenv("DELIVERY_DB_PATH", "data/deliveries.db")
+
+Payload = Dict[str, Any]
+Handler = Callable[[Payload], Any]
+Merge = Callable[[Payload, Payload], Payload]
+
+
+class DeliveryScheduler:
+    """
+    Планировщик отложенных доставок на куче по времени срабатывания.
+
+    Вместо корутины, спящей минуты с замыканием и данными запроса, каждая
+    доставка хранится как небольшой JSON-словарь в таблице ожидания и
+    запись (время, номер, ключ) в куче. Одна фоновая задача спит до
+    ближайшего срока и передает сработавшие доставки обработчику своего
+    вида. Доставки с одинаковым ключом можно склеивать (``merge``), и
+    тогда несколько поводов в одной группе дают один ответ. Если задан
+    ``db_path``, ожидающие доставки пишутся в SQLite и восстанавливаются
+    при следующем запуске. Запись в базу идет в отдельном потоке, цикл
+    событий ее не ждет; порядок записей сохраняется.
+
+    Обработчики вызываются в цикле событий и должны возвращаться быстро
+    (например, ставить задачу в очередь диспетчера). Если обработчик
+    возвращает awaitable, доставка считается выполненной только после
+    его завершения: до этого сохраненная запись остается в базе и после
+    перезапуска доставка повторится.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._heap: List[Tuple[float, int, str]] = []
+        # ключ -> (срок, номер записи в куче, вид, данные)
+        self._pending: Dict[str, Tuple[float, int, str, Payload]] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._seq = itertools.count()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Future] = set()
+        self._stats = {"scheduled": 0, "coalesced": 0, "fired": 0, "failed": 0, "restored": 0, "skipped_rows": 0}
+
+    def register(self, kind: str, handler: Handler) -> None:
+        """Регистрирует обработчик для доставок вида ``kind``."""
+        self._handlers[kind] = handler
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        if self._conn is None:
+            try:
+                directory = os.path.dirname(self.db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS deliveries (
+                        key TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        due REAL NOT NULL,
+                        payload TEXT NOT NULL
+                    )
+                """)
+                conn.commit()
+                self._conn = conn
+            except Exception as e:
+                print(f"Error opening delivery scheduler DB: {e}")
+        return self._conn
+
+    def _writer(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delivery-write")
+        return self._executor
+
+    def _defer(self, func: Callable[..., Any], *args: Any) -> None:
+        """Ставит запись в очередь потока записи, не дожидаясь результата."""
+        if self.db_path is None:
+            return
+        self._writer().submit(func, *args)
+
+    def _persist(self, key: str, kind: str, due: float, payload: Payload) -> None:
+        self._defer(self._write_delivery, key, kind, due, json.dumps(payload, ensure_ascii=False))
+
+    def _write_delivery(self, key: str, kind: str, due: float, payload: str) -> None:
+        conn = self._db()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO deliveries (key, kind, due, payload) VALUES (?, ?, ?, ?)",
+                (key, kind, due, payload)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"Error persisting delivery {key}: {e}")
+
+    def _forget(self, key: str, due: Optional[float] = None) -> None:
+        """
+        Удаляет сохраненную доставку. С ``due`` удаляется только запись с
+        этим сроком, чтобы не стереть доставку, запланированную заново с
+        тем же ключом, пока прежняя выполнялась.
+        """
+        self._defer(self._delete_delivery, key, due)
+
+    def _delete_delivery(self, key: str, due: Optional[float]) -> None:
+        conn = self._db()
+        if conn is None:
+            return
+        try:
+            if due is None:
+                conn.execute("DELETE FROM deliveries WHERE key = ?", (key,))
+            else:
+                conn.execute("DELETE FROM deliveries WHERE key = ? AND due = ?", (key, due))
+            conn.commit()
+        except Exception as e:
+            print(f"Error removing delivery {key}: {e}")
+
+    async def flush(self) -> None:
+        """Дожидается записи в базу всех запланированных к этому моменту изменений."""
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, lambda: None)
+
+    def _push(self, key: str, kind: str, due: float, payload: Payload) -> None:
+        seq = next(self._seq)
+        self._pending[key] = (due, seq, kind, payload)
+        heapq.heappush(self._heap, (due, seq, key))
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def schedule(
+        self,
+        kind: str,
+        key: str,
+        delay: float,
+        payload: Payload,
+        merge: Optional[Merge] = None
+    ) -> bool:
+        """
+        Планирует доставку через ``delay`` секунд.
+
+        Если доставка с таким ключом уже ожидает и задан ``merge``, данные
+        склеиваются, а срок остается прежним. Без ``merge`` ожидающая
+        доставка заменяется новой.
+
+        Args:
+            kind: Вид доставки (имя зарегистрированного обработчика)
+            key: Ключ доставки (например, "group:<chat_id>")
+            delay: Задержка в секундах
+            payload: JSON-совместимые данные доставки
+            merge: Функция склейки (старые данные, новые данные) -> данные
+
+        Returns:
+            bool: True если создана новая доставка, False если склеена с ожидающей
+        """
+        existing = self._pending.get(key)
+        if existing is not None and merge is not None:
+            due, seq, _, old_payload = existing
+            payload = merge(old_payload, payload)
+            self._pending[key] = (due, seq, kind, payload)
+            self._persist(key, kind, due, payload)
+            self._stats["coalesced"] += 1
+            return False
+
+        due = time.time() + max(0.0, delay)
+        self._push(key, kind, due, payload)
+        self._persist(key, kind, due, payload)
+        self._stats["scheduled"] += 1
+        return True
+
+    def cancel(self, key: str) -> bool:
+        """Отменяет ожидающую доставку (запись в куче удалится при извлечении)."""
+        if self._pending.pop(key, None) is None:
+            return False
+        self._forget(key)
+        return True
+
+    def _load_rows(self) -> List[Tuple[str, str, float, str]]:
+        conn = self._db()
+        if conn is None:
+            return []
+        try:
+            return conn.execute("SELECT key, kind, due, payload FROM deliveries").fetchall()
+        except Exception as e:
+            print(f"Error restoring deliveries: {e}")
+            return []
+
+    def _restore(self, rows: Optional[List[Tuple[str, str, float, str]]] = None) -> int:
+        """Загружает доставки, сохраненные до перезапуска."""
+        if rows is None:
+            rows = self._load_rows()
+        restored = 0
+        for key, kind, due, payload in rows:
+            if key in self._pending:
+                continue
+            try:
+                data = json.loads(payload)
+                if not isinstance(data, dict):
+                    raise ValueError("payload is not an object")
+                self._push(key, kind, float(due), data)
+            except Exception as e:
+                # Поврежденная запись не должна мешать остальным доставкам
+                self._stats["skipped_rows"] += 1
+                print(f"Skipping unreadable delivery {key}: {e}")
+                continue
+            restored += 1
+        self._stats["restored"] += restored
+        return restored
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """
+        Передает обработчикам все доставки со сроком не позже ``now``.
+
+        Returns:
+            int: Количество сработавших доставок
+        """
+        now = time.time() if now is None else now
+        fired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            if entry is None or entry[1] != seq:
+                continue  # Отмененная или замененная доставка
+            del self._pending[key]
+            due, _, kind, payload = entry
+            handler = self._handlers.get(kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"no handler for delivery kind {kind}")
+                result = handler(payload)
+                self._stats["fired"] += 1
+                fired += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"Error firing delivery {key}: {e}")
+                result = None
+            if inspect.isawaitable(result):
+                future = asyncio.ensure_future(result)
+                self._in_flight.add(future)
+                future.add_done_callback(functools.partial(self._finished, key, due))
+            else:
+                self._forget(key, due)
+        return fired
+
+    def _finished(self, key: str, due: float, future: asyncio.Future) -> None:
+        """Удаляет запись выполненной доставки; прерванная остается до перезапуска."""
+        if future not in self._in_flight:
+            return  # Планировщик уже остановлен, запись повторится после перезапуска
+        self._in_flight.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self._stats["failed"] += 1
+            print(f"Error delivering {key}: {error}")
+        self._forget(key, due)
+
+    async def _run(self) -> None:
+        if self.db_path is not None:
+            loop = asyncio.get_running_loop()
+            self._restore(await loop.run_in_executor(self._writer(), self._load_rows))
+        while True:
+            self._wakeup.clear()
+            self.run_due()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запускает фоновую задачу планировщика (вызывается из цикла событий)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Останавливает планировщик. Ожидающие доставки остаются в базе;
+        выполняющиеся ждем до ``timeout`` секунд, незавершенные повторятся
+        после перезапуска.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wakeup = None
+        if self._in_flight:
+            await asyncio.wait(list(self._in_flight), timeout=timeout)
+            self._in_flight.clear()
+        if self._executor is not None:
+            # Дописываем очередь записи и закрываем соединение в ее же потоке
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(executor, self._close_db)
+            await asyncio.to_thread(executor.shutdown, True)
+
+    def _close_db(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика для /status: ожидающие доставки по видам и счетчики."""
+        by_kind: Dict[str, int] = {}
+        for _, _, kind, _ in self._pending.values():
+            by_kind[kind] = by_kind.get(kind, 0) + 1
+        next_due = min((entry[0] for entry in self._pending.values()), default=None)
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "pending_by_kind": by_kind,
+            "next_due_in": round(next_due - time.time(), 1) if next_due is not None else None,
+            "persistent": self.db_path is not None,
+        }
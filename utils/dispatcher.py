@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Deque, Optional, Tuple, Callable, Awaitable, AsyncIterator
+
+# Ограничения очередей обработки входящих сообщений
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))  # Одновременных вызовов LLM
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "20"))  # Ожидающих задач на один чат
+DISPATCH_MAX_PENDING = int(os.getenv("DISPATCH_MAX_PENDING", "500"))  # Ожидающих задач всего
+WAIT_SAMPLES = 1000  # Сколько последних замеров ожидания хранить для статистики
+
+# Результаты submit
+ACCEPTED = "accepted"
+CHAT_QUEUE_FULL = "chat_queue_full"
+OVERLOADED = "overloaded"
+
+Job = Callable[[], Awaitable[None]]
+
+
+def _summarize(samples: Deque[float]) -> Dict[str, Any]:
+    """Сводка по замерам ожидания (в миллисекундах)."""
+    if not samples:
+        return {"count": 0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class ChatDispatcher:
+    """
+    Диспетчер входящих сообщений.
+
+    Для каждого chat_id держит упорядоченную очередь задач и не больше
+    одного обработчика, поэтому ответы внутри чата не перемешиваются.
+    Обработчик чата создается при первой задаче и завершается, когда
+    очередь пуста. Вызовы LLM из всех чатов ограничены общим семафором
+    (``llm_slot``). Переполненные очереди не растут: новая задача
+    отклоняется, а вызывающий код решает, как сообщить об отказе.
+
+    Чат можно придержать (``hold``), пока отложенные части предыдущего
+    ответа еще не отправлены: обычные задачи ждут ``release``, а срочные
+    (``urgent=True``, сами части) выполняются вне очереди и по порядку.
+    Корутина на время удержания не занята - очередь просто не разбирается.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue_per_chat: int = CHAT_QUEUE_MAX,
+        max_pending: int = DISPATCH_MAX_PENDING
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_per_chat = max(1, max_queue_per_chat)
+        self.max_pending = max(1, max_pending)
+        self._queues: Dict[str, Deque[Tuple[float, Job, bool]]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._holds: Dict[str, asyncio.TimerHandle] = {}
+        self._pending = 0
+        self._in_flight = 0
+        self._semaphore: Optional[Tuple[asyncio.Semaphore, asyncio.AbstractEventLoop]] = None
+        self._queue_waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._llm_waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {
+            "accepted": 0,
+            "completed": 0,
+            "failed": 0,
+            "shed_chat_full": 0,
+            "shed_overloaded": 0,
+            "max_pending_seen": 0,
+        }
+
+    def submit(self, chat_id: str, job: Job, urgent: bool = False) -> str:
+        """
+        Ставит задачу в очередь чата. Вызывается из цикла событий.
+
+        Args:
+            chat_id: ID чата
+            job: Корутинная функция без аргументов
+            urgent: Поставить перед обычными задачами и выполнить, даже
+                если чат придержан (продолжение уже начатого ответа)
+
+        Returns:
+            str: ACCEPTED, CHAT_QUEUE_FULL или OVERLOADED
+        """
+        chat_id = str(chat_id)
+        if self._pending >= self.max_pending:
+            self._stats["shed_overloaded"] += 1
+            return OVERLOADED
+        queue = self._queues.setdefault(chat_id, deque())
+        if len(queue) >= self.max_queue_per_chat:
+            self._stats["shed_chat_full"] += 1
+            return CHAT_QUEUE_FULL
+
+        item = (time.monotonic(), job, urgent)
+        if urgent:
+            # После уже ожидающих срочных задач, но перед обычными
+            position = next((i for i, queued in enumerate(queue) if not queued[2]), len(queue))
+            queue.insert(position, item)
+        else:
+            queue.append(item)
+        self._pending += 1
+        self._stats["accepted"] += 1
+        self._stats["max_pending_seen"] = max(self._stats["max_pending_seen"], self._pending)
+        self._wake(chat_id)
+        return ACCEPTED
+
+    def _runnable(self, chat_id: str) -> bool:
+        queue = self._queues.get(chat_id)
+        return bool(queue) and (chat_id not in self._holds or queue[0][2])
+
+    def _wake(self, chat_id: str) -> None:
+        """Запускает обработчик чата, если его нет и есть что выполнять."""
+        if chat_id not in self._workers and self._runnable(chat_id):
+            self._workers[chat_id] = asyncio.get_running_loop().create_task(self._drain(chat_id))
+
+    def hold(self, chat_id: str, timeout: float) -> None:
+        """
+        Придерживает обычные задачи чата до ``release`` (не дольше ``timeout``
+        секунд - на случай, если последняя часть так и не будет доставлена).
+        """
+        chat_id = str(chat_id)
+        previous = self._holds.pop(chat_id, None)
+        if previous is not None:
+            previous.cancel()
+        self._holds[chat_id] = asyncio.get_running_loop().call_later(timeout, self.release, chat_id)
+
+    def release(self, chat_id: str) -> None:
+        """Снимает удержание чата и продолжает разбор его очереди."""
+        chat_id = str(chat_id)
+        handle = self._holds.pop(chat_id, None)
+        if handle is None:
+            return
+        handle.cancel()
+        self._wake(chat_id)
+
+    async def _drain(self, chat_id: str) -> None:
+        """Выполняет задачи чата по порядку, пока очередь не опустеет или чат не придержан."""
+        queue = self._queues[chat_id]
+        try:
+            while self._runnable(chat_id):
+                enqueued_at, job, _urgent = queue.popleft()
+                self._pending -= 1
+                self._queue_waits.append(time.monotonic() - enqueued_at)
+                try:
+                    await job()
+                    self._stats["completed"] += 1
+                except Exception as e:
+                    self._stats["failed"] += 1
+                    print(f"Error in dispatched task for chat {chat_id}: {e}")
+        finally:
+            self._workers.pop(chat_id, None)
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    def _llm_semaphore(self) -> asyncio.Semaphore:
+        """Семафор привязан к циклу событий, поэтому при смене цикла создается новый."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[1] is not loop:
+            self._semaphore = (asyncio.Semaphore(self.max_concurrency), loop)
+        return self._semaphore[0]
+
+    @asynccontextmanager
+    async def llm_slot(self) -> AsyncIterator[None]:
+        """Занимает один из max_concurrency слотов на время вызова LLM."""
+        started = time.monotonic()
+        async with self._llm_semaphore():
+            self._llm_waits.append(time.monotonic() - started)
+            self._in_flight += 1
+            try:
+                yield
+            finally:
+                self._in_flight -= 1
+
+    def queue_length(self, chat_id: str) -> int:
+        """Количество ожидающих задач в очереди чата."""
+        queue = self._queues.get(str(chat_id))
+        return len(queue) if queue else 0
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """
+        Статистика для мониторинга.
+
+        Args:
+            top: Сколько самых длинных очередей показать
+
+        Returns:
+            Dict[str, Any]: Длины очередей, ожидание в очереди и перед LLM, отказы
+        """
+        longest = sorted(
+            ((chat_id, len(queue)) for chat_id, queue in self._queues.items() if queue),
+            key=lambda item: item[1],
+            reverse=True,
+        )[:top]
+        return {
+            **self._stats,
+            "pending": self._pending,
+            "active_chats": len(self._workers),
+            "held_chats": len(self._holds),
+            "llm_in_flight": self._in_flight,
+            "llm_max_concurrency": self.max_concurrency,
+            "longest_queues": dict(longest),
+            "queue_wait": _summarize(self._queue_waits),
+            "llm_wait": _summarize(self._llm_waits),
+        }
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """Дает очередям завершиться за timeout секунд, затем отменяет обработчики."""
+        # Части ответов доставятся после перезапуска; ждущие задачи - сейчас
+        for chat_id in list(self._holds):
+            self.release(chat_id)
+        workers = list(self._workers.values())
+        if not workers:
+            return
+        _, still_running = await asyncio.wait(workers, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            print(f"Dispatcher shutdown: cancelled {len(still_running)} chat queues, {self._pending} tasks dropped")
@@ -0,0 +1,153 @@
+import asyncio
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import httpx
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - optional dependency
+    HTTP2_AVAILABLE = False
+
+# Профили исходящих соединений: один пул на каждый внешний сервис.
+# Лимиты httpx действуют на пул, поэтому отдельный клиент на хост
+# дает per-host ограничение соединений и собственные тайм-ауты.
+CLIENT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "telegram": {
+        "timeout": httpx.Timeout(30.0, connect=10.0),
+        "max_connections": 20,
+        "max_keepalive": 10,
+    },
+    "anthropic": {
+        "timeout": httpx.Timeout(60.0, connect=10.0),
+        "max_connections": 10,
+        "max_keepalive": 5,
+    },
+    "openai": {
+        "timeout": httpx.Timeout(60.0, connect=10.0),
+        "max_connections": 10,
+        "max_keepalive": 5,
+    },
+    # Произвольные сайты (URL из сообщений, маяк core.json)
+    "web": {
+        "timeout": httpx.Timeout(15.0, connect=10.0),
+        "max_connections": 20,
+        "max_keepalive": 5,
+        "follow_redirects": True,
+    },
+}
+KEEPALIVE_EXPIRY = 30.0  # секунд простоя до закрытия keep-alive соединения
+
+# Реестр клиентов приложения: имя профиля -> (клиент, цикл событий)
+_clients: Dict[str, Tuple[httpx.AsyncClient, Optional[asyncio.AbstractEventLoop]]] = {}
+# Замененные клиенты, которые не удалось закрыть сразу (закрываются в shutdown)
+_retired: List[Tuple[str, httpx.AsyncClient]] = []
+_closing: Set["asyncio.Future[None]"] = set()
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _create_client(name: str) -> httpx.AsyncClient:
+    """Создает пул соединений для профиля."""
+    profile = CLIENT_PROFILES.get(name, CLIENT_PROFILES["web"])
+    limits = httpx.Limits(
+        max_connections=profile["max_connections"],
+        max_keepalive_connections=profile["max_keepalive"],
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        timeout=profile["timeout"],
+        limits=limits,
+        http2=HTTP2_AVAILABLE,
+        follow_redirects=profile.get("follow_redirects", False),
+    )
+
+
+async def _close_client(name: str, client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception as e:
+        print(f"Error closing HTTP client {name}: {e}")
+
+
+def _retire(
+    name: str,
+    client: httpx.AsyncClient,
+    client_loop: Optional[asyncio.AbstractEventLoop],
+    loop: Optional[asyncio.AbstractEventLoop]
+) -> None:
+    """
+    Закрывает замененный клиент, чтобы не терять его пул соединений:
+    в его собственном цикле, если тот еще работает, иначе в текущем;
+    без цикла клиент откладывается до shutdown.
+    """
+    if client.is_closed:
+        return
+    if client_loop is not None and client_loop is not loop and client_loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(_close_client(name, client), client_loop)
+    elif loop is not None:
+        future = loop.create_task(_close_client(name, client))
+    else:
+        _retired.append((name, client))
+        return
+    _closing.add(future)
+    future.add_done_callback(_closing.discard)
+
+
+def get_client(name: str = "web") -> httpx.AsyncClient:
+    """
+    Возвращает общий клиент для профиля.
+
+    Обычно клиенты открываются в startup-хуке FastAPI. Если этого не
+    произошло (скрипты, тесты), клиент создается лениво. Клиент привязан
+    к циклу событий, поэтому при смене цикла создается новый.
+
+    Args:
+        name: Имя профиля из CLIENT_PROFILES
+
+    Returns:
+        httpx.AsyncClient: Общий клиент с keep-alive пулом
+    """
+    loop = _current_loop()
+    entry = _clients.get(name)
+    if entry is not None:
+        client, client_loop = entry
+        if not client.is_closed and (client_loop is None or client_loop is loop):
+            return client
+        _retire(name, client, client_loop, loop)
+
+    client = _create_client(name)
+    _clients[name] = (client, loop)
+    return client
+
+
+async def startup() -> None:
+    """Открывает клиенты всех профилей (вызывается при старте приложения)."""
+    for name in CLIENT_PROFILES:
+        get_client(name)
+    print(f"HTTP client pools ready: {', '.join(CLIENT_PROFILES)} (HTTP/2: {HTTP2_AVAILABLE})")
+
+
+async def shutdown() -> None:
+    """Закрывает все клиенты реестра (вызывается при остановке приложения)."""
+    loop = _current_loop()
+    for name, (client, client_loop) in list(_clients.items()):
+        if client_loop is None or client_loop is loop:
+            await _close_client(name, client)
+        else:
+            # Клиент другого цикла закрывается там же, где и замененные
+            _retire(name, client, client_loop, loop)
+    _clients.clear()
+
+    retired = list(_retired)
+    _retired.clear()
+    for name, client in retired:
+        await _close_client(name, client)
+    pending = [f for f in _closing if isinstance(f, asyncio.Task) and f.get_loop() is loop]
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -3,6 +3,8 @@ import httpx
 import asyncio
 from typing import Optional
 
+from utils.http_client import get_client
+
 # Поддерживаемые модели и размеры
 DALL_E_3_MODELS = ["dall-e-3"]
 DALL_E_2_MODELS = ["dall-e-2"]
@@ -110,23 +112,23 @@ async def generate_image_async(
     # Пробуем генерировать изображение с повторными попытками
     for attempt in range(MAX_RETRIES):
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://api.openai.com/v1/images/generations",
-                    headers=headers,
-                    json=data
-                )
-                response.raise_for_status()
-                response_data = response.json()
-                
-                # Извлекаем URL изображения
-                if "data" in response_data and response_data["data"]:
-                    url = response_data["data"][0].get("url", "")
-                    if url:
-                        return f"{emoji} {url}"
-                
-                # Если URL не найден
-                return f"{IMAGE_EMOJI['error']} [Image generation error: No image URL in response.]"
+            client = get_client("openai")
+            response = await client.post(
+                "https://api.openai.com/v1/images/generations",
+                headers=headers,
+                json=data
+            )
+            response.raise_for_status()
+            response_data = response.json()
+            
+            # Извлекаем URL изображения
+            if "data" in response_data and response_data["data"]:
+                url = response_data["data"][0].get("url", "")
+                if url:
+                    return f"{emoji} {url}"
+            
+            # Если URL не найден
+            return f"{IMAGE_EMOJI['error']} [Image generation error: No image URL in response.]"
             
         except httpx.HTTPStatusError as e:
             if attempt < MAX_RETRIES - 1:
@@ -141,19 +143,19 @@ async def generate_image_async(
                         if size not in SIZE_MAP["dall-e-2"]:
                             data["size"] = "1024x1024"
                             
-                        async with httpx.AsyncClient(timeout=60.0) as client:
-                            response = await client.post(
-                                "https://api.openai.com/v1/images/generations",
-                                headers=headers,
-                                json=data
-                            )
-                            response.raise_for_status()
-                            response_data = response.json()
-                            
-                            if "data" in response_data and response_data["data"]:
-                                url = response_data["data"][0].get("url", "")
-                                if url:
-                                    return f"{emoji} {url} (DALL-E 2 fallback)"
+                        client = get_client("openai")
+                        response = await client.post(
+                            "https://api.openai.com/v1/images/generations",
+                            headers=headers,
+                            json=data
+                        )
+                        response.raise_for_status()
+                        response_data = response.json()
+                        
+                        if "data" in response_data and response_data["data"]:
+                            url = response_data["data"][0].get("url", "")
+                            if url:
+                                return f"{emoji} {url} (DALL-E 2 fallback)"
                     except Exception as e2:
                         return f"{IMAGE_EMOJI['error']} [DALL-E fallback error: {str(e2)}]"
                 
@@ -1,73 +1,194 @@
 import os
 import json
+import gzip
+import glob
+import logging
+import shutil
 import asyncio
+import threading
 import time
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, Iterator
+
+from utils import journal_store
+
+logger = logging.getLogger("journal")
 
 # Пути к журналам
-LOG_PATH = "data/journal.json"
+LOG_PATH = "data/journal.jsonl"  # Журнал событий: одна JSON-строка на событие
+LEGACY_LOG_PATH = "data/journal.json"  # Старый формат (JSON-массив), импортируется однократно
 WILDERNESS_PATH = "data/wilderness.md"
 ARCHIVE_PATH = "data/archives"
-MAX_LOG_SIZE = 1000  # Максимальное количество записей в журнале
-ROTATION_SIZE = 500  # Количество записей для архивации
+MAX_LOG_BYTES = int(os.getenv("JOURNAL_MAX_BYTES", str(5 * 1024 * 1024)))  # Ротация по размеру
+TAIL_BLOCK_SIZE = 64 * 1024  # Размер блока для чтения журнала с конца
+
+# Политика fsync: "always" - после каждой записи, "interval" - не чаще
+# FSYNC_INTERVAL секунд, "never" - полагаемся на ОС
+FSYNC_POLICY = os.getenv("JOURNAL_FSYNC", "interval")
+FSYNC_INTERVAL = 1.0
+# Дублировать события в индексированное SQLite-хранилище для запросов
+INDEX_JOURNAL = os.getenv("JOURNAL_INDEX", "1").lower() not in ("0", "false", "no")
+
+# Фоновый писатель: очередь событий и пакетная запись
+WRITER_QUEUE_SIZE = 10_000  # Максимум событий в очереди, сверх лимита события отбрасываются
+WRITER_BATCH_SIZE = 200  # Запись пакета при накоплении стольких событий
+WRITER_FLUSH_INTERVAL = 0.5  # ...или по истечении этого времени (секунды)
+
+_write_lock = threading.Lock()
+_last_fsync = 0.0
+_legacy_checked = False
 
 def ensure_directories() -> None:
     """Создает необходимые директории, если они не существуют."""
     os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
     os.makedirs(ARCHIVE_PATH, exist_ok=True)
 
+def _migrate_legacy_journal() -> None:
+    """Однократно переносит записи из старого journal.json в JSONL-журнал."""
+    global _legacy_checked
+    if _legacy_checked:
+        return
+    _legacy_checked = True
+
+    if not os.path.isfile(LEGACY_LOG_PATH) or os.path.isfile(LOG_PATH):
+        return
+    try:
+        with open(LEGACY_LOG_PATH, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return
+    if not isinstance(legacy, list) or not legacy:
+        return
+
+    with open(LOG_PATH, "a", encoding="utf-8") as f:
+        for entry in legacy:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    # Переименовываем, чтобы не импортировать повторно после ротации
+    os.replace(LEGACY_LOG_PATH, f"{LEGACY_LOG_PATH}.migrated")
+    print(f"Journal: migrated {len(legacy)} entries from {LEGACY_LOG_PATH}")
+
+def _ensure_migrated() -> None:
+    """Выполняет миграцию старого журнала под блокировкой записи."""
+    if _legacy_checked:
+        return
+    with _write_lock:
+        _migrate_legacy_journal()
+
+def _compress_rotated(rotated_path: str) -> bool:
+    """
+    Сжимает отложенный в сторону журнал в архив и удаляет исходник.
+    Имя архива берется из метки в имени файла, поэтому повторная попытка
+    не перезапишет уже созданный архив другого журнала.
+    """
+    name = os.path.basename(rotated_path)
+    stamp = name[len(os.path.basename(LOG_PATH)) + 1:-len(".rotating")]
+    if not stamp:  # Файл старого формата без метки
+        stamp = datetime.fromtimestamp(os.path.getmtime(rotated_path)).strftime("%Y%m%d_%H%M%S_%f")
+    archive_path = os.path.join(ARCHIVE_PATH, f"journal_{stamp}.jsonl.gz")
+    try:
+        with open(rotated_path, "rb") as src, gzip.open(archive_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated_path)
+        return True
+    except Exception as e:
+        logger.error("Error compressing journal archive %s: %s", rotated_path, e)
+        return False
+
+def _rotate_if_needed() -> None:
+    """Переносит журнал в сжатый архив, если он превысил MAX_LOG_BYTES."""
+    try:
+        if os.path.getsize(LOG_PATH) < MAX_LOG_BYTES:
+            return
+    except OSError:
+        return
+
+    # Сначала повторяем сжатие журналов, оставшихся после прошлых сбоев
+    leftovers = glob.glob(f"{glob.escape(LOG_PATH)}.*rotating")
+    for leftover in sorted(leftovers):
+        _compress_rotated(leftover)
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    rotated_path = f"{LOG_PATH}.{stamp}.rotating"
+    os.replace(LOG_PATH, rotated_path)
+    _compress_rotated(rotated_path)
+
+def _append_lines(lines: List[str]) -> None:
+    """
+    Дописывает готовые JSON-строки в журнал одним вызовом write.
+    Вызывается под _write_lock.
+    """
+    global _last_fsync
+    ensure_directories()
+    _migrate_legacy_journal()
+
+    data = "".join(lines).encode("utf-8")
+    fd = os.open(LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, data)
+        now = time.monotonic()
+        if FSYNC_POLICY == "always" or (
+            FSYNC_POLICY == "interval" and now - _last_fsync >= FSYNC_INTERVAL
+        ):
+            os.fsync(fd)
+            _last_fsync = now
+    finally:
+        os.close(fd)
+
+    _rotate_if_needed()
+
+def make_entry(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Добавляет к событию временные метки журнала."""
+    return {
+        "ts": datetime.now().isoformat(),
+        "unix_time": int(time.time()),
+        **event
+    }
+
 def log_event(event: Dict[str, Any]) -> bool:
     """
-    Добавляет событие (dict) с временной меткой в JSON-файл журнала.
+    Добавляет событие (dict) с временной меткой в журнал.
+    Запись - одна строка JSONL, дописываемая в конец файла (O(1) на событие).
+    Если запущен фоновый писатель, событие только ставится в очередь и
+    вызывающий код не ждет диска.
     
     Args:
         event: Словарь с данными события
         
+    Returns:
+        bool: True если запись успешна (или событие принято в очередь),
+            False если произошла ошибка или очередь переполнена
+    """
+    entry = make_entry(event)
+    if _writer is not None and _writer.running:
+        return _writer.submit(entry)
+    return write_entries([entry])
+
+def write_entries(entries: List[Dict[str, Any]]) -> bool:
+    """
+    Дописывает в журнал уже подготовленные записи (с временными метками).
+
+    Args:
+        entries: Записи журнала
+
     Returns:
         bool: True если запись успешна, False если произошла ошибка
     """
-    try:
-        # Убеждаемся, что директории существуют
-        ensure_directories()
-        
-        # Создаем файл, если он не существует
-        if not os.path.isfile(LOG_PATH):
-            with open(LOG_PATH, "w", encoding="utf-8") as f:
-                f.write("[]")
-        
-        # Читаем существующие записи
-        with open(LOG_PATH, "r", encoding="utf-8") as f:
-            try:
-                log = json.load(f)
-                if not isinstance(log, list):
-                    log = []
-            except json.JSONDecodeError:
-                # Если файл поврежден, создаем новый журнал
-                log = []
-        
-        # Добавляем новую запись с временной меткой
-        log.append({
-            "ts": datetime.now().isoformat(), 
-            "unix_time": int(time.time()),
-            **event
-        })
-        
-        # Проверяем размер журнала и архивируем при необходимости
-        if len(log) > MAX_LOG_SIZE:
-            archive_logs(log[:-ROTATION_SIZE])
-            log = log[-ROTATION_SIZE:]
-        
-        # Записываем обновленный журнал
-        with open(LOG_PATH, "w", encoding="utf-8") as f:
-            json.dump(log, f, ensure_ascii=False, indent=2)
-        
+    if not entries:
         return True
+    try:
+        lines = [json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in entries]
+        with _write_lock:
+            _append_lines(lines)
     except Exception as e:
         # Логируем ошибку в консоль, но не возбуждаем исключение
         print(f"Error writing to journal: {e}")
         return False
 
+    # Индекс - вспомогательная копия, его ошибки не влияют на результат записи
+    if INDEX_JOURNAL:
+        journal_store.insert_entries(entries)
+    return True
+
 def wilderness_log(fragment: str) -> bool:
     """
     Добавляет текстовый фрагмент в журнал wilderness (файл Markdown).
@@ -114,28 +235,72 @@ def archive_logs(entries: List[Dict[str, Any]]) -> bool:
         print(f"Error archiving logs: {e}")
         return False
 
+def iter_journal_reverse(path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Читает записи журнала с конца файла блоками (от новых к старым).
+    Поврежденные строки пропускаются.
+
+    Args:
+        path: Путь к журналу (по умолчанию LOG_PATH)
+
+    Yields:
+        dict: Записи журнала, начиная с самой новой
+    """
+    path = path or LOG_PATH
+    if not os.path.isfile(path):
+        return
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step) + remainder
+            lines = block.split(b"\n")
+            # Первая строка блока может быть неполной - дочитаем её со следующим блоком
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                entry = _parse_line(line)
+                if entry is not None:
+                    yield entry
+        entry = _parse_line(remainder)
+        if entry is not None:
+            yield entry
+
+def _parse_line(line: bytes) -> Optional[Dict[str, Any]]:
+    """Разбирает одну строку JSONL, возвращает None для пустых и поврежденных."""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        entry = json.loads(line.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    return entry if isinstance(entry, dict) else None
+
 def read_journal(limit: int = 100) -> List[Dict[str, Any]]:
     """
     Читает последние записи из журнала.
+    Файл читается с конца, поэтому стоимость зависит от limit, а не от размера журнала.
     
     Args:
-        limit: Максимальное количество записей для чтения
+        limit: Максимальное количество записей для чтения (0 - все записи)
         
     Returns:
-        list: Список записей журнала
+        list: Список записей журнала в хронологическом порядке
     """
     try:
-        if not os.path.isfile(LOG_PATH):
-            return []
-        
-        with open(LOG_PATH, "r", encoding="utf-8") as f:
-            try:
-                log = json.load(f)
-                if not isinstance(log, list):
-                    return []
-                return log[-limit:] if limit > 0 else log
-            except json.JSONDecodeError:
-                return []
+        _ensure_migrated()
+        entries = []
+        for entry in iter_journal_reverse():
+            entries.append(entry)
+            if limit > 0 and len(entries) >= limit:
+                break
+        entries.reverse()
+        return entries
     except Exception as e:
         print(f"Error reading journal: {e}")
         return []
@@ -176,6 +341,8 @@ async def log_event_async(event: Dict[str, Any]) -> bool:
     Returns:
         bool: True если запись успешна, False если произошла ошибка
     """
+    if _writer is not None and _writer.running:
+        return _writer.submit(make_entry(event))
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(None, log_event, event)
 
@@ -199,6 +366,8 @@ def filter_logs(
 ) -> List[Dict[str, Any]]:
     """
     Фильтрует записи журнала по типу события и временному диапазону.
+    Журнал читается с конца и чтение прекращается, как только записи
+    становятся старше start_time.
     
     Args:
         event_type: Тип события для фильтрации
@@ -208,7 +377,6 @@ def filter_logs(
     Returns:
         list: Список отфильтрованных записей
     """
-    logs = read_journal(0)  # Читаем все записи
     filtered = []
     
     # Преобразуем даты в строки ISO, если они являются объектами datetime
@@ -217,17 +385,179 @@ def filter_logs(
     if isinstance(end_time, datetime):
         end_time = end_time.isoformat()
     
-    for entry in logs:
-        # Фильтрация по типу
-        if event_type and entry.get("type") != event_type:
-            continue
-            
-        # Фильтрация по времени
-        if start_time and entry.get("ts", "") < start_time:
-            continue
-        if end_time and entry.get("ts", "") > end_time:
-            continue
-            
-        filtered.append(entry)
+    try:
+        _ensure_migrated()
+        for entry in iter_journal_reverse():
+            ts = entry.get("ts", "")
+            # Записи идут в хронологическом порядке - дальше только более старые
+            if start_time and ts < start_time:
+                break
+            if end_time and ts > end_time:
+                continue
+                
+            # Фильтрация по типу
+            if event_type and entry.get("type") != event_type:
+                continue
+                
+            filtered.append(entry)
+    except Exception as e:
+        print(f"Error filtering journal: {e}")
     
+    filtered.reverse()
     return filtered
+
+
+class JournalWriter:
+    """
+    Фоновый писатель журнала.
+
+    События принимаются без ожидания в ограниченную очередь и
+    записываются пакетами в пуле потоков, когда набирается
+    ``batch_size`` событий или проходит ``flush_interval`` секунд.
+    При переполнении очереди событие отбрасывается и учитывается в
+    счетчике ``dropped``.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        max_queue: int = WRITER_QUEUE_SIZE,
+        batch_size: int = WRITER_BATCH_SIZE,
+        flush_interval: float = WRITER_FLUSH_INTERVAL
+    ):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.running = False
+        self.accepted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.max_depth = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Запускает фоновую задачу в текущем цикле событий."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = self._loop.create_task(self._run())
+        self.running = True
+
+    def submit(self, entry: Dict[str, Any]) -> bool:
+        """
+        Принимает запись без блокировки. Безопасно вызывать из других потоков.
+
+        Returns:
+            bool: True если запись принята, False если очередь переполнена
+        """
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+
+        if not in_loop:
+            # Очередь asyncio не потокобезопасна - передаем запись в цикл писателя
+            self._loop.call_soon_threadsafe(self._enqueue, entry)
+            return True
+        return self._enqueue(entry)
+
+    def _enqueue(self, entry: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        ok = await asyncio.get_running_loop().run_in_executor(None, write_entries, batch)
+        self.batches += 1
+        if ok:
+            self.written += len(batch)
+        else:
+            self.failed_batches += 1
+
+    async def stop(self) -> None:
+        """Останавливает писатель, предварительно записав все события из очереди."""
+        if not self.running:
+            return
+        self.running = False
+        # Метка остановки встает в очередь после уже принятых событий
+        await self._queue.put(self._STOP)
+        try:
+            await self._task
+        except Exception as e:
+            print(f"Journal writer stopped with error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает счетчики писателя для мониторинга."""
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_depth,
+            "queue_capacity": self.max_queue,
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+        }
+
+_writer: Optional[JournalWriter] = None
+
+def start_writer() -> JournalWriter:
+    """
+    Запускает фоновый писатель журнала (вызывается при старте приложения).
+
+    Returns:
+        JournalWriter: Запущенный писатель
+    """
+    global _writer
+    if _writer is None or not _writer.running:
+        _writer = JournalWriter()
+        _writer.start()
+    return _writer
+
+async def stop_writer() -> None:
+    """Дописывает очередь и останавливает фоновый писатель (при остановке приложения)."""
+    if _writer is not None:
+        await _writer.stop()
+
+def writer_stats() -> Dict[str, Any]:
+    """Возвращает счетчики фонового писателя (пустые, если он не запущен)."""
+    if _writer is None:
+        return {"running": False, "queue_depth": 0, "dropped": 0}
+    return _writer.stats()
@@ -0,0 +1,374 @@
+import os
+import glob
+import gzip
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Union, Iterable, Iterator
+
+# Индексированное хранилище журнала (копия событий для запросов)
+JOURNAL_DB_PATH = "data/journal.db"
+ARCHIVE_PATH = "data/archives"
+IMPORT_SOURCES = [
+    "data/journal.json",
+    "data/journal.json.migrated",
+    "data/archives/*.json",
+    "data/archives/*.jsonl.gz",
+    "data/journal.jsonl",
+]
+MAX_PAGE_SIZE = 500
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_local = threading.local()
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(JOURNAL_DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _writer_conn() -> sqlite3.Connection:
+    """
+    Возвращает соединение для записи, создавая базу при первом обращении.
+    Вызывается под _lock.
+    """
+    global _conn
+    if _conn is not None:
+        return _conn
+
+    os.makedirs(os.path.dirname(JOURNAL_DB_PATH), exist_ok=True)
+    conn = _connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL UNIQUE,
+            ts TEXT,
+            unix_time INTEGER NOT NULL,
+            type TEXT,
+            chat_id TEXT,
+            data TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_time ON events(unix_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type_time ON events(type, unix_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_chat_time ON events(chat_id, unix_time)")
+    # Прогресс импорта файлов: до какого байта файл уже в индексе
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS imports (
+            path TEXT PRIMARY KEY,
+            inode INTEGER NOT NULL,
+            offset INTEGER NOT NULL,
+            imported_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    _conn = conn
+    return conn
+
+def _reader_conn() -> Optional[sqlite3.Connection]:
+    """Соединение для чтения, по одному на поток (WAL не блокирует читателей)."""
+    if not os.path.isfile(JOURNAL_DB_PATH):
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != JOURNAL_DB_PATH:
+        with _lock:
+            _writer_conn()  # гарантируем наличие схемы
+        conn = _connect()
+        _local.conn = conn
+        _local.path = JOURNAL_DB_PATH
+    return conn
+
+def _to_unix(value: Union[str, int, float, datetime, None]) -> Optional[float]:
+    """Преобразует unix-время, ISO-строку или datetime в unix-время."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def _row_for(entry: Dict[str, Any]) -> Optional[tuple]:
+    """Готовит строку таблицы events из записи журнала."""
+    if not isinstance(entry, dict):
+        return None
+    data = json.dumps(entry, ensure_ascii=False, sort_keys=True, default=str)
+    unix_time = entry.get("unix_time")
+    if unix_time is None:
+        try:
+            unix_time = _to_unix(entry.get("ts"))
+        except ValueError:
+            unix_time = None
+    chat_id = entry.get("chat_id")
+    return (
+        hashlib.sha256(data.encode("utf-8")).hexdigest(),
+        entry.get("ts"),
+        int(unix_time or 0),
+        entry.get("type"),
+        str(chat_id) if chat_id is not None else None,
+        data,
+    )
+
+def _insert(entries: Iterable[Dict[str, Any]], source: Optional[Tuple[str, int, int]] = None) -> int:
+    """
+    Вставляет записи и, если задан source, отметку прогресса импорта
+    (путь, inode, смещение) одной транзакцией. Ошибки пробрасываются.
+    """
+    rows = [row for row in (_row_for(e) for e in entries) if row is not None]
+    if not rows and source is None:
+        return 0
+    with _lock:
+        conn = _writer_conn()
+        try:
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT OR IGNORE INTO events (fingerprint, ts, unix_time, type, chat_id, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            added = conn.total_changes - before
+            if source is not None:
+                conn.execute("""
+                    INSERT OR REPLACE INTO imports (path, inode, offset, imported_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, source)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return added
+
+def insert_entries(entries: Iterable[Dict[str, Any]]) -> int:
+    """
+    Добавляет записи журнала в индекс. Повторная вставка той же записи
+    игнорируется (по отпечатку содержимого).
+
+    Args:
+        entries: Записи журнала
+
+    Returns:
+        int: Количество добавленных строк
+    """
+    try:
+        return _insert(entries)
+    except Exception as e:
+        print(f"Error indexing journal entries: {e}")
+        return 0
+
+def _is_jsonl(path: str) -> bool:
+    return not (path.endswith(".gz") or path.endswith(".json") or path.endswith(".json.migrated"))
+
+def _read_source(path: str) -> Iterator[Dict[str, Any]]:
+    """Читает записи из JSON-массива, JSONL или сжатого JSONL."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        if path.endswith(".json") or path.endswith(".json.migrated"):
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                return
+            if isinstance(data, list):
+                yield from (e for e in data if isinstance(e, dict))
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict):
+                yield entry
+
+def _read_jsonl_from(path: str, offset: int) -> Iterator[Tuple[Optional[Dict[str, Any]], int]]:
+    """
+    Читает JSONL начиная с байта offset. Отдает пары (запись, смещение
+    после нее); недописанная последняя строка не читается.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                return
+            offset += len(raw)
+            try:
+                entry = json.loads(raw)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                entry = None
+            yield (entry if isinstance(entry, dict) else None), offset
+
+def _import_progress(path: str) -> Optional[Tuple[int, int]]:
+    """Возвращает (inode, смещение) последнего импорта файла."""
+    conn = _reader_conn()
+    if conn is None:
+        return None
+    return conn.execute("SELECT inode, offset FROM imports WHERE path = ?", (path,)).fetchone()
+
+def _import_file(path: str, batch_size: int) -> int:
+    """
+    Импортирует один файл, продолжая с отмеченного места. Сжатые архивы и
+    JSON-массивы импортируются целиком и отмечаются по размеру; текущий
+    JSONL дочитывается от сохраненного смещения, пока inode тот же.
+    """
+    stat = os.stat(path)
+    progress = _import_progress(path)
+    if not _is_jsonl(path):
+        if progress == (stat.st_ino, stat.st_size):
+            return 0
+        entries = list(_read_source(path))
+        imported = 0
+        for start in range(0, len(entries), batch_size):
+            imported += _insert(entries[start:start + batch_size])
+        _insert([], source=(path, stat.st_ino, stat.st_size))
+        return imported
+
+    offset = 0
+    if progress is not None and progress[0] == stat.st_ino and progress[1] <= stat.st_size:
+        offset = progress[1]
+    imported = 0
+    batch = []
+    for entry, offset in _read_jsonl_from(path, offset):
+        if entry is not None:
+            batch.append(entry)
+        if len(batch) >= batch_size:
+            imported += _insert(batch, source=(path, stat.st_ino, offset))
+            batch = []
+    imported += _insert(batch, source=(path, stat.st_ino, offset))
+    return imported
+
+def import_journal_files(patterns: Optional[List[str]] = None, batch_size: int = 1000) -> int:
+    """
+    Импортирует существующие журналы (journal.json, архивы, текущий JSONL) в индекс.
+    Для каждого файла в таблице imports хранится, до какого места он уже
+    импортирован, поэтому повторный вызов дочитывает только новое, а
+    прерванный импорт продолжается. Дубликаты отсекаются по отпечатку записи.
+
+    Args:
+        patterns: Glob-паттерны файлов (по умолчанию IMPORT_SOURCES)
+        batch_size: Размер пакета вставки
+
+    Returns:
+        int: Количество новых записей в индексе
+    """
+    imported = 0
+    for pattern in patterns or IMPORT_SOURCES:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                imported += _import_file(path, batch_size)
+            except Exception as e:
+                print(f"Error importing journal file {path}: {e}")
+    return imported
+
+def is_empty() -> bool:
+    """Проверяет, есть ли в индексе хотя бы одна запись."""
+    conn = _reader_conn()
+    if conn is None:
+        return True
+    return conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is None
+
+def _where(
+    event_type: Optional[str],
+    chat_id: Optional[str],
+    since: Optional[float],
+    until: Optional[float]
+) -> tuple:
+    clauses, params = [], []
+    if event_type:
+        clauses.append("type = ?")
+        params.append(event_type)
+    if chat_id is not None:
+        clauses.append("chat_id = ?")
+        params.append(str(chat_id))
+    if since is not None:
+        clauses.append("unix_time >= ?")
+        params.append(int(since))
+    if until is not None:
+        clauses.append("unix_time <= ?")
+        params.append(int(until))
+    return clauses, params
+
+def query_events(
+    event_type: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    since: Union[str, int, float, datetime, None] = None,
+    until: Union[str, int, float, datetime, None] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Возвращает страницу событий (от новых к старым) с keyset-пагинацией.
+
+    Args:
+        event_type: Тип события
+        chat_id: ID чата
+        since: Нижняя граница времени (unix, ISO или datetime)
+        until: Верхняя граница времени (unix, ISO или datetime)
+        limit: Размер страницы (не больше MAX_PAGE_SIZE)
+        cursor: Курсор следующей страницы из предыдущего ответа
+
+    Returns:
+        Dict[str, Any]: {"events": [...], "next_cursor": str или None}
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    conn = _reader_conn()
+    if conn is None:
+        return {"events": [], "next_cursor": None}
+
+    clauses, params = _where(event_type, chat_id, _to_unix(since), _to_unix(until))
+    if cursor:
+        cursor_time, cursor_id = (int(part) for part in cursor.split(":", 1))
+        clauses.append("(unix_time < ? OR (unix_time = ? AND id < ?))")
+        params.extend([cursor_time, cursor_time, cursor_id])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT id, unix_time, data FROM events {where} "
+        f"ORDER BY unix_time DESC, id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1][1]}:{rows[-1][0]}"
+    return {"events": [json.loads(row[2]) for row in rows], "next_cursor": next_cursor}
+
+def count_events(
+    group_by: str = "chat_id",
+    event_type: Optional[str] = None,
+    chat_id: Optional[str] = None,
+    since: Union[str, int, float, datetime, None] = None,
+    until: Union[str, int, float, datetime, None] = None
+) -> Dict[str, int]:
+    """
+    Считает события с группировкой (например, send_error за час по chat_id).
+
+    Args:
+        group_by: Поле группировки: "chat_id" или "type"
+        event_type: Тип события
+        chat_id: ID чата
+        since: Нижняя граница времени
+        until: Верхняя граница времени
+
+    Returns:
+        Dict[str, int]: {значение поля: количество}
+    """
+    if group_by not in ("chat_id", "type"):
+        raise ValueError(f"Unsupported group_by: {group_by}")
+    conn = _reader_conn()
+    if conn is None:
+        return {}
+
+    clauses, params = _where(event_type, chat_id, _to_unix(since), _to_unix(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT {group_by}, COUNT(*) FROM events {where} GROUP BY {group_by} ORDER BY 2 DESC",
+        params
+    ).fetchall()
+    return {str(key): count for key, count in rows}
@@ -6,6 +6,8 @@ import asyncio
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+from utils.http_client import get_client
+
 # Константы
 DEFAULT_CORE_URL = "http://selesta.ariannamethod.me/core.json"
 LOCAL_CACHE_PATH = "data/core_cache.json"
@@ -81,12 +83,12 @@ async def fetch_core_config(core_url: str) -> Optional[Dict[str, Any]]:
     """
     for attempt in range(MAX_RETRIES):
         try:
-            async with httpx.AsyncClient(timeout=10) as client:
-                resp = await client.get(core_url)
-                if resp.status_code == 200:
-                    return resp.json()
-                else:
-                    print(f"Lighthouse: HTTP error {resp.status_code} when fetching core config.")
+            client = get_client("web")
+            resp = await client.get(core_url, timeout=10)
+            if resp.status_code == 200:
+                return resp.json()
+            else:
+                print(f"Lighthouse: HTTP error {resp.status_code} when fetching core config.")
             
             # Если не последняя попытка, ждем и пробуем снова
             if attempt < MAX_RETRIES - 1:
@@ -0,0 +1,143 @@
+import time
+import asyncio
+import bisect
+from typing import Dict, Any, List, Optional, Sequence
+
+# Границы корзин гистограммы задержек (секунды); последняя корзина - "больше"
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MAX_IDLE_BUCKETS = 1000  # Сколько бакетов ключей хранить до очистки простаивающих
+
+
+class TokenBucket:
+    """
+    Токен-бакет с резервированием.
+
+    ``reserve`` сразу списывает токен и возвращает, сколько нужно подождать.
+    Токены могут уходить в минус - это очередь уже выданных резервов,
+    поэтому ожидающие вызовы обслуживаются в порядке обращения.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """
+        Резервирует один токен.
+
+        Returns:
+            float: Сколько секунд подождать перед использованием токена
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now, 0.0)
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Есть ли свободный токен прямо сейчас (без списания)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= 1 and self.blocked_until <= now
+
+    def block(self, seconds: float, now: Optional[float] = None) -> None:
+        """Запрещает выдачу токенов на ``seconds`` секунд (например, по retry_after)."""
+        now = time.monotonic() if now is None else now
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        """Бакет полон и не заблокирован - его можно удалить без потери состояния."""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class RateLimiter:
+    """
+    Общий бакет плюс бакет на каждый ключ (например, chat_id).
+
+    Ключевые бакеты создаются по требованию; простаивающие удаляются,
+    когда их становится больше MAX_IDLE_BUCKETS.
+    """
+
+    def __init__(self, global_rate: float, global_burst: float):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, key: str, rate: float, burst: float) -> TokenBucket:
+        """Возвращает бакет ключа, создавая его при первом обращении."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                for idle_key in [k for k, b in self._buckets.items() if b.idle(now)]:
+                    del self._buckets[idle_key]
+            bucket = TokenBucket(rate, burst)
+            self._buckets[key] = bucket
+        return bucket
+
+    async def acquire(self, key_bucket: Optional[TokenBucket] = None) -> float:
+        """
+        Ждет токен ключевого бакета (если задан), затем общего.
+
+        Returns:
+            float: Суммарное время ожидания в секундах
+        """
+        waited = 0.0
+        for bucket in (key_bucket, self.global_bucket):
+            if bucket is None:
+                continue
+            delay = bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+        return waited
+
+    def try_acquire(self, key_bucket: Optional[TokenBucket] = None) -> bool:
+        """
+        Берет токены ключевого и общего бакетов, только если оба свободны
+        сейчас. Не ждет: при нехватке ничего не списывает и возвращает False.
+        """
+        now = time.monotonic()
+        buckets = [b for b in (key_bucket, self.global_bucket) if b is not None]
+        if not all(bucket.available(now) for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.reserve(now)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Словарь для /status: количество по корзинам "<=границы" и "+Inf"."""
+        labels = [f"le_{bound:g}" for bound in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 1),
+            "buckets": dict(zip(labels, self.counts)),
+        }
@@ -4,7 +4,10 @@ except ImportError:  # pragma: no cover - optional dependency
     tiktoken = None
 import os
 import json
+import time
+import hashlib
 import random
+import threading
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple, Union
 
@@ -18,11 +21,28 @@ PERSONA_FILE_DEFAULT = "config/SELESTA_PERSONA.md"
 # Чтобы не засорять логи, системный промпт выводится только один раз
 _prompt_logged = False
 
+# Кэш конфигурации: перечитывается только при изменении mtime/размера файла
+CONFIG_CHECK_INTERVAL = 2.0  # секунд между проверками stat() файла
+_config_lock = threading.Lock()
+_config_cache: Optional[Dict[str, Any]] = None
+_config_stamp: Optional[Tuple[int, int]] = None
+_config_checked_at = 0.0
+
 # Кэш и состояние для tiktoken
 _ENCODER = None
 _ENCODER_ATTEMPTED = False
 _ENCODER_ERROR_LOGGED = False
 
+# Мемоизация числа токенов для статичных сегментов промпта
+SEGMENT_CACHE_SIZE = 512
+PROMPT_TOKEN_MARGIN = 64  # Запас на слияние токенов на границах сегментов
+SEPARATOR_TOKENS = 1  # "\n\n" между сегментами - один токен cl100k
+# Prompt caching Anthropic: не больше 4 точек кэширования на запрос
+PROMPT_CACHE_CONTROL = {"type": "ephemeral"}
+PROMPT_CACHE_BREAKPOINTS = 3
+TIMESTAMP_LABEL = "Current Date and Time (UTC): "
+_segment_tokens: Dict[Tuple[int, str], int] = {}
+
 def _load_persona() -> str:
     """Loads persona text from environment variable or file."""
     env_val = os.getenv("SELESTA_PERSONA")
@@ -94,6 +114,43 @@ def _truncate_without_encoder(text: str, token_limit: int) -> str:
         return text
     return text[:approx_char_limit]
 
+def _count_tokens(text: str, encoder, cache: bool = True) -> int:
+    """
+    Считает токены сегмента промпта.
+    Статичные сегменты (персона, интро, этика, стили, темы) кэшируются,
+    поэтому в установившемся режиме они не кодируются повторно.
+    
+    Args:
+        text: Текст сегмента
+        encoder: Энкодер tiktoken или None
+        cache: Запоминать ли результат (False для изменчивых сегментов)
+        
+    Returns:
+        int: Количество токенов
+    """
+    if not text:
+        return 0
+    key = (id(encoder) if encoder is not None else 0, text)
+    if cache:
+        cached = _segment_tokens.get(key)
+        if cached is not None:
+            return cached
+
+    count = None
+    if encoder is not None:
+        try:
+            count = len(encoder.encode(text))
+        except Exception as exc:  # pragma: no cover - defensive logging
+            _warn_once(f"Warning: failed to encode system prompt with tiktoken: {exc}")
+    if count is None:
+        count = _estimate_tokens(text)
+
+    if cache:
+        if len(_segment_tokens) >= SEGMENT_CACHE_SIZE:
+            _segment_tokens.clear()
+        _segment_tokens[key] = count
+    return count
+
 # Основные промпты
 INTRO = """
 Dear Selesta,
@@ -217,14 +274,9 @@ INTERACTION_STYLES = {
     }
 }
 
-def load_config() -> Dict[str, Any]:
-    """
-    Загружает конфигурацию из файла или возвращает значения по умолчанию.
-    
-    Returns:
-        Dict[str, Any]: Словарь с настройками резонатора
-    """
-    default_config = {
+def _default_config() -> Dict[str, Any]:
+    """Возвращает конфигурацию резонатора по умолчанию."""
+    return {
         "max_tokens": MAX_TOKENS_DEFAULT,
         "agent_group": DEFAULT_AGENT_GROUP,
         "wilderness_topics": WILDERNESS_TOPICS + ADDITIONAL_WILDERNESS_TOPICS,
@@ -234,6 +286,23 @@ def load_config() -> Dict[str, Any]:
             "Arianna": "creator"
         }
     }
+
+def _config_file_stamp() -> Optional[Tuple[int, int]]:
+    """Возвращает (mtime_ns, size) файла конфигурации или None, если его нет."""
+    try:
+        st = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_config_file() -> Dict[str, Any]:
+    """
+    Читает конфигурацию с диска или создает файл с настройками по умолчанию.
+    
+    Returns:
+        Dict[str, Any]: Словарь с настройками резонатора
+    """
+    default_config = _default_config()
     
     try:
         if os.path.exists(CONFIG_PATH):
@@ -255,18 +324,59 @@ def load_config() -> Dict[str, Any]:
         print(f"Error loading resonator config: {e}")
         return default_config
 
-def select_interaction_style(user_id: Optional[str] = None, message_context: Optional[str] = None) -> str:
+def load_config() -> Dict[str, Any]:
+    """
+    Загружает конфигурацию из файла или возвращает значения по умолчанию.
+    
+    Конфигурация кэшируется: файл перечитывается, только если изменились
+    его mtime или размер (stat() выполняется не чаще CONFIG_CHECK_INTERVAL),
+    либо после update_config. Возвращаемый словарь общий - не изменяйте его.
+    
+    Returns:
+        Dict[str, Any]: Словарь с настройками резонатора
+    """
+    global _config_cache, _config_stamp, _config_checked_at
+    
+    now = time.monotonic()
+    cached = _config_cache
+    if cached is not None and now - _config_checked_at < CONFIG_CHECK_INTERVAL:
+        return cached
+    
+    with _config_lock:
+        if _config_cache is not None and now - _config_checked_at < CONFIG_CHECK_INTERVAL:
+            return _config_cache
+        stamp = _config_file_stamp()
+        if _config_cache is None or stamp is None or stamp != _config_stamp:
+            _config_cache = _read_config_file()
+            _config_stamp = _config_file_stamp()
+        _config_checked_at = now
+        return _config_cache
+
+def invalidate_config_cache() -> None:
+    """Сбрасывает кэш конфигурации - следующий load_config перечитает файл."""
+    global _config_cache, _config_stamp, _config_checked_at
+    with _config_lock:
+        _config_cache = None
+        _config_stamp = None
+        _config_checked_at = 0.0
+
+def select_interaction_style(
+    user_id: Optional[str] = None,
+    message_context: Optional[str] = None,
+    config: Optional[Dict[str, Any]] = None
+) -> str:
     """
     Выбирает стиль взаимодействия на основе пользователя и контекста сообщения.
     
     Args:
         user_id: ID пользователя
         message_context: Контекст сообщения
+        config: Уже загруженная конфигурация (если None - берется из кэша)
         
     Returns:
         str: Название стиля взаимодействия
     """
-    config = load_config()
+    config = config if config is not None else load_config()
     styles = config.get("styles", INTERACTION_STYLES)
     
     # По умолчанию используем стандартный стиль
@@ -289,17 +399,18 @@ def select_interaction_style(user_id: Optional[str] = None, message_context: Opt
     
     return style
 
-def get_style_instructions(style: str) -> str:
+def get_style_instructions(style: str, config: Optional[Dict[str, Any]] = None) -> str:
     """
     Возвращает инструкции для выбранного стиля взаимодействия.
     
     Args:
         style: Название стиля
+        config: Уже загруженная конфигурация (если None - берется из кэша)
         
     Returns:
         str: Инструкции для стиля
     """
-    config = load_config()
+    config = config if config is not None else load_config()
     styles = config.get("styles", INTERACTION_STYLES)
     
     if style in styles:
@@ -324,6 +435,16 @@ def format_wilderness_topics(topics: List[str]) -> str:
     """
     return "\n".join(f"- {topic}" for topic in topics)
 
+def sample_daily_topics(topics: List[str], now: datetime, count: int = 8) -> List[str]:
+    """
+    Выборка тем для промпта, постоянная в пределах суток (UTC).
+    
+    Промпт меняется не чаще раза в день, поэтому его блоки кэшируются
+    у провайдера, а отпечаток для кэша ответов не прыгает от вызова к вызову.
+    """
+    rng = random.Random(now.strftime("%Y-%m-%d"))
+    return rng.sample(topics, min(count, len(topics)))
+
 def build_system_prompt(
     chat_id: Optional[str] = None,
     is_group: bool = False,
@@ -351,8 +472,8 @@ def build_system_prompt(
     max_tokens_limit = max_tokens or config.get("max_tokens", MAX_TOKENS_DEFAULT)
     
     # Выбираем стиль взаимодействия
-    style = select_interaction_style(chat_id, message_context)
-    style_instructions = get_style_instructions(style)
+    style = select_interaction_style(chat_id, message_context, config)
+    style_instructions = get_style_instructions(style, config)
     
     # Формируем базовый промпт
     persona = PERSONA_TEXT if PERSONA_TEXT else INTRO
@@ -360,56 +481,168 @@ def build_system_prompt(
     ethics = GROUP_ETHICS if is_group else ""
     
     # Форматируем темы для wilderness
-    formatted_topics = format_wilderness_topics(
-        random.sample(wilderness_topics, min(8, len(wilderness_topics)))
-    )
+    now = datetime.utcnow()
+    sampled_topics = sample_daily_topics(wilderness_topics, now)
+    formatted_topics = format_wilderness_topics(sampled_topics)
     wilderness_prompt = WILDERNESS_PROMPT.format(wilderness_topics=formatted_topics)
     
     # Добавляем текущее время и информацию о пользователе
-    current_time = f"Current Date and Time (UTC): {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}"
+    current_time = f"{TIMESTAMP_LABEL}{now.strftime('%Y-%m-%d %H:%M:%S')}"
     
     # Собираем все части промпта
-    total_prompt = (
-        f"{current_time}\n\n"
-        f"{persona}\n\n"
-        f"{special_intro}\n\n"
-        f"{style_instructions}\n\n"
-        f"{ethics}\n\n"
-        f"{wilderness_prompt}"
-    )
-
-    if language:
-        total_prompt += f"\n\nRespond in {language}."
+    parts = [current_time, persona, special_intro, style_instructions, ethics, wilderness_prompt]
+    total_prompt = "\n\n".join(parts)
+    language_line = f"\n\nRespond in {language}." if language else ""
+    total_prompt += language_line
     
-    # Проверяем длину и при необходимости обрезаем
+    # Оцениваем длину по кэшированным счетчикам сегментов, без кодирования всего промпта.
+    # Шаблон wilderness считается по частям: каркас и каждая тема кэшируются отдельно.
     encoder = _get_encoder()
-    sys_tokens = 0
+    token_limit = max_tokens_limit // 2
+    sys_tokens = (
+        _count_tokens(current_time, encoder, cache=False)
+        + _count_tokens(persona, encoder)
+        + _count_tokens(special_intro, encoder)
+        + _count_tokens(style_instructions, encoder)
+        + _count_tokens(ethics, encoder)
+        + _count_tokens(WILDERNESS_PROMPT, encoder)
+        + sum(_count_tokens(f"- {topic}", encoder) + SEPARATOR_TOKENS for topic in sampled_topics)
+        + _count_tokens(language_line, encoder)
+        + SEPARATOR_TOKENS * (len(parts) - 1)
+    )
+    
+    # Полное кодирование и обрезка - только если бюджет действительно превышен
+    if sys_tokens > token_limit - PROMPT_TOKEN_MARGIN:
+        total_prompt, sys_tokens = _fit_to_budget(total_prompt, token_limit, encoder)
+
+    _log_prompt_once(style, sys_tokens, max_tokens_limit, total_prompt)
+    return total_prompt
 
+def _fit_to_budget(text: str, token_limit: int, encoder) -> Tuple[str, int]:
+    """
+    Точно кодирует промпт и обрезает его до token_limit.
+    
+    Returns:
+        Tuple[str, int]: (текст промпта, количество токенов)
+    """
     if encoder is not None:
         try:
-            encoded_prompt = encoder.encode(total_prompt)
-            sys_tokens = len(encoded_prompt)
-            if sys_tokens > max_tokens_limit // 2:
-                encoded_prompt = encoded_prompt[: max_tokens_limit // 2]
-                total_prompt = encoder.decode(encoded_prompt)
-                sys_tokens = len(encoded_prompt)
+            encoded_prompt = encoder.encode(text)
+            if len(encoded_prompt) > token_limit:
+                encoded_prompt = encoded_prompt[:token_limit]
+                text = encoder.decode(encoded_prompt)
+            return text, len(encoded_prompt)
         except Exception as exc:  # pragma: no cover - defensive logging
             _warn_once(f"Warning: failed to encode system prompt with tiktoken: {exc}")
-            total_prompt = _truncate_without_encoder(total_prompt, max_tokens_limit // 2)
-            sys_tokens = _estimate_tokens(total_prompt)
-    else:
-        total_prompt = _truncate_without_encoder(total_prompt, max_tokens_limit // 2)
-        sys_tokens = _estimate_tokens(total_prompt)
+    text = _truncate_without_encoder(text, token_limit)
+    return text, _estimate_tokens(text)
 
+def _log_prompt_once(style: str, sys_tokens: int, max_tokens_limit: int, text: str) -> None:
+    """Выводит первый собранный промпт в лог (только один раз)."""
     global _prompt_logged
     if not _prompt_logged:
         print("=== SELESTA SYSTEM PROMPT LOADED ===")
         print(f"Style: {style}")
         print(f"Token count: {sys_tokens} / {max_tokens_limit//2}")
-        print(total_prompt[:800] + "...")
+        print(text[:800] + "...")
         _prompt_logged = True
+
+def build_system_blocks(
+    chat_id: Optional[str] = None,
+    is_group: bool = False,
+    message_context: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    language: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Создает системный промпт в виде блоков Anthropic с точками кэширования.
     
-    return total_prompt
+    Сегменты идут от самых статичных к самым изменчивым, чтобы у запросов
+    был общий префикс для prompt caching:
+    персона, интро и этика группы (общие для всех чатов) -> стиль (несколько
+    вариантов) -> темы wilderness (выборка меняется раз в сутки) -> время и язык
+    (без кэширования). После каждого из первых трех блоков стоит
+    ``cache_control``. Префиксы короче минимального размера кэша модели
+    просто не кэшируются.
+    
+    Args:
+        chat_id: ID чата
+        is_group: Является ли чат групповым
+        message_context: Контекст сообщения
+        max_tokens: Максимальное количество токенов
+        language: Предпочтительный язык ответа (например, "Russian")
+        
+    Returns:
+        List[Dict[str, Any]]: Блоки для поля ``system`` Messages API
+    """
+    config = load_config()
+    agent_group = config.get("agent_group", DEFAULT_AGENT_GROUP)
+    wilderness_topics = config.get("wilderness_topics", WILDERNESS_TOPICS)
+    max_tokens_limit = max_tokens or config.get("max_tokens", MAX_TOKENS_DEFAULT)
+    
+    style = select_interaction_style(chat_id, message_context, config)
+    style_instructions = get_style_instructions(style, config)
+    
+    persona = PERSONA_TEXT if PERSONA_TEXT else INTRO
+    special_intro = SPECIAL_INTRO.format(agent_group=agent_group)
+    ethics = GROUP_ETHICS if is_group else ""
+    
+    # Выборка тем детерминирована в пределах суток, поэтому блок остается кэшируемым
+    now = datetime.utcnow()
+    sampled_topics = sample_daily_topics(wilderness_topics, now)
+    wilderness_prompt = WILDERNESS_PROMPT.format(
+        wilderness_topics=format_wilderness_topics(sampled_topics)
+    )
+    
+    current_time = f"{TIMESTAMP_LABEL}{now.strftime('%Y-%m-%d %H:%M:%S')}"
+    volatile = current_time + (f"\n\nRespond in {language}." if language else "")
+    
+    static_parts = [part for part in (persona, special_intro, ethics) if part]
+    texts = ["\n\n".join(static_parts), style_instructions, wilderness_prompt, volatile]
+    
+    encoder = _get_encoder()
+    token_limit = max_tokens_limit // 2
+    sys_tokens = (
+        sum(_count_tokens(part, encoder) for part in static_parts)
+        + SEPARATOR_TOKENS * (len(static_parts) - 1)
+        + _count_tokens(style_instructions, encoder)
+        + _count_tokens(WILDERNESS_PROMPT, encoder)
+        + sum(_count_tokens(f"- {topic}", encoder) + SEPARATOR_TOKENS for topic in sampled_topics)
+        + _count_tokens(volatile, encoder, cache=False)
+    )
+    
+    # При превышении бюджета кэшировать нечего: отдаем один обрезанный блок
+    if sys_tokens > token_limit - PROMPT_TOKEN_MARGIN:
+        text, sys_tokens = _fit_to_budget("\n\n".join(texts), token_limit, encoder)
+        _log_prompt_once(style, sys_tokens, max_tokens_limit, text)
+        return [{"type": "text", "text": text}]
+    
+    blocks = [{"type": "text", "text": text} for text in texts if text]
+    for block in blocks[:-1][:PROMPT_CACHE_BREAKPOINTS]:
+        block["cache_control"] = dict(PROMPT_CACHE_CONTROL)
+    
+    _log_prompt_once(style, sys_tokens, max_tokens_limit, "\n\n".join(texts))
+    return blocks
+
+def system_prompt_fingerprint(system_prompt: Union[str, List[Dict[str, Any]], None]) -> str:
+    """
+    Хэш системного промпта без строки текущего времени.
+    
+    Время меняется каждую секунду, поэтому для ключей кэша ответов
+    оно отбрасывается; остальные сегменты (стиль, язык, темы) учитываются.
+    
+    Args:
+        system_prompt: Строка или блоки из build_system_blocks
+        
+    Returns:
+        str: SHA-256 в hex
+    """
+    if isinstance(system_prompt, list):
+        text = "\n\n".join(block.get("text", "") for block in system_prompt)
+    else:
+        text = system_prompt or ""
+    stable = "\n".join(line for line in text.split("\n") if not line.startswith(TIMESTAMP_LABEL))
+    return hashlib.sha256(stable.encode("utf-8")).hexdigest()
 
 def get_random_wilderness_topic() -> str:
     """
@@ -433,8 +666,8 @@ def update_config(new_config: Dict[str, Any]) -> bool:
         bool: True если обновление успешно, False в случае ошибки
     """
     try:
-        # Загружаем текущую конфигурацию
-        current_config = load_config()
+        # Загружаем текущую конфигурацию (копию, кэш не трогаем до записи)
+        current_config = dict(load_config())
         
         # Обновляем конфигурацию
         for key, value in new_config.items():
@@ -446,6 +679,8 @@ def update_config(new_config: Dict[str, Any]) -> bool:
             # ИСПРАВЛЕНО: правильный порядок аргументов
             json.dump(current_config, f, indent=2, ensure_ascii=False)
         
+        # Следующее чтение увидит новую конфигурацию сразу, без ожидания stat()
+        invalidate_config_cache()
         return True
     except Exception as e:
         print(f"Error updating resonator config: {e}")
@@ -463,7 +698,7 @@ def add_wilderness_topic(topic: str) -> bool:
     """
     try:
         config = load_config()
-        topics = config.get("wilderness_topics", WILDERNESS_TOPICS)
+        topics = list(config.get("wilderness_topics", WILDERNESS_TOPICS))
         
         # Проверяем, что такой темы еще нет
         if topic not in topics:
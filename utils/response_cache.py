@@ -0,0 +1,112 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Кэш ответов модели на идентичные запросы (по умолчанию выключен).
+# Работает только при LLM_TEMPERATURE=0: при температуре выше ответы
+# случайны и не кэшируются, если не задан RESPONSE_CACHE_ALLOW_SAMPLED
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))  # секунд
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+# При temperature > 0 ответы случайны; кэшировать их можно только явно
+RESPONSE_CACHE_ALLOW_SAMPLED = os.getenv("RESPONSE_CACHE_ALLOW_SAMPLED", "0").lower() in ("1", "true", "yes")
+
+
+def _digest(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def make_key(system_fingerprint: str, memory_context: str, retrieved_context: str, message: str) -> str:
+    """
+    Ключ кэша: хэш системного промпта, контекста памяти, найденного
+    контекста и самого сообщения.
+
+    Args:
+        system_fingerprint: Хэш системного промпта (см. system_prompt_fingerprint)
+        memory_context: Контекст последних сообщений чата
+        retrieved_context: Контекст из семантического поиска
+        message: Сообщение пользователя
+
+    Returns:
+        str: SHA-256 в hex
+    """
+    parts = (system_fingerprint, _digest(memory_context), _digest(retrieved_context), _digest(message))
+    return hashlib.sha256("\x00".join(parts).encode("ascii")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU-кэш ответов с TTL.
+
+    Ответ используется повторно только при полном совпадении ключа и
+    только пока не истек TTL. Запросы с temperature > 0 не кэшируются,
+    если это не разрешено ``allow_sampled``, поэтому при включенном кэше
+    нужна температура 0 (по умолчанию LLM_TEMPERATURE=0.7 и кэш простаивает).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        allow_sampled: bool = RESPONSE_CACHE_ALLOW_SAMPLED
+    ):
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.allow_sampled = allow_sampled
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "skipped_sampled": 0, "evictions": 0, "expired": 0}
+
+    def applies(self, temperature: float) -> bool:
+        """Можно ли кэшировать запрос с такой температурой."""
+        if not self.enabled:
+            return False
+        if temperature > 0 and not self.allow_sampled:
+            with self._lock:
+                self._stats["skipped_sampled"] += 1
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный ответ или None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: str, response: str) -> None:
+        """Сохраняет ответ, вытесняя самые старые записи."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика для /status."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "enabled": self.enabled,
+            "allow_sampled": self.allow_sampled,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        })
+        return stats
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Настройки соединений SQLite
+READER_POOL_SIZE = int(os.getenv("SQLITE_READERS", "4"))  # Потоков (и соединений) для чтения
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))  # Страничный кэш на соединение
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+class SQLiteStore:
+    """
+    Доступ к одной базе SQLite из асинхронного кода.
+
+    База работает в WAL с synchronous=NORMAL, увеличенным страничным
+    кэшем и mmap. Чтения идут через небольшой пул потоков, у каждого
+    потока свое соединение только для чтения, поэтому поиск не ждет
+    длинной транзакции записи. Все записи выполняются одним соединением
+    в отдельном однопоточном исполнителе и поэтому строго сериализованы.
+    Цикл событий не блокируется ни чтением, ни записью.
+    """
+
+    def __init__(self, path: str, readers: int = READER_POOL_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._read_executor = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="sqlite-read")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def writer(self) -> sqlite3.Connection:
+        """Единственное соединение для записи (создается при первом обращении)."""
+        if self._writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._writer = self._connect()
+        return self._writer
+
+    def reader(self) -> sqlite3.Connection:
+        """Соединение для чтения текущего потока."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.writer()  # База и WAL должны существовать до первого читателя
+            conn = self._connect(read_only=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def read(self, fn: Callable[..., T], *args: Any) -> T:
+        """Выполняет ``fn(conn, *args)`` на соединении чтения текущего потока."""
+        return fn(self.reader(), *args)
+
+    def write(self, fn: Callable[..., T], *args: Any) -> T:
+        """
+        Выполняет ``fn(conn, *args)`` в транзакции записи.
+        Коммит при успехе, откат при исключении.
+        """
+        with self._write_lock:
+            conn = self.writer()
+            try:
+                result = fn(conn, *args)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+
+    async def run_read(self, func: Callable[..., T], *args: Any) -> T:
+        """Вызывает ``func(*args)`` в пуле потоков чтения."""
+        return await asyncio.get_running_loop().run_in_executor(self._read_executor, func, *args)
+
+    async def run_write(self, func: Callable[..., T], *args: Any) -> T:
+        """Вызывает ``func(*args)`` в потоке записи (по одной задаче за раз)."""
+        return await asyncio.get_running_loop().run_in_executor(self._write_executor, func, *args)
+
+    def defer_write(self, func: Callable[..., Any], *args: Any) -> None:
+        """Ставит ``func(*args)`` в очередь потока записи, не дожидаясь результата."""
+        try:
+            self._write_executor.submit(func, *args)
+        except RuntimeError:
+            pass  # Хранилище уже закрыто - отложенная запись не нужна
+
+    async def aread(self, fn: Callable[..., T], *args: Any) -> T:
+        """Асинхронный ``read``: запрос выполняется в пуле чтения."""
+        return await self.run_read(self.read, fn, *args)
+
+    async def awrite(self, fn: Callable[..., T], *args: Any) -> T:
+        """Асинхронный ``write``: транзакция выполняется в потоке записи."""
+        return await self.run_write(self.write, fn, *args)
+
+    def close(self) -> None:
+        """Останавливает исполнители и закрывает все соединения."""
+        self._read_executor.shutdown(wait=True)
+        self._write_executor.shutdown(wait=True)
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -1,10 +1,151 @@
 import os
+import time
 import asyncio
 import random
-from typing import List, Tuple, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Tuple, Optional, AsyncIterator
 import httpx
 
+from utils.http_client import get_client
+from utils.rate_limiter import RateLimiter, LatencyHistogram
+
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096  # Telegram's hard limit for one message
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # seconds between edits
+
+# Outbound limits: ~30 msg/s per bot, ~1 msg/s per chat, 20 msg/min per group
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_MAX_RETRIES = 3  # 429 retries before a request is given up
+TELEGRAM_MAX_RETRY_AFTER = 60.0  # never wait longer than this for one retry
+TYPING_INTERVAL = float(os.getenv("TYPING_INTERVAL", "4.5"))  # the action expires after ~5s
+
+rate_limiter = RateLimiter(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+_latency: Dict[str, LatencyHistogram] = {}
+_counters = {"requests": 0, "rate_limited": 0, "retries": 0, "gave_up": 0, "skipped": 0, "throttled_seconds": 0.0}
+
+
+def _chat_bucket(chat_id: str):
+    """Per-chat bucket; group and channel ids are negative in Telegram."""
+    chat_id = str(chat_id)
+    rate = TELEGRAM_GROUP_RATE if chat_id.startswith("-") else TELEGRAM_CHAT_RATE
+    return rate_limiter.bucket(chat_id, rate, TELEGRAM_CHAT_BURST)
+
+
+def _retry_after(response: httpx.Response) -> float:
+    """Read ``retry_after`` from a 429 body, falling back to the header."""
+    try:
+        value = response.json().get("parameters", {}).get("retry_after")
+    except Exception:
+        value = None
+    if value is None:
+        value = response.headers.get("retry-after", 1)
+    try:
+        return min(max(float(value), 0.0), TELEGRAM_MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+async def _telegram_request(
+    method: str,
+    chat_id: str,
+    *,
+    json: Optional[Dict[str, Any]] = None,
+    data: Optional[Dict[str, Any]] = None,
+    file_field: Optional[str] = None,
+    file_path: Optional[str] = None,
+    per_chat: bool = True,
+    wait: bool = True,
+) -> Optional[httpx.Response]:
+    """Call a Bot API method through the per-chat and global token buckets.
+
+    A 429 response blocks the chat's bucket for ``retry_after`` seconds and
+    the request is queued again, up to ``TELEGRAM_MAX_RETRIES`` times. The
+    time from the call to the final response (including throttling) is
+    recorded in the per-method latency histogram. Chat actions pass
+    ``per_chat=False`` and only consume the global budget; a 429 on them
+    is per chat on Telegram's side, so the action is dropped instead of
+    blocking the global bucket for every other chat.
+
+    With ``wait=False`` the request is made only if a token is free right
+    now; otherwise nothing is sent and ``None`` is returned. Such requests
+    are not retried after a 429. Intermediate stream edits use this so they
+    never queue behind, or delay, real sends.
+    """
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/{method}"
+    bucket = _chat_bucket(chat_id) if per_chat else None
+    client = get_client("telegram")
+    if not wait and not rate_limiter.try_acquire(bucket):
+        _counters["skipped"] += 1
+        return None
+    started = time.monotonic()
+    try:
+        for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+            if wait:
+                _counters["throttled_seconds"] += await rate_limiter.acquire(bucket)
+            _counters["requests"] += 1
+            if file_path is not None:
+                with open(file_path, "rb") as f:
+                    response = await client.post(url, data=data, files={file_field: f})
+            else:
+                response = await client.post(url, json=json)
+            if response.status_code != 429:
+                return response
+            _counters["rate_limited"] += 1
+            if bucket is None:
+                _counters["gave_up"] += 1
+                return response
+            retry_after = _retry_after(response)
+            bucket.block(retry_after)
+            if attempt == TELEGRAM_MAX_RETRIES or not wait:
+                _counters["gave_up"] += 1
+                return response
+            print(f"Telegram rate limit on {method} for chat {chat_id}, retrying in {retry_after}s")
+            _counters["retries"] += 1
+        return response
+    finally:
+        _latency.setdefault(method, LatencyHistogram()).observe(time.monotonic() - started)
+
+
+def delivery_stats() -> Dict[str, Any]:
+    """Outbound Telegram counters and per-method latency histograms."""
+    return {
+        **{k: round(v, 3) if isinstance(v, float) else v for k, v in _counters.items()},
+        "chat_buckets": len(rate_limiter),
+        "latency": {method: hist.snapshot() for method, hist in _latency.items()},
+    }
+
+
+async def post_message(
+    chat_id: str,
+    text: str,
+    reply_to_message_id: Optional[int] = None,
+) -> Optional[int]:
+    """Send a message via Telegram Bot API.
+
+    Returns the ``message_id`` of the sent message, or ``None`` on failure.
+    """
+    if not TELEGRAM_TOKEN:
+        print("TELEGRAM_TOKEN not configured")
+        return None
+
+    payload = {"chat_id": chat_id, "text": text}
+    if reply_to_message_id is not None:
+        payload["reply_to_message_id"] = reply_to_message_id
+
+    try:
+        response = await _telegram_request("sendMessage", chat_id, json=payload)
+        response.raise_for_status()
+        return response.json().get("result", {}).get("message_id")
+    except httpx.HTTPStatusError as e:
+        print(
+            f"Telegram API error {e.response.status_code}: {e.response.text}"
+        )
+    except Exception as e:
+        print(f"Error sending Telegram message: {e}")
+    return None
 
 async def send_message(
     chat_id: str,
@@ -16,26 +157,35 @@ async def send_message(
     Returns ``True`` on success, ``False`` otherwise so callers can
     react to delivery failures.
     """
+    return await post_message(chat_id, text, reply_to_message_id) is not None
+
+async def edit_message_text(chat_id: str, message_id: int, text: str, wait: bool = True) -> bool:
+    """Replace the text of a previously sent message.
+
+    With ``wait=False`` the edit is skipped (``False``) instead of waiting
+    when the chat has no free rate-limit token.
+    """
     if not TELEGRAM_TOKEN:
         print("TELEGRAM_TOKEN not configured")
         return False
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text}
-    if reply_to_message_id is not None:
-        payload["reply_to_message_id"] = reply_to_message_id
+    payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
+    try:
+        response = await _telegram_request("editMessageText", chat_id, json=payload, wait=wait)
+        if response is None:
+            return False
+        response.raise_for_status()
+        return True
+    except httpx.HTTPStatusError as e:
+        # "message is not modified" is harmless: the text is already shown
+        if e.response.status_code == 400 and "not modified" in e.response.text:
             return True
-        except httpx.HTTPStatusError as e:
-            print(
-                f"Telegram API error {e.response.status_code}: {e.response.text}"
-            )
-        except Exception as e:
-            print(f"Error sending Telegram message: {e}")
+        print(
+            f"Telegram API error {e.response.status_code}: {e.response.text}"
+        )
+    except Exception as e:
+        print(f"Error editing Telegram message: {e}")
     return False
 
 async def send_typing(chat_id: str) -> bool:
@@ -44,18 +194,52 @@ async def send_typing(chat_id: str) -> bool:
         print("TELEGRAM_TOKEN not configured")
         return False
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendChatAction"
     payload = {"chat_id": chat_id, "action": "typing"}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            print(f"Error sending typing action: {e}")
+    try:
+        response = await _telegram_request("sendChatAction", chat_id, json=payload, per_chat=False)
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        print(f"Error sending typing action: {e}")
     return False
 
+# chat_id -> [keepalive task, number of active typing_indicator users]
+_typing: Dict[str, list] = {}
+
+
+async def _typing_keepalive(chat_id: str, interval: float) -> None:
+    """Renew the typing action until cancelled; one call in flight at a time."""
+    while True:
+        await send_typing(chat_id)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def typing_indicator(chat_id: str, interval: float = TYPING_INTERVAL) -> AsyncIterator[None]:
+    """Show 'typing' in ``chat_id`` for as long as the block runs.
+
+    The action is renewed every ``interval`` seconds by a background task,
+    so the caller does not wait for ``sendChatAction``. Concurrent users in
+    the same chat share one task; it is cancelled when the last one exits
+    (normally, with an error, or by cancellation).
+    """
+    chat_id = str(chat_id)
+    entry = _typing.get(chat_id)
+    if entry is None:
+        task = asyncio.get_running_loop().create_task(_typing_keepalive(chat_id, interval))
+        entry = _typing[chat_id] = [task, 0]
+    entry[1] += 1
+    try:
+        yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            entry[0].cancel()
+            if _typing.get(chat_id) is entry:
+                del _typing[chat_id]
+
+
 async def send_audio_message(
     chat_id: str,
     audio_path: str,
@@ -67,22 +251,20 @@ async def send_audio_message(
         print("TELEGRAM_TOKEN not configured")
         return False
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendAudio"
     data = {"chat_id": chat_id}
     if caption:
         data["caption"] = caption
     if reply_to_message_id is not None:
         data["reply_to_message_id"] = reply_to_message_id
 
-    async with httpx.AsyncClient() as client:
-        try:
-            with open(audio_path, "rb") as af:
-                files = {"audio": af}
-                response = await client.post(url, data=data, files=files)
-                response.raise_for_status()
-                return True
-        except Exception as e:
-            print(f"Error sending audio message: {e}")
+    try:
+        response = await _telegram_request(
+            "sendAudio", chat_id, data=data, file_field="audio", file_path=audio_path
+        )
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        print(f"Error sending audio message: {e}")
     return False
 
 async def send_multipart_message(
@@ -93,15 +275,162 @@ async def send_multipart_message(
 ) -> bool:
     """Send multiple parts sequentially with optional delays.
 
+    Each part goes through the outbound rate limiter via ``send_message``.
     Returns ``True`` if all messages were delivered successfully.
     """
     success = True
-    for part in parts:
+    for index, part in enumerate(parts):
         part_ok = await send_message(chat_id, part, reply_to_message_id)
         success = success and part_ok
+        if index == len(parts) - 1:
+            break
         await asyncio.sleep(
             delay_range[0]
             if delay_range[0] == delay_range[1]
             else random.uniform(*delay_range)
         )
     return success
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Pick where to cut ``text`` so the head fits in ``limit`` characters.
+
+    Prefers a paragraph break, then a line break, then a space in the
+    second half of the window; falls back to a hard cut.
+    """
+    window = text[:limit]
+    for sep in ("\n\n", "\n", " "):
+        pos = window.rfind(sep)
+        if pos >= limit // 2:
+            return pos
+    return limit
+
+class TelegramStreamSink:
+    """Deliver a streamed answer to Telegram while it is being generated.
+
+    The first message is sent as soon as any visible text exists. Later
+    text is applied with ``editMessageText`` at most once per
+    ``edit_interval`` seconds. When the current message would exceed
+    ``max_length`` it is finalized and the stream rolls over to a new
+    message.
+
+    ``feed`` only appends to a buffer; a background task performs the
+    Telegram calls and always shows the latest text, so the producer
+    (the LLM stream) never waits on Telegram I/O. ``close`` stops that
+    task and performs the final flush.
+
+    Intermediate edits do not wait for the chat's rate limit: when no
+    token is free the edit is skipped and the text is shown by a later
+    edit. Only sends, finalized parts and the final flush block.
+    """
+
+    def __init__(
+        self,
+        chat_id: str,
+        reply_to_message_id: Optional[int] = None,
+        edit_interval: float = STREAM_EDIT_INTERVAL,
+        max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+    ) -> None:
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.message_ids: List[int] = []
+        self.text = ""
+        self.ok = True
+        self._current = ""
+        self._shown = ""
+        self._current_id: Optional[int] = None
+        self._last_edit = 0.0
+        self._failed = False
+        self._wake = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._flushing = False
+        self._closing = False
+
+    @property
+    def started(self) -> bool:
+        """Whether at least one message has been delivered."""
+        return bool(self.message_ids)
+
+    async def feed(self, delta: str) -> None:
+        """Append a text fragment; Telegram is updated in the background."""
+        self.text += delta
+        self._current += delta
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wake.set()
+
+    async def _pump(self) -> None:
+        """Show the latest buffered text, at most once per ``edit_interval``."""
+        while not self._closing:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._closing or self._failed:
+                return
+            self._flushing = True
+            try:
+                await self._flush(final=False)
+            finally:
+                self._flushing = False
+            if self._closing:
+                return
+            delay = self.edit_interval - (time.monotonic() - self._last_edit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def close(self) -> bool:
+        """Stop background updates and flush the remaining text.
+
+        Returns ``True`` if everything was delivered.
+        """
+        self._closing = True
+        task, self._pump_task = self._pump_task, None
+        if task is not None:
+            if self._flushing:
+                # Let an in-flight send finish so its message id is not lost
+                self._wake.set()
+                await asyncio.gather(task, return_exceptions=True)
+            else:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await self._flush(final=True)
+        return self.ok and self.started
+
+    async def _flush(self, final: bool) -> None:
+        if self._failed:
+            return
+        while len(self._current) > self.max_length:
+            cut = _split_point(self._current, self.max_length)
+            head = self._current[:cut].rstrip()
+            self._current = self._current[cut:].lstrip()
+            await self._show(head, wait=True)
+            self._current_id = None
+            self._shown = ""
+            if self._failed:
+                return
+        if not self._current.strip():
+            return
+        due = time.monotonic() - self._last_edit >= self.edit_interval
+        if self._current_id is None or final or due:
+            await self._show(self._current, wait=final)
+
+    async def _show(self, text: str, wait: bool) -> None:
+        if self._current_id is None:
+            reply_to = None if self.message_ids else self.reply_to_message_id
+            message_id = await post_message(self.chat_id, text, reply_to)
+            if message_id is None:
+                # Stop streaming into a chat we cannot post to
+                self.ok = False
+                self._failed = True
+                return
+            self._current_id = message_id
+            self.message_ids.append(message_id)
+        elif text != self._shown:
+            if not await edit_message_text(self.chat_id, self._current_id, text, wait=wait):
+                if wait:
+                    self.ok = False
+                # A skipped intermediate edit is retried with newer text
+                return
+        self._shown = text
+        self._last_edit = time.monotonic()
@@ -9,6 +9,8 @@ import logging
 from typing import List, Dict, Any, Optional, Union, Tuple
 from urllib.parse import urlparse
 
+from utils.http_client import get_client
+
 # Настройки по умолчанию
 DEFAULT_TIMEOUT = 15  # секунд
 DEFAULT_MAX_TEXT_LENGTH = 5000  # символов
@@ -184,34 +186,34 @@ async def extract_text_from_url_async(
         }
         
         # Выполняем запрос асинхронно
-        async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-            resp = await client.get(url, headers=headers)
-            resp.raise_for_status()
-            
-            # Определяем кодировку
-            content_type = resp.headers.get('Content-Type', '')
-            if 'charset=' in content_type:
-                encoding = content_type.split('charset=')[-1].strip()
-            else:
-                encoding = resp.encoding or 'utf-8'
-            
-            # Парсим HTML
-            soup = BeautifulSoup(resp.text, "html.parser")
-            
-            # Удаляем ненужные элементы
-            for s in soup(['script', 'style', 'header', 'footer', 'nav', 'aside', 'meta']):
-                s.decompose()
-            
-            # Извлекаем текст
-            text = soup.get_text(separator="\n")
-            lines = [line.strip() for line in text.splitlines() if line.strip()]
-            result = "\n".join(lines)
+        client = get_client("web")
+        resp = await client.get(url, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        
+        # Определяем кодировку
+        content_type = resp.headers.get('Content-Type', '')
+        if 'charset=' in content_type:
+            encoding = content_type.split('charset=')[-1].strip()
+        else:
+            encoding = resp.encoding or 'utf-8'
+        
+        # Парсим HTML
+        soup = BeautifulSoup(resp.text, "html.parser")
+        
+        # Удаляем ненужные элементы
+        for s in soup(['script', 'style', 'header', 'footer', 'nav', 'aside', 'meta']):
+            s.decompose()
+        
+        # Извлекаем текст
+        text = soup.get_text(separator="\n")
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        result = "\n".join(lines)
+        
+        # Ограничиваем длину результата
+        if len(result) > max_length:
+            result = result[:max_length] + f"\n[Текст обрезан. Полная длина: {len(result)} символов]"
             
-            # Ограничиваем длину результата
-            if len(result) > max_length:
-                result = result[:max_length] + f"\n[Текст обрезан. Полная длина: {len(result)} символов]"
-                
-            return result
+        return result
     except Exception as e:
         return f"[Ошибка загрузки страницы: {str(e)}]"
 
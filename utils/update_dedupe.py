@@ -0,0 +1,193 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+# Идемпотентность вебхука: какие update_id Telegram уже приняты
+UPDATE_DEDUPE_MAX_IDS = int(os.getenv("UPDATE_DEDUPE_MAX_IDS", "10000"))
+# Пустое значение отключает SQLite-окно (остается только память процесса)
+UPDATE_DEDUPE_DB_PATH = os.getenv("UPDATE_DEDUPE_DB_PATH", "data/updates.db")
+UPDATE_DEDUPE_WINDOW = float(os.getenv("UPDATE_DEDUPE_WINDOW", str(24 * 3600)))  # Telegram хранит обновления сутки
+PRUNE_EVERY = 500  # Раз в сколько новых обновлений чистить окно SQLite
+
+
+class UpdateDeduplicator:
+    """
+    Отсекает повторные доставки обновлений Telegram по update_id.
+
+    Недавние id держатся в ограниченном OrderedDict. Если задан
+    ``db_path``, id дополнительно пишутся в SQLite с временем приема,
+    поэтому повтор, пришедший после рестарта или вытеснения из памяти,
+    тоже распознается (в пределах ``window`` секунд). Вебхук вызывает
+    ``aclaim``/``arelease``: запись в SQLite идет в отдельном потоке.
+    """
+
+    def __init__(
+        self,
+        max_ids: int = UPDATE_DEDUPE_MAX_IDS,
+        db_path: Optional[str] = UPDATE_DEDUPE_DB_PATH,
+        window: float = UPDATE_DEDUPE_WINDOW
+    ):
+        self.max_ids = max(1, max_ids)
+        self.db_path = db_path or None
+        self.window = window
+        self._lock = threading.Lock()  # Память и счетчики
+        self._db_lock = threading.Lock()  # Соединение SQLite
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._since_prune = 0
+        self._stats = {"accepted": 0, "suppressed": 0, "suppressed_memory": 0, "suppressed_db": 0, "released": 0}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """Открывает базу при первом обращении. Вызывается под _db_lock."""
+        if self.db_path is None or self._conn is not None:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_updates (
+                    update_id INTEGER PRIMARY KEY,
+                    received REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_updates_received ON seen_updates(received)")
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            print(f"Error opening update dedupe DB: {e}")
+            self.db_path = None
+        return self._conn
+
+    def _writer(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedupe-write")
+            return self._executor
+
+    def _remember(self, update_id: int) -> None:
+        self._recent[update_id] = None
+        while len(self._recent) > self.max_ids:
+            self._recent.popitem(last=False)
+
+    def _claim_memory(self, update_id: int) -> bool:
+        """
+        Проверка и отметка в памяти. Отметка ставится сразу, до записи в
+        SQLite, чтобы параллельный повтор отсекся уже здесь.
+        """
+        with self._lock:
+            if update_id in self._recent:
+                self._recent.move_to_end(update_id)
+                self._stats["suppressed"] += 1
+                self._stats["suppressed_memory"] += 1
+                return False
+            self._remember(update_id)
+            return True
+
+    def _claim_db(self, update_id: int) -> bool:
+        """Запись id в окно SQLite; при ошибке записи обновление считается новым."""
+        with self._db_lock:
+            conn = self._db()
+            if conn is not None:
+                try:
+                    now = time.time()
+                    inserted = conn.execute(
+                        "INSERT OR IGNORE INTO seen_updates (update_id, received) VALUES (?, ?)",
+                        (update_id, now)
+                    ).rowcount
+                    self._since_prune += 1
+                    if self._since_prune >= PRUNE_EVERY:
+                        conn.execute("DELETE FROM seen_updates WHERE received < ?", (now - self.window,))
+                        self._since_prune = 0
+                    conn.commit()
+                    if not inserted:
+                        with self._lock:
+                            self._stats["suppressed"] += 1
+                            self._stats["suppressed_db"] += 1
+                        return False
+                except Exception as e:
+                    print(f"Error recording update {update_id}: {e}")
+
+        with self._lock:
+            self._stats["accepted"] += 1
+        return True
+
+    def claim(self, update_id: int) -> bool:
+        """
+        Отмечает обновление как принятое.
+
+        Args:
+            update_id: update_id из вебхука Telegram
+
+        Returns:
+            bool: True если обновление новое, False если это повтор
+        """
+        return self._claim_memory(update_id) and self._claim_db(update_id)
+
+    async def aclaim(self, update_id: int) -> bool:
+        """
+        Асинхронный ``claim`` для вебхука: проверка в памяти идет сразу,
+        запись в SQLite - в потоке записи, не останавливая цикл событий.
+        """
+        if not self._claim_memory(update_id):
+            return False
+        if self.db_path is None:
+            return self._claim_db(update_id)
+        return await asyncio.get_running_loop().run_in_executor(self._writer(), self._claim_db, update_id)
+
+    def _release_memory(self, update_id: int) -> None:
+        with self._lock:
+            self._recent.pop(update_id, None)
+            self._stats["released"] += 1
+
+    def _release_db(self, update_id: int) -> None:
+        with self._db_lock:
+            conn = self._db()
+            if conn is not None:
+                try:
+                    conn.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+                    conn.commit()
+                except Exception as e:
+                    print(f"Error releasing update {update_id}: {e}")
+
+    def release(self, update_id: int) -> None:
+        """
+        Снимает отметку, чтобы повторная доставка была обработана
+        (например, если мы ответили Telegram 503 и ждем повтора).
+        """
+        self._release_memory(update_id)
+        self._release_db(update_id)
+
+    async def arelease(self, update_id: int) -> None:
+        """Асинхронный ``release``: удаление из SQLite идет в потоке записи."""
+        self._release_memory(update_id)
+        if self.db_path is not None:
+            await asyncio.get_running_loop().run_in_executor(self._writer(), self._release_db, update_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики для /status."""
+        with self._lock:
+            return {
+                **self._stats,
+                "resident_ids": len(self._recent),
+                "persistent": self.db_path is not None,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
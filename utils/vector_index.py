@@ -0,0 +1,702 @@
+import os
+import threading
+import numpy as np
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Iterable
+import logging
+
+logger = logging.getLogger("vector_index")
+
+# Начальная ёмкость матрицы (в строках); при заполнении удваивается
+INITIAL_CAPACITY = 256
+
+# Строк за один шаг скоринга: квантованный блок приводится к float32 по частям
+SCORE_BLOCK_ROWS = 1024
+
+# Форматы хранения векторов: float32 (точный), float16 (2x), int8 с масштабом на вектор (~4x)
+STORAGE_FORMATS = ("float32", "float16", "int8")
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Результат поиска: (score, id, file_path, chunk_index, text)
+SearchResult = Tuple[float, str, str, int, str]
+
+
+def _int8_scale(vector: np.ndarray) -> float:
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    return peak / 127.0 if peak > 0 else 1.0
+
+
+def encode_embedding(embedding: Sequence[float], storage: str = "float32") -> bytes:
+    """
+    Кодирует эмбеддинг в BLOB выбранного формата.
+    Для int8 перед значениями пишется float32-масштаб вектора.
+
+    Args:
+        embedding: Эмбеддинг
+        storage: Формат из STORAGE_FORMATS
+
+    Returns:
+        bytes: BLOB для SQLite
+    """
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    if storage == "float16":
+        return vector.astype(np.float16).tobytes()
+    if storage == "int8":
+        scale = _int8_scale(vector)
+        return np.float32(scale).tobytes() + np.round(vector / scale).astype(np.int8).tobytes()
+    return vector.tobytes()
+
+
+def decode_embedding(blob: bytes, storage: Optional[str] = None) -> np.ndarray:
+    """
+    Декодирует BLOB в float32-вектор (None - старые строки в float32).
+
+    Args:
+        blob: BLOB из SQLite
+        storage: Формат, в котором BLOB был записан
+
+    Returns:
+        np.ndarray: float32-вектор
+    """
+    if storage == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if storage == "int8":
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def rerank(
+    query_embedding: Sequence[float],
+    candidates: Sequence[SearchResult],
+    exact: Mapping[str, Sequence[float]],
+    top_k: int,
+    min_score: float = 0.0
+) -> List[SearchResult]:
+    """
+    Пересчитывает сходство кандидатов грубого поиска по точным float32-векторам.
+    Для кандидата без точного вектора остается оценка квантованного индекса.
+
+    Args:
+        query_embedding: Эмбеддинг запроса
+        candidates: Результаты грубого поиска
+        exact: Точные векторы {id: эмбеддинг}
+        top_k: Количество результатов
+        min_score: Минимальный порог сходства (по точной оценке)
+
+    Returns:
+        List[SearchResult]: Результаты по убыванию сходства
+    """
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    query_norm = float(np.linalg.norm(query))
+    rescored = []
+    for score, vector_id, file_path, chunk_index, text in candidates:
+        vector = exact.get(vector_id)
+        if vector is not None and query_norm > 0:
+            vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+            norm = float(np.linalg.norm(vector))
+            score = float(vector @ query) / (norm * query_norm) if norm else 0.0
+        rescored.append((score, vector_id, file_path, chunk_index, text))
+    rescored.sort(key=lambda result: -result[0])
+    return [result for result in rescored if result[0] >= min_score][:top_k]
+
+
+class VectorIndex:
+    """
+    Резидентный индекс эмбеддингов для семантического поиска.
+
+    Хранит одну непрерывную матрицу с заранее нормализованными строками
+    и параллельные таблицы id/файлов/текстов. Запрос оценивается
+    матрично-векторным произведением, top-k выбирается через
+    ``np.argpartition``. Индекс потокобезопасен: все операции идут под
+    одной блокировкой.
+
+    При ``storage`` float16 или int8 (с масштабом на строку) матрица
+    занимает в 2 или 4 раза меньше памяти, а оценки приближенные -
+    точный порядок восстанавливает ``rerank``.
+
+    Это бэкенд "flat" (полный перебор). Подклассы (см. IVFIndex) сужают
+    перебор через ``_candidate_rows`` и следят за перемещением строк.
+    """
+
+    backend = "flat"
+
+    def __init__(self, dim: int, storage: str = "float32"):
+        if storage not in STORAGE_FORMATS:
+            raise ValueError(f"Unknown vector storage format: {storage}")
+        self.dim = dim
+        self.storage = storage
+        self._dtype = STORAGE_DTYPES[storage]
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, dim), dtype=self._dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._file_paths: List[str] = []
+        self._chunk_indexes: List[int] = []
+        self._texts: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self._positions
+
+    @property
+    def quantized(self) -> bool:
+        return self.storage != "float32"
+
+    @property
+    def nbytes(self) -> int:
+        """Память, занятая векторами (без текстов)."""
+        with self._lock:
+            size = self._size
+            scales = self._scales[:size].nbytes if self.storage == "int8" else 0
+            return int(self._matrix[:size].nbytes + scales)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        """Нормализует вектор к единичной длине (нулевой вектор остаётся нулевым)."""
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return vector
+        return vector / norm
+
+    def _ensure_capacity(self, rows: int) -> None:
+        """Расширяет матрицу, чтобы вместить ``rows`` строк."""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        grown = np.zeros((new_capacity, self.dim), dtype=self._dtype)
+        grown[: self._size] = self._matrix[: self._size]
+        self._matrix = grown
+        scales = np.ones(new_capacity, dtype=np.float32)
+        scales[: self._size] = self._scales[: self._size]
+        self._scales = scales
+
+    def _store_row(self, row: int, vector: np.ndarray) -> None:
+        """Записывает нормализованный вектор в строку матрицы в формате хранения."""
+        if self.storage == "int8":
+            scale = _int8_scale(vector)
+            self._matrix[row] = np.round(vector / scale).astype(np.int8)
+            self._scales[row] = scale
+        else:
+            self._matrix[row] = vector
+
+    def _dequantized(self, start: int, end: int) -> np.ndarray:
+        """Строки [start, end) в float32."""
+        block = self._matrix[start:end].astype(np.float32, copy=False)
+        if self.storage == "int8":
+            block = block * self._scales[start:end, None]
+        return block
+
+    def _scores(self, size: int, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Сходство запроса со строками ``rows`` (None - со всеми строками).
+        Квантованная матрица и выборки строк обрабатываются блоками.
+        """
+        if rows is None:
+            if not self.quantized:
+                return self._matrix[:size] @ query
+            scores = np.empty(size, dtype=np.float32)
+            for start in range(0, size, SCORE_BLOCK_ROWS):
+                end = min(start + SCORE_BLOCK_ROWS, size)
+                scores[start:end] = self._matrix[start:end].astype(np.float32) @ query
+            if self.storage == "int8":
+                scores *= self._scales[:size]
+            return scores
+
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            part = rows[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(part)] = self._matrix[part].astype(np.float32, copy=False) @ query
+        if self.storage == "int8":
+            scores *= self._scales[rows]
+        return scores
+
+    def _candidate_rows(self, query: np.ndarray, size: int, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        """Строки, которые нужно оценить для запроса; None - все строки."""
+        return None
+
+    def _row_stored(self, row: int, vector: np.ndarray) -> None:
+        """Вызывается после записи нормализованного вектора в строку."""
+
+    def _row_moved(self, source: int, target: int) -> None:
+        """Вызывается, когда удаление переносит строку ``source`` на место ``target``."""
+
+    def needs_training(self) -> bool:
+        """Нужно ли (пере)обучить структуру поиска. У полного перебора ее нет."""
+        return False
+
+    def maybe_train(self) -> bool:
+        """Обучает структуру поиска, если это нужно бэкенду. Returns: True если обучение было."""
+        return False
+
+    def save(self, path: str) -> None:
+        """Сохраняет структуру поиска (у полного перебора ее нет)."""
+
+    def restore(self, path: str) -> bool:
+        """Восстанавливает структуру поиска после ``load_rows``. Returns: True если восстановлена."""
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние индекса для /status."""
+        return {
+            "backend": self.backend,
+            "storage": self.storage,
+            "rows": self._size,
+            "bytes": self.nbytes,
+        }
+
+    def clear(self) -> None:
+        """Полностью очищает индекс."""
+        with self._lock:
+            self._matrix = np.zeros((0, self.dim), dtype=self._dtype)
+            self._scales = np.zeros(0, dtype=np.float32)
+            self._size = 0
+            self._ids = []
+            self._file_paths = []
+            self._chunk_indexes = []
+            self._texts = []
+            self._positions = {}
+
+    def upsert(
+        self,
+        vector_id: str,
+        file_path: str,
+        chunk_index: int,
+        embedding: Sequence[float],
+        text: str
+    ) -> bool:
+        """
+        Добавляет или обновляет одну строку индекса.
+
+        Args:
+            vector_id: Уникальный ID вектора
+            file_path: Путь к исходному файлу
+            chunk_index: Номер чанка в файле
+            embedding: Эмбеддинг (список или numpy-массив)
+            text: Текст чанка
+
+        Returns:
+            bool: True если строка записана, False при несовпадении размерности
+        """
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            logger.warning(
+                f"Skipping vector {vector_id}: dimension {vector.shape[0]} != {self.dim}"
+            )
+            return False
+        vector = self._normalize(vector)
+
+        with self._lock:
+            row = self._positions.get(vector_id)
+            if row is None:
+                self._ensure_capacity(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._positions[vector_id] = row
+                self._ids.append(vector_id)
+                self._file_paths.append(file_path)
+                self._chunk_indexes.append(chunk_index)
+                self._texts.append(text)
+            else:
+                self._file_paths[row] = file_path
+                self._chunk_indexes[row] = chunk_index
+                self._texts[row] = text
+            self._store_row(row, vector)
+            self._row_stored(row, vector)
+        return True
+
+    def update_chunk_index(self, vector_id: str, chunk_index: int) -> bool:
+        """Обновляет номер чанка без изменения вектора."""
+        with self._lock:
+            row = self._positions.get(vector_id)
+            if row is None:
+                return False
+            self._chunk_indexes[row] = chunk_index
+            return True
+
+    def load_rows(self, rows: Iterable[Tuple[str, str, int, bytes, str]]) -> int:
+        """
+        Загружает строки из таблицы ``vectors`` (id, file_path, chunk_index, embedding, text).
+
+        Args:
+            rows: Итерируемые строки; эмбеддинг - float32-BLOB или уже декодированный массив
+
+        Returns:
+            int: Количество загруженных строк
+        """
+        loaded = 0
+        with self._lock:
+            for vector_id, file_path, chunk_index, embedding_blob, text in rows:
+                if isinstance(embedding_blob, (bytes, memoryview)):
+                    embedding = np.frombuffer(embedding_blob, dtype=np.float32)
+                else:
+                    embedding = embedding_blob
+                if self.upsert(vector_id, file_path, chunk_index, embedding, text):
+                    loaded += 1
+            self.loaded = True
+        return loaded
+
+    def remove(self, vector_ids: Iterable[str]) -> int:
+        """
+        Удаляет строки по ID. Освободившаяся строка заполняется последней,
+        поэтому матрица остаётся непрерывной.
+
+        Args:
+            vector_ids: ID векторов для удаления
+
+        Returns:
+            int: Количество удаленных строк
+        """
+        removed = 0
+        with self._lock:
+            for vector_id in vector_ids:
+                row = self._positions.pop(vector_id, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self._scales[row] = self._scales[last]
+                    self._row_moved(last, row)
+                    self._ids[row] = self._ids[last]
+                    self._file_paths[row] = self._file_paths[last]
+                    self._chunk_indexes[row] = self._chunk_indexes[last]
+                    self._texts[row] = self._texts[last]
+                    self._positions[self._ids[row]] = row
+                self._ids.pop()
+                self._file_paths.pop()
+                self._chunk_indexes.pop()
+                self._texts.pop()
+                self._size = last
+                removed += 1
+        return removed
+
+    def remove_file(self, file_path: str) -> int:
+        """Удаляет все строки, относящиеся к файлу."""
+        with self._lock:
+            ids = [vid for vid, fp in zip(self._ids, self._file_paths) if fp == file_path]
+            return self.remove(ids)
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        min_score: float = 0.0,
+        nprobe: Optional[int] = None
+    ) -> List[SearchResult]:
+        """
+        Находит top_k ближайших строк по косинусному сходству.
+
+        Args:
+            query_embedding: Эмбеддинг запроса
+            top_k: Количество результатов
+            min_score: Минимальный порог сходства
+            nprobe: Сколько списков просматривать (только для IVFIndex)
+
+        Returns:
+            List[SearchResult]: Результаты по убыванию сходства
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim or top_k <= 0:
+            return []
+        query = self._normalize(query)
+        if not query.any():
+            return []
+
+        with self._lock:
+            size = self._size
+            if size == 0:
+                return []
+            rows = self._candidate_rows(query, size, nprobe)
+            scores = self._scores(size, query, rows)
+            count = len(scores)
+            if count == 0:
+                return []
+
+            k = min(top_k, count)
+            if k < count:
+                candidates = np.argpartition(-scores, k - 1)[:k]
+            else:
+                candidates = np.arange(count)
+            candidates = candidates[np.argsort(-scores[candidates])]
+
+            results = []
+            for position in candidates:
+                score = float(scores[position])
+                if score < min_score:
+                    break
+                row = rows[position] if rows is not None else position
+                results.append((
+                    score,
+                    self._ids[row],
+                    self._file_paths[row],
+                    self._chunk_indexes[row],
+                    self._texts[row],
+                ))
+            return results
+
+
+# Параметры IVF по умолчанию
+IVF_NPROBE = 16  # Сколько ближайших списков просматривает запрос
+IVF_MIN_TRAIN_ROWS = 5000  # Меньше строк - полный перебор быстрее любой структуры
+IVF_SAMPLE_PER_LIST = 32  # Строк выборки на список при обучении k-means
+IVF_ITERATIONS = 10
+
+
+def spherical_kmeans(
+    data: np.ndarray,
+    k: int,
+    iterations: int = IVF_ITERATIONS,
+    rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """
+    k-means по косинусному сходству для нормализованных строк.
+
+    Args:
+        data: Нормализованные float32-строки
+        k: Количество центроидов
+        iterations: Число итераций
+        rng: Генератор случайных чисел
+
+    Returns:
+        np.ndarray: Нормализованные центроиды (k x dim)
+    """
+    rng = rng or np.random.default_rng()
+    k = max(1, min(k, len(data)))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        present = sorted_labels[starts]
+        # Пустые списки получают случайные точки выборки
+        empty = np.setdiff1d(np.arange(k), present)
+        centroids[present] = sums / norms
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), size=len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex(VectorIndex):
+    """
+    Приближенный индекс IVF-flat поверх той же матрицы строк.
+
+    Строки распределены по спискам ближайших центроидов (сферический
+    k-means), запрос оценивает только строки ``nprobe`` ближайших списков.
+    Новые строки сразу попадают в свой список, удаленные уходят вместе со
+    строкой. Строки без списка (-1) просматриваются всегда, поэтому
+    переобучение и восстановление не теряют результатов. Пока строк меньше
+    ``min_train_rows``, работает полный перебор; когда индекс вырастает
+    вдвое с последнего обучения, центроиды обучаются заново.
+    """
+
+    backend = "ivf"
+
+    def __init__(
+        self,
+        dim: int,
+        storage: str = "float32",
+        nlist: int = 0,
+        nprobe: int = IVF_NPROBE,
+        min_train_rows: int = IVF_MIN_TRAIN_ROWS,
+        seed: int = 0
+    ):
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)
+        super().__init__(dim, storage)
+        self.nlist = nlist  # 0 - подбирается при обучении (~sqrt(N))
+        self.nprobe = nprobe
+        self.min_train_rows = max(1, min_train_rows)
+        self.trained_rows = 0
+        self._train_lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def _ensure_capacity(self, rows: int) -> None:
+        super()._ensure_capacity(rows)
+        capacity = self._matrix.shape[0]
+        if len(self._assign) < capacity:
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[: len(self._assign)] = self._assign
+            self._assign = grown
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+            self._centroids = None
+            self._assign = np.zeros(0, dtype=np.int32)
+            self.trained_rows = 0
+
+    def _row_stored(self, row: int, vector: np.ndarray) -> None:
+        if self._centroids is not None:
+            self._assign[row] = int(np.argmax(self._centroids @ vector))
+
+    def _row_moved(self, source: int, target: int) -> None:
+        self._assign[target] = self._assign[source]
+
+    def _candidate_rows(self, query: np.ndarray, size: int, nprobe: Optional[int]) -> Optional[np.ndarray]:
+        if self._centroids is None:
+            return None
+        nprobe = min(nprobe or self.nprobe, len(self._centroids))
+        if nprobe >= len(self._centroids):
+            return None
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        assign = self._assign[:size]
+        return np.flatnonzero(np.isin(assign, probes) | (assign < 0))
+
+    def _assign_rows(self, centroids: np.ndarray, missing_only: bool = False) -> None:
+        """Распределяет строки по спискам блоками, отпуская блокировку между блоками."""
+        start = 0
+        while True:
+            with self._lock:
+                if self._centroids is not centroids or start >= self._size:
+                    return
+                end = min(start + SCORE_BLOCK_ROWS, self._size)
+                labels = np.argmax(self._dequantized(start, end) @ centroids.T, axis=1)
+                if missing_only:
+                    block = self._assign[start:end]
+                    block[block < 0] = labels[block < 0]
+                else:
+                    self._assign[start:end] = labels
+            start = end
+
+    def _install(self, centroids: np.ndarray, assign: Optional[Dict[str, int]] = None) -> None:
+        """Ставит новые центроиды; строки получают списки из ``assign`` или вычисляются."""
+        with self._lock:
+            self._centroids = centroids
+            self._assign[: self._size] = -1
+            if assign:
+                for row, vector_id in enumerate(self._ids):
+                    self._assign[row] = assign.get(vector_id, -1)
+        self._assign_rows(centroids, missing_only=bool(assign))
+
+    def needs_training(self) -> bool:
+        size = self._size
+        if size < self.min_train_rows:
+            return False
+        return self._centroids is None or size >= 2 * self.trained_rows
+
+    def maybe_train(self) -> bool:
+        """
+        Обучает центроиды на случайной выборке строк, если индекс достаточно
+        вырос. k-means идет без блокировки индекса - поиск в это время
+        продолжается по старой структуре.
+
+        Returns:
+            bool: True если центроиды обновлены
+        """
+        with self._train_lock:
+            with self._lock:
+                if not self.needs_training():
+                    return False
+                size = self._size
+                nlist = self.nlist or int(np.clip(np.sqrt(size), 16, 4096))
+                sample = self._rng.choice(size, size=min(size, nlist * IVF_SAMPLE_PER_LIST), replace=False)
+                sample.sort()
+                data = self._matrix[sample].astype(np.float32)
+                if self.storage == "int8":
+                    data *= self._scales[sample, None]
+
+            norms = np.linalg.norm(data, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = spherical_kmeans(data / norms, nlist, rng=self._rng).astype(np.float32)
+            self._install(centroids)
+            with self._lock:
+                self.trained_rows = size
+            logger.info(f"IVF index trained: {len(centroids)} lists over {size} vectors")
+            return True
+
+    def save(self, path: str) -> None:
+        """Сохраняет центроиды и списки строк в .npz (атомарно через временный файл)."""
+        with self._lock:
+            if self._centroids is None:
+                return
+            centroids = self._centroids.copy()
+            ids = np.array(self._ids, dtype=str)
+            assign = self._assign[: self._size].copy()
+            trained_rows = self.trained_rows
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, centroids=centroids, ids=ids, assign=assign, trained_rows=trained_rows)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error saving IVF index to {path}: {e}")
+
+    def restore(self, path: str) -> bool:
+        """
+        Загружает центроиды и списки, сохраненные ``save``. Строки, которых
+        в файле нет, распределяются по спискам заново.
+
+        Returns:
+            bool: True если структура восстановлена
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                centroids = data["centroids"].astype(np.float32)
+                assign = dict(zip(data["ids"].tolist(), data["assign"].tolist()))
+                trained_rows = int(data["trained_rows"])
+        except Exception as e:
+            logger.error(f"Error loading IVF index from {path}: {e}")
+            return False
+        if centroids.ndim != 2 or centroids.shape[1] != self.dim:
+            logger.warning(f"Ignoring IVF index {path}: dimension mismatch")
+            return False
+        self._install(centroids, assign)
+        with self._lock:
+            self.trained_rows = trained_rows
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "nlist": len(self._centroids) if self._centroids is not None else 0,
+                "nprobe": self.nprobe,
+                "trained_rows": self.trained_rows,
+                "unassigned": int(np.count_nonzero(self._assign[: self._size] < 0)),
+            })
+        return stats
+
+
+# Доступные бэкенды поиска
+INDEX_BACKENDS = ("flat", "ivf")
+
+
+def make_index(dim: int, storage: str = "float32", backend: str = "flat", **options: Any) -> VectorIndex:
+    """
+    Создает индекс выбранного бэкенда.
+
+    Args:
+        dim: Размерность векторов
+        storage: Формат хранения (см. STORAGE_FORMATS)
+        backend: "flat" (полный перебор) или "ivf"
+        options: Параметры IVF: nlist, nprobe, min_train_rows
+
+    Returns:
+        VectorIndex: Индекс
+    """
+    if backend == "ivf":
+        return IVFIndex(dim, storage=storage, **options)
+    if backend == "flat":
+        return VectorIndex(dim, storage=storage)
+    raise ValueError(f"Unknown vector index backend: {backend}")
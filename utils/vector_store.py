@@ -4,12 +4,18 @@ import json
 import hashlib
 import asyncio
 import sqlite3
+import threading
+import time
 import numpy as np
 from typing import Dict, List, Callable, Any, Optional, Union, Tuple, Awaitable
 import httpx
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type, wait_exponential
+from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type, retry_if_exception, wait_exponential
 import logging
 
+from utils.http_client import get_client
+from utils.sqlite_store import SQLiteStore
+from utils.vector_index import INDEX_BACKENDS, STORAGE_FORMATS, decode_embedding, encode_embedding, make_index, rerank
+
 # Конфигурация логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("vector_store")
@@ -18,63 +24,391 @@ logger = logging.getLogger("vector_store")
 SQLITE_DB_PATH = "data/selesta_memory.db"
 VECTOR_META_PATH = "data/vector_store.meta.json"
 EMBED_DIM = 1536  # Для OpenAI ada-002
+EMBED_MODEL = "text-embedding-ada-002"
+EMBED_CACHE_MAX_ROWS = 50_000  # Предел размера кэша эмбеддингов
+EMBED_CACHE_PRUNE_EVERY = 1000  # Через сколько новых записей проверять предел
 DEFAULT_CHUNK_SIZE = 900
 DEFAULT_CHUNK_OVERLAP = 120
 MAX_CONCURRENT_REQUESTS = 5  # Ограничение количества одновременных запросов
+EMBED_BATCH_MAX_ITEMS = 128  # Максимум текстов в одном запросе к embeddings API
+EMBED_BATCH_MAX_TOKENS = 100_000  # Оценочный лимит токенов на один запрос
+# Формат хранения векторов в БД и индексе: float32, float16 или int8 (см. vector_index).
+# Квантование уменьшает и память индекса, и таблицу vectors на диске
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+if VECTOR_STORAGE not in STORAGE_FORMATS:
+    VECTOR_STORAGE = "float32"
+# Хранить ли float32-копию квантованных векторов в vector_exact для точного
+# пересчета сходства. Копия возвращает точность int8, но делает базу больше,
+# чем при float32 без квантования, поэтому включается явно
+VECTOR_EXACT_COPY = os.getenv("VECTOR_EXACT_COPY", "0").lower() in ("1", "true", "yes")
+# Бэкенд поиска: flat (полный перебор) или ivf (приближенный, для больших корпусов)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "flat")
+if VECTOR_INDEX_BACKEND not in INDEX_BACKENDS:
+    VECTOR_INDEX_BACKEND = "flat"
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 - примерно sqrt(числа векторов)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # Больше - выше полнота, медленнее поиск
+IVF_MIN_TRAIN_ROWS = int(os.getenv("IVF_MIN_TRAIN_ROWS", "5000"))
+RERANK_FACTOR = 4  # Во сколько раз больше кандидатов берет грубый поиск перед точным пересчетом
+RERANK_MARGIN = 0.05  # Запас порога сходства для грубого поиска по квантованным векторам
 
 # Семафор для ограничения количества одновременных запросов к API
 embed_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
-def init_sqlite_db() -> Optional[sqlite3.Connection]:
+def embedding_cache_key(text: str, model: str = EMBED_MODEL) -> str:
+    """
+    Возвращает ключ кэша эмбеддингов: sha256 от модели и текста.
+
+    Args:
+        text: Текст
+        model: Модель эмбеддинга
+
+    Returns:
+        str: Hex-строка sha256
+    """
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+def chunk_hash(text: str) -> str:
+    """
+    Возвращает SHA256 хеш текста чанка (основа стабильного ID чанка).
+
+    Args:
+        text: Текст чанка
+
+    Returns:
+        str: Hex-строка sha256
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _migrate_vectors_schema(conn: sqlite3.Connection) -> None:
+    """
+    Добавляет колонки chunk_hash и embedding_format в старые базы.
+
+    Строки старого формата (ID вида ``файл:номер``) заменятся при следующей
+    векторизации файла, поэтому их эмбеддинги заранее переносятся в
+    embedding_cache - повторной оплаты API не будет.
+    """
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(vectors)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if "embedding_format" not in columns:
+        # NULL - строки в float32, записанные до появления квантования
+        cursor.execute("ALTER TABLE vectors ADD COLUMN embedding_format TEXT")
+    if "chunk_hash" in columns:
+        return
+
+    cursor.execute("ALTER TABLE vectors ADD COLUMN chunk_hash TEXT")
+    cursor.execute("SELECT text, embedding FROM vectors")
+    cursor.executemany("""
+        INSERT OR IGNORE INTO embedding_cache (key, model, embedding)
+        VALUES (?, ?, ?)
+    """, [
+        (embedding_cache_key(text, EMBED_MODEL), EMBED_MODEL, embedding_blob)
+        for text, embedding_blob in cursor.fetchall()
+    ])
+    logger.info("Migrated vectors table: added chunk_hash column")
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Создает таблицы и индексы, если их нет (выполняется в транзакции записи)."""
+    cursor = conn.cursor()
+
+    # Создаем таблицу для векторов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vectors (
+            id TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            embedding BLOB NOT NULL,
+            text TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            chunk_hash TEXT,
+            embedding_format TEXT
+        )
+    """)
+
+    # Создаем таблицу для метаданных файлов (SHA256 хэши)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS file_meta (
+            file_path TEXT PRIMARY KEY,
+            sha256_hash TEXT NOT NULL,
+            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Создаем таблицу кэша эмбеддингов (ключ - sha256 от модели и текста)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Точные float32-векторы чанков для пересчета сходства при квантованном
+    # хранении (VECTOR_EXACT_COPY); в отличие от embedding_cache таблица не прореживается
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vector_exact (
+            id TEXT PRIMARY KEY,
+            embedding BLOB NOT NULL
+        )
+    """)
+
+    _migrate_vectors_schema(conn)
+
+    # Создаем индексы для быстрого поиска
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_path ON vectors(file_path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sha256 ON file_meta(sha256_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache(created)")
+
+def init_sqlite_db() -> Optional[SQLiteStore]:
     """
     Инициализирует SQLite базу данных для хранения векторов.
     Создает таблицы если их нет.
 
+    Чтение идет через пул соединений в потоках, запись - через одно
+    сериализованное соединение (см. SQLiteStore), поэтому поиск не ждет
+    транзакций векторизации и не блокирует цикл событий.
+
     Returns:
-        Optional[sqlite3.Connection]: Соединение с БД или None при ошибке
+        Optional[SQLiteStore]: Хранилище или None при ошибке
     """
     try:
-        # Создаем директорию если не существует
-        os.makedirs(os.path.dirname(SQLITE_DB_PATH), exist_ok=True)
-
-        # Подключаемся к БД
-        conn = sqlite3.connect(SQLITE_DB_PATH, check_same_thread=False)
-        cursor = conn.cursor()
-
-        # Создаем таблицу для векторов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS vectors (
-                id TEXT PRIMARY KEY,
-                file_path TEXT NOT NULL,
-                chunk_index INTEGER NOT NULL,
-                embedding BLOB NOT NULL,
-                text TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Создаем таблицу для метаданных файлов (SHA256 хэши)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS file_meta (
-                file_path TEXT PRIMARY KEY,
-                sha256_hash TEXT NOT NULL,
-                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Создаем индексы для быстрого поиска
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_path ON vectors(file_path)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sha256 ON file_meta(sha256_hash)")
-
-        conn.commit()
+        store = SQLiteStore(SQLITE_DB_PATH)
+        store.write(_create_schema)
         logger.info(f"SQLite database initialized at {SQLITE_DB_PATH}")
-        return conn
+        return store
     except Exception as e:
         logger.error(f"Failed to initialize SQLite database: {e}")
         return None
 
-# Инициализируем SQLite
-db_conn = init_sqlite_db()
+# База открывается лениво: импорт модуля не создает файлов и не выполняет DDL
+_db: Optional[SQLiteStore] = None
+_db_failed = False
+_db_lock = threading.Lock()
+
+def get_db() -> Optional[SQLiteStore]:
+    """
+    Возвращает хранилище, открывая базу при первом обращении.
+    После неудачного открытия возвращает None, пока не вызван open_vector_store.
+
+    Returns:
+        Optional[SQLiteStore]: Хранилище или None, если база недоступна
+    """
+    global _db, _db_failed
+    if _db is None and not _db_failed:
+        with _db_lock:
+            if _db is None and not _db_failed:
+                _db = init_sqlite_db()
+                _db_failed = _db is None
+    return _db
+
+async def _get_db_async() -> Optional[SQLiteStore]:
+    """get_db для асинхронного кода: первое открытие идет в потоке, а не в цикле событий."""
+    if _db is not None or _db_failed:
+        return _db
+    return await asyncio.to_thread(get_db)
+
+def open_vector_store() -> bool:
+    """
+    Явно открывает базу (хук запуска сервера). Сбрасывает прошлую ошибку открытия.
+
+    Returns:
+        bool: True если база готова
+    """
+    global _db_failed
+    with _db_lock:
+        _db_failed = False
+    return get_db() is not None
+
+def close_vector_store() -> None:
+    """Закрывает соединения и потоки хранилища (хук остановки сервера)."""
+    global _db
+    if vector_index.loaded:
+        # Списки IVF меняются при каждой вставке; сохраняем их, чтобы не пересчитывать после рестарта
+        vector_index.save(ann_index_path())
+    with _db_lock:
+        store, _db = _db, None
+    if store is not None:
+        store.close()
+
+# Коммит вместе с обновлением состояния в памяти и первичная загрузка
+# этого состояния из БД не должны перемежаться, иначе загрузка может
+# пропустить только что закоммиченные строки
+_memory_lock = threading.RLock()
+
+# Резидентный индекс векторов, загружается из SQLite при первом поиске
+vector_index = make_index(
+    EMBED_DIM,
+    storage=VECTOR_STORAGE,
+    backend=VECTOR_INDEX_BACKEND,
+    **({"nlist": IVF_NLIST, "nprobe": IVF_NPROBE, "min_train_rows": IVF_MIN_TRAIN_ROWS}
+       if VECTOR_INDEX_BACKEND == "ivf" else {})
+)
+
+def ann_index_path() -> str:
+    """Файл структуры поиска (центроиды IVF) рядом с базой векторов."""
+    return os.path.splitext(SQLITE_DB_PATH)[0] + f".{vector_index.backend}.npz"
+
+_training_thread: Optional[threading.Thread] = None
+_training_lock = threading.Lock()
+
+def _train_index() -> None:
+    """Обучает структуру поиска, если индекс вырос, и сохраняет ее на диск."""
+    try:
+        if vector_index.maybe_train():
+            vector_index.save(ann_index_path())
+    except Exception as e:
+        logger.error(f"Error training vector index: {e}")
+
+def _train_in_background() -> None:
+    """
+    Запускает обучение в фоновом потоке, если оно нужно и еще не идет.
+    Пока k-means считается, поиск работает по прежней структуре, а без
+    нее - полным перебором: необученные строки IVF просматриваются всегда.
+    """
+    global _training_thread
+    with _training_lock:
+        if not vector_index.needs_training():
+            return
+        if _training_thread is not None and _training_thread.is_alive():
+            return
+        _training_thread = threading.Thread(target=_train_index, name="vector-index-train", daemon=True)
+        _training_thread.start()
+
+class VectorStoreState:
+    """
+    Состояние векторного хранилища в памяти процесса.
+
+    Держит число чанков по файлам, поэтому проверка доступности не ходит
+    в базу. Счетчики загружаются из SQLite один раз, дальше их обновляют
+    векторизация и удаление - строго после успешного коммита.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.file_chunks: Dict[str, int] = {}
+        self.total_rows = 0
+        self.indexing = 0  # Количество идущих проходов векторизации
+        self.last_indexed: Optional[float] = None
+        self.reranked = 0  # Кандидатов, пересчитанных по точным векторам
+        self.rerank_fallbacks = 0  # ...и оставшихся с грубой оценкой (нет точного вектора)
+
+    @property
+    def available(self) -> bool:
+        """Есть ли в хранилище хотя бы один вектор (без обращения к БД)."""
+        return self.total_rows > 0
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        """Считает строки по файлам одним запросом (только при первом обращении)."""
+        with self._lock:
+            if self.loaded:
+                return
+            rows = conn.execute("SELECT file_path, COUNT(*) FROM vectors GROUP BY file_path").fetchall()
+            self.file_chunks = {file_path: count for file_path, count in rows}
+            self.total_rows = sum(self.file_chunks.values())
+            self.loaded = True
+
+    def set_file(self, file_path: str, chunks: int) -> None:
+        """Записывает новое число чанков файла."""
+        with self._lock:
+            self.total_rows += chunks - self.file_chunks.get(file_path, 0)
+            if chunks > 0:
+                self.file_chunks[file_path] = chunks
+            else:
+                self.file_chunks.pop(file_path, None)
+
+    def remove_file(self, file_path: str) -> None:
+        self.set_file(file_path, 0)
+
+    def begin_indexing(self) -> None:
+        with self._lock:
+            self.indexing += 1
+
+    def end_indexing(self) -> None:
+        with self._lock:
+            self.indexing = max(0, self.indexing - 1)
+            self.last_indexed = time.time()
+
+    def count_rerank(self, candidates: int, fallbacks: int) -> None:
+        with self._lock:
+            self.reranked += candidates - fallbacks
+            self.rerank_fallbacks += fallbacks
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние для /status."""
+        with self._lock:
+            return {
+                "ready": self.loaded,
+                "available": self.total_rows > 0,
+                "total_chunks": self.total_rows,
+                "files": len(self.file_chunks),
+                "chunks_per_file": dict(self.file_chunks),
+                "indexing": self.indexing > 0,
+                "last_indexed": self.last_indexed,
+                "index_loaded": vector_index.loaded,
+                "index": vector_index.stats(),
+                "rerank": {
+                    "enabled": VECTOR_EXACT_COPY,
+                    "exact": self.reranked,
+                    "coarse_fallbacks": self.rerank_fallbacks,
+                },
+            }
+
+store_state = VectorStoreState()
+
+def ensure_state_loaded() -> bool:
+    """
+    Загружает счетчики строк, если они еще не загружены.
+
+    Returns:
+        bool: True если состояние готово
+    """
+    if store_state.loaded:
+        return True
+    db = get_db()
+    if not db:
+        return False
+    try:
+        with _memory_lock:
+            db.read(store_state.load)
+        return True
+    except Exception as e:
+        logger.error(f"Error loading vector store state: {e}")
+        return False
+
+def _select_vectors(conn: sqlite3.Connection) -> List[Tuple[str, str, int, np.ndarray, str]]:
+    rows = conn.execute("SELECT id, file_path, chunk_index, embedding, text, embedding_format FROM vectors")
+    return [
+        (vector_id, file_path, chunk_index, decode_embedding(blob, storage), text)
+        for vector_id, file_path, chunk_index, blob, text, storage in rows
+    ]
+
+def ensure_index_loaded() -> bool:
+    """
+    Загружает резидентный индекс из SQLite, если он еще не загружен.
+
+    Returns:
+        bool: True если индекс готов к поиску
+    """
+    if vector_index.loaded:
+        return True
+    db = get_db()
+    if not db:
+        return False
+
+    try:
+        with _memory_lock:
+            if not vector_index.loaded:
+                loaded = vector_index.load_rows(db.read(_select_vectors))
+                logger.info(f"Vector index loaded: {loaded} vectors")
+                vector_index.restore(ann_index_path())
+        # Обучение - вне _memory_lock и вне первого поиска
+        _train_in_background()
+        return True
+    except Exception as e:
+        logger.error(f"Error loading vector index: {e}")
+        return False
 
 def file_hash(fname: str) -> str:
     """
@@ -128,13 +462,13 @@ def load_vector_meta() -> Dict[str, str]:
     Returns:
         Dict[str, str]: Словарь {имя_файла: sha256_хеш}
     """
-    if not db_conn:
+    db = get_db()
+    if not db:
         return {}
 
     try:
-        cursor = db_conn.cursor()
-        cursor.execute("SELECT file_path, sha256_hash FROM file_meta")
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        rows = db.read(lambda conn: conn.execute("SELECT file_path, sha256_hash FROM file_meta").fetchall())
+        return {row[0]: row[1] for row in rows}
     except Exception as e:
         logger.error(f"Error loading vector meta from DB: {e}")
         return {}
@@ -146,17 +480,15 @@ def save_vector_meta(meta: Dict[str, str]) -> None:
     Args:
         meta: Словарь метаданных для сохранения
     """
-    if not db_conn:
+    db = get_db()
+    if not db:
         return
 
     try:
-        cursor = db_conn.cursor()
-        for file_path, sha256_hash in meta.items():
-            cursor.execute("""
-                INSERT OR REPLACE INTO file_meta (file_path, sha256_hash, last_updated)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            """, (file_path, sha256_hash))
-        db_conn.commit()
+        db.write(lambda conn: conn.executemany("""
+            INSERT OR REPLACE INTO file_meta (file_path, sha256_hash, last_updated)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, list(meta.items())))
     except Exception as e:
         logger.error(f"Error saving vector meta to DB: {e}")
 
@@ -185,7 +517,7 @@ async def call_callback(callback: Optional[Callable[[str], Any]], message: str)
 async def get_embedding(
     text: str,
     api_key: str,
-    model: str = "text-embedding-ada-002"
+    model: str = EMBED_MODEL
 ) -> List[float]:
     """
     Получает эмбеддинг для текста с использованием OpenAI API.
@@ -211,19 +543,366 @@ async def get_embedding(
             "model": model
         }
 
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/embeddings",
-                headers=headers,
-                json=data
+        client = get_client("openai")
+        response = await client.post(
+            "https://api.openai.com/v1/embeddings",
+            headers=headers,
+            json=data,
+            timeout=30
+        )
+
+        # Проверяем ответ
+        response.raise_for_status()
+        response_data = response.json()
+
+        # Извлекаем эмбеддинг
+        return response_data["data"][0]["embedding"]
+
+def load_cached_embeddings(keys: List[str]) -> Dict[str, List[float]]:
+    """
+    Загружает эмбеддинги из кэша по ключам.
+
+    Args:
+        keys: Ключи кэша
+
+    Returns:
+        Dict[str, List[float]]: Найденные эмбеддинги {ключ: эмбеддинг}
+    """
+    db = get_db()
+    if not db or not keys:
+        return {}
+
+    found: Dict[str, List[float]] = {}
+    try:
+        cursor = db.reader().cursor()
+        unique_keys = list(dict.fromkeys(keys))
+        # SQLite ограничивает число параметров в запросе
+        for start in range(0, len(unique_keys), 500):
+            part = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            cursor.execute(
+                f"SELECT key, embedding FROM embedding_cache WHERE key IN ({placeholders})",
+                part
             )
+            for key, embedding_blob in cursor.fetchall():
+                found[key] = np.frombuffer(embedding_blob, dtype=np.float32).tolist()
+    except Exception as e:
+        logger.error(f"Error reading embedding cache: {e}")
+    return found
+
+def touch_cached_embeddings(keys: List[str]) -> None:
+    """
+    Обновляет время использования записей кэша (created), чтобы очистка
+    удаляла давно не использованные записи, а не просто самые старые.
+
+    Args:
+        keys: Ключи найденных в кэше записей
+    """
+    db = get_db()
+    if not db or not keys:
+        return
+
+    unique_keys = list(dict.fromkeys(keys))
+
+    def write(conn: sqlite3.Connection) -> None:
+        for start in range(0, len(unique_keys), 500):
+            part = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            conn.execute(
+                f"UPDATE embedding_cache SET created = CURRENT_TIMESTAMP WHERE key IN ({placeholders})",
+                part
+            )
+
+    try:
+        db.write(write)
+    except Exception as e:
+        logger.error(f"Error touching embedding cache: {e}")
+
+# Новых записей кэша с последней очистки
+_cache_writes_since_prune = 0
+
+def save_cached_embeddings(items: Dict[str, List[float]], model: str = EMBED_MODEL) -> None:
+    """
+    Сохраняет эмбеддинги в кэш. Каждые EMBED_CACHE_PRUNE_EVERY записей
+    кэш обрезается до EMBED_CACHE_MAX_ROWS.
+
+    Args:
+        items: Словарь {ключ: эмбеддинг}
+        model: Модель эмбеддинга
+    """
+    db = get_db()
+    if not db or not items:
+        return
+
+    rows = [
+        (key, model, np.array(embedding, dtype=np.float32).tobytes())
+        for key, embedding in items.items()
+    ]
+    try:
+        db.write(lambda conn: conn.executemany("""
+            INSERT OR REPLACE INTO embedding_cache (key, model, embedding, created)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        """, rows))
+    except Exception as e:
+        logger.error(f"Error writing embedding cache: {e}")
+        return
+
+    global _cache_writes_since_prune
+    _cache_writes_since_prune += len(rows)
+    if _cache_writes_since_prune >= EMBED_CACHE_PRUNE_EVERY:
+        _cache_writes_since_prune = 0
+        prune_embedding_cache()
+
+def prune_embedding_cache(max_rows: Optional[int] = None) -> int:
+    """
+    Удаляет давно не использованные записи кэша сверх лимита.
+
+    Args:
+        max_rows: Максимальное количество записей в кэше (по умолчанию EMBED_CACHE_MAX_ROWS)
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    db = get_db()
+    if not db:
+        return 0
+
+    try:
+        return db.write(lambda conn: conn.execute("""
+            DELETE FROM embedding_cache WHERE key IN (
+                SELECT key FROM embedding_cache
+                ORDER BY created DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (EMBED_CACHE_MAX_ROWS if max_rows is None else max_rows,)).rowcount)
+    except Exception as e:
+        logger.error(f"Error pruning embedding cache: {e}")
+        return 0
 
-            # Проверяем ответ
-            response.raise_for_status()
-            response_data = response.json()
+def _is_retryable_embedding_error(exc: BaseException) -> bool:
+    """
+    Определяет, имеет ли смысл повторять тот же запрос.
+    Ошибки 4xx (кроме 429) повторять бессмысленно - такой батч делится пополам.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, (httpx.HTTPError, ConnectionError))
+
+def estimate_tokens(text: str) -> int:
+    """
+    Консервативная оценка количества токенов без токенизатора.
+    Для кириллицы токен короче, поэтому берем 2 символа на токен.
+    """
+    return max(1, len(text) // 2)
+
+def make_batches(
+    texts: List[str],
+    max_items: int = EMBED_BATCH_MAX_ITEMS,
+    max_tokens: int = EMBED_BATCH_MAX_TOKENS
+) -> List[List[int]]:
+    """
+    Упаковывает тексты в батчи с ограничением по количеству и оценке токенов.
+
+    Args:
+        texts: Список текстов
+        max_items: Максимум текстов в батче
+        max_tokens: Максимум оценочных токенов в батче
+
+    Returns:
+        List[List[int]]: Списки индексов исходных текстов, порядок сохраняется
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+@retry(
+    stop=stop_after_attempt(5),
+    wait=wait_exponential(multiplier=1, min=1, max=10),
+    retry=retry_if_exception(_is_retryable_embedding_error),
+    reraise=True
+)
+async def get_embeddings(
+    texts: List[str],
+    api_key: str,
+    model: str = EMBED_MODEL
+) -> List[List[float]]:
+    """
+    Получает эмбеддинги для нескольких текстов одним запросом к OpenAI API.
+
+    Args:
+        texts: Тексты для эмбеддинга
+        api_key: API ключ OpenAI
+        model: Модель для генерации эмбеддинга
+
+    Returns:
+        List[List[float]]: Эмбеддинги в том же порядке, что и тексты
+    """
+    async with embed_semaphore:
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+
+        data = {
+            "input": texts,
+            "model": model
+        }
+
+        client = get_client("openai")
+        response = await client.post(
+            "https://api.openai.com/v1/embeddings",
+            headers=headers,
+            json=data
+        )
+        response.raise_for_status()
+        items = response.json()["data"]
 
-            # Извлекаем эмбеддинг
-            return response_data["data"][0]["embedding"]
+    if len(items) != len(texts):
+        raise ValueError(f"Embeddings API returned {len(items)} vectors for {len(texts)} inputs")
+
+    # API возвращает поле index - восстанавливаем исходный порядок
+    items = sorted(items, key=lambda item: item.get("index", 0))
+    return [item["embedding"] for item in items]
+
+async def embed_texts(
+    texts: List[str],
+    api_key: str,
+    model: str = EMBED_MODEL,
+    on_message: Optional[Callable[[str], Any]] = None,
+    label: str = "",
+    max_items: int = EMBED_BATCH_MAX_ITEMS,
+    max_tokens: int = EMBED_BATCH_MAX_TOKENS
+) -> List[List[float]]:
+    """
+    Батчевый эмбеддер: упаковывает тексты в запросы и сохраняет порядок.
+    Если батч не удалось получить, он делится пополам и запрашивается заново;
+    ошибка одиночного текста пробрасывается вызывающему.
+
+    Args:
+        texts: Тексты для эмбеддинга
+        api_key: API ключ OpenAI
+        model: Модель для генерации эмбеддинга
+        on_message: Функция обратного вызова для сообщений о прогрессе
+        label: Метка для сообщений о прогрессе (обычно имя файла)
+        max_items: Максимум текстов в батче
+        max_tokens: Максимум оценочных токенов в батче
+
+    Returns:
+        List[List[float]]: Эмбеддинги в том же порядке, что и тексты
+    """
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    batches = make_batches(texts, max_items, max_tokens)
+    done = 0
+
+    async def run_batch(indexes: List[int]) -> None:
+        try:
+            embeddings = await get_embeddings([texts[i] for i in indexes], api_key, model)
+        except Exception as e:
+            # 429/5xx уже повторены tenacity - деление батча только умножит запросы
+            if len(indexes) == 1 or _is_retryable_embedding_error(e):
+                raise
+            logger.warning(f"Embedding batch of {len(indexes)} failed ({e}), splitting")
+            middle = len(indexes) // 2
+            await asyncio.gather(run_batch(indexes[:middle]), run_batch(indexes[middle:]))
+            return
+        for i, embedding in zip(indexes, embeddings):
+            results[i] = embedding
+
+    async def run_top_level(indexes: List[int]) -> None:
+        nonlocal done
+        await run_batch(indexes)
+        done += 1
+        if len(batches) > 1:
+            await call_callback(on_message, f"Embedded {label or 'texts'}: batch {done}/{len(batches)}")
+
+    await asyncio.gather(*(run_top_level(b) for b in batches))
+    return results  # type: ignore[return-value]
+
+async def embed_texts_cached(
+    texts: List[str],
+    api_key: str,
+    model: str = EMBED_MODEL,
+    on_message: Optional[Callable[[str], Any]] = None,
+    label: str = ""
+) -> Tuple[List[List[float]], int]:
+    """
+    Эмбеддинг с кэшем: к API идут только тексты, которых нет в embedding_cache.
+
+    Args:
+        texts: Тексты для эмбеддинга
+        api_key: API ключ OpenAI
+        model: Модель эмбеддинга
+        on_message: Функция обратного вызова для сообщений о прогрессе
+        label: Метка для сообщений о прогрессе
+
+    Returns:
+        Tuple[List[List[float]], int]: Эмбеддинги по порядку и число попаданий в кэш
+    """
+    keys = [embedding_cache_key(text, model) for text in texts]
+    db = await _get_db_async()
+    cached = await db.run_read(load_cached_embeddings, keys) if db else {}
+
+    # Одинаковые тексты запрашиваем один раз
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        fresh = await embed_texts(
+            list(missing.values()), api_key, model, on_message=on_message, label=label
+        )
+        new_items = dict(zip(missing.keys(), fresh))
+        if db:
+            await db.run_write(save_cached_embeddings, new_items, model)
+        cached.update(new_items)
+
+    hits = sum(1 for key in keys if key not in missing)
+    if db and hits:
+        db.defer_write(touch_cached_embeddings, [key for key in keys if key not in missing])
+    return [cached[key] for key in keys], hits
+
+async def get_embedding_cached(
+    text: str,
+    api_key: str,
+    model: str = EMBED_MODEL
+) -> List[float]:
+    """
+    Возвращает эмбеддинг текста, сначала проверяя embedding_cache.
+
+    Args:
+        text: Текст для эмбеддинга
+        api_key: API ключ OpenAI
+        model: Модель эмбеддинга
+
+    Returns:
+        List[float]: Эмбеддинг
+    """
+    key = embedding_cache_key(text, model)
+    db = await _get_db_async()
+    cached = await db.run_read(load_cached_embeddings, [key]) if db else {}
+    if key in cached:
+        db.defer_write(touch_cached_embeddings, [key])
+        return cached[key]
+
+    embedding = await get_embedding(text, api_key, model)
+    if db:
+        await db.run_write(save_cached_embeddings, {key: embedding}, model)
+    return embedding
 
 def chunk_text(
     text: str,
@@ -316,25 +995,105 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
 
     return dot_product / (norm1 * norm2)
 
+def _stored_chunks(conn: sqlite3.Connection, fname: str) -> Dict[str, int]:
+    """Чанки файла, уже лежащие в БД: {id: номер чанка}."""
+    return dict(conn.execute("SELECT id, chunk_index FROM vectors WHERE file_path = ?", (fname,)).fetchall())
+
+def _commit_file_chunks(
+    fname: str,
+    stale_ids: List[str],
+    moved: List[Tuple[int, str]],
+    new_rows: List[Tuple[str, str, int, List[float], str, str]],
+    chunks: int
+) -> None:
+    """
+    Записывает изменения файла одной транзакцией и затем обновляет
+    счетчики и резидентный индекс. Выполняется в потоке записи.
+    """
+    def write(conn: sqlite3.Connection) -> None:
+        conn.executemany("DELETE FROM vectors WHERE id = ?", [(vid,) for vid in stale_ids])
+        conn.executemany("DELETE FROM vector_exact WHERE id = ?", [(vid,) for vid in stale_ids])
+        conn.executemany("UPDATE vectors SET chunk_index = ? WHERE id = ?", moved)
+        conn.executemany("""
+            INSERT OR REPLACE INTO vectors
+                (id, file_path, chunk_index, embedding, text, timestamp, chunk_hash, embedding_format)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?)
+        """, [
+            (vector_id, file_path, idx, encode_embedding(embedding, VECTOR_STORAGE), chunk, digest, VECTOR_STORAGE)
+            for vector_id, file_path, idx, embedding, chunk, digest in new_rows
+        ])
+        if VECTOR_STORAGE != "float32" and VECTOR_EXACT_COPY:
+            conn.executemany("INSERT OR REPLACE INTO vector_exact (id, embedding) VALUES (?, ?)", [
+                (vector_id, encode_embedding(embedding, "float32"))
+                for vector_id, _path, _idx, embedding, _chunk, _digest in new_rows
+            ])
+
+    with _memory_lock:
+        get_db().write(write)
+
+        # Обновляем счетчики и резидентный индекс только после успешного коммита
+        if store_state.loaded:
+            store_state.set_file(fname, chunks)
+        if vector_index.loaded:
+            vector_index.remove(stale_ids)
+            for idx, vector_id in moved:
+                vector_index.update_chunk_index(vector_id, idx)
+            for vector_id, file_path, idx, embedding, chunk, _digest in new_rows:
+                vector_index.upsert(vector_id, file_path, idx, embedding, chunk)
+    _train_in_background()
+
+def _commit_removed_files(files: List[str]) -> Dict[str, int]:
+    """
+    Удаляет векторы и метаданные файлов одной транзакцией (поток записи).
+
+    Returns:
+        Dict[str, int]: Количество удаленных чанков по файлам
+    """
+    def write(conn: sqlite3.Connection) -> Dict[str, int]:
+        counts = {}
+        for fname in files:
+            conn.execute(
+                "DELETE FROM vector_exact WHERE id IN (SELECT id FROM vectors WHERE file_path = ?)", (fname,)
+            )
+            counts[fname] = conn.execute("DELETE FROM vectors WHERE file_path = ?", (fname,)).rowcount
+            conn.execute("DELETE FROM file_meta WHERE file_path = ?", (fname,))
+        return counts
+
+    with _memory_lock:
+        counts = get_db().write(write)
+        for fname in files:
+            if store_state.loaded:
+                store_state.remove_file(fname)
+            vector_index.remove_file(fname)
+    return counts
+
 async def vectorize_file(
     fname: str,
     openai_api_key: str,
     file_sha256: str,
-    on_message: Optional[Callable[[str], Any]] = None
+    on_message: Optional[Callable[[str], Any]] = None,
+    diff: bool = True
 ) -> List[str]:
     """
     Векторизует один файл и сохраняет в SQLite.
 
+    В режиме diff каждый чанк получает стабильный ID по SHA256 своего текста:
+    вставляются только новые чанки, исчезнувшие удаляются, а неизменившиеся
+    остаются на месте (у них обновляется лишь номер чанка). Без diff все
+    строки файла переписываются заново.
+
     Args:
         fname: Имя файла
         openai_api_key: API ключ OpenAI
         file_sha256: SHA256 хеш файла
         on_message: Функция обратного вызова для сообщений
+        diff: Обновлять только изменившиеся чанки
 
     Returns:
         List[str]: Список ID добавленных векторов
     """
-    if not db_conn:
+    db = await _get_db_async()
+    if not db:
         return []
 
     try:
@@ -344,34 +1103,50 @@ async def vectorize_file(
         with open(fname, "r", encoding="utf-8", errors="ignore") as f:
             text = f.read()
 
-        # Разбиваем на чанки
-        chunks = chunk_text(text)
-        if not chunks:
+        # Разбиваем на чанки и назначаем стабильные ID (дубликаты текста храним один раз)
+        wanted: Dict[str, Tuple[int, str, str]] = {}
+        for idx, chunk in enumerate(chunk_text(text)):
+            digest = chunk_hash(chunk)
+            vector_id = f"{fname}:{digest[:16]}"
+            if vector_id not in wanted:
+                wanted[vector_id] = (idx, chunk, digest)
+
+        # Сравниваем с тем, что уже лежит в БД (без diff все строки файла устаревают)
+        stored = await db.aread(_stored_chunks, fname)
+        existing = stored if diff else {}
+        stale_ids = [vid for vid in stored if not diff or vid not in wanted]
+        new_ids = [vid for vid in wanted if vid not in existing]
+        moved = [
+            (wanted[vid][0], vid) for vid in wanted
+            if vid in existing and existing[vid] != wanted[vid][0]
+        ]
+
+        if not wanted and not stale_ids:
             await call_callback(on_message, f"No chunks created for {fname}")
             return []
 
-        # Векторизуем каждый чанк
-        upserted_ids = []
-        cursor = db_conn.cursor()
-
-        for idx, chunk in enumerate(chunks):
-            # Получаем эмбеддинг
-            embedding = await get_embedding(chunk, openai_api_key)
-
-            # Сохраняем в БД
-            vector_id = f"{fname}:{idx}"
-            embedding_blob = np.array(embedding, dtype=np.float32).tobytes()
-
-            cursor.execute("""
-                INSERT OR REPLACE INTO vectors (id, file_path, chunk_index, embedding, text, timestamp)
-                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (vector_id, fname, idx, embedding_blob, chunk, ))
-
-            upserted_ids.append(vector_id)
-
-        db_conn.commit()
-        await call_callback(on_message, f"Vectorized {fname}: {len(chunks)} chunks")
-        return upserted_ids
+        # Получаем эмбеддинги только для новых чанков; оплаченные берем из кэша
+        embeddings, cache_hits = await embed_texts_cached(
+            [wanted[vid][1] for vid in new_ids], openai_api_key, on_message=on_message, label=fname
+        )
+
+        # Записываем изменения одной транзакцией в потоке записи
+        new_rows = [
+            (vector_id, fname, wanted[vector_id][0], embedding, wanted[vector_id][1], wanted[vector_id][2])
+            for vector_id, embedding in zip(new_ids, embeddings)
+        ]
+        await db.run_write(
+            _commit_file_chunks, fname, stale_ids, moved, new_rows,
+            len(stored) - len(stale_ids) + len(new_ids)
+        )
+
+        await call_callback(
+            on_message,
+            f"Vectorized {fname}: {len(wanted)} chunks "
+            f"({len(new_ids)} new, {len(stale_ids)} removed, "
+            f"{cache_hits} from embedding cache)"
+        )
+        return new_ids
 
     except Exception as e:
         logger.error(f"Error vectorizing file {fname}: {e}")
@@ -387,6 +1162,7 @@ async def vectorize_all_files(
     """
     Векторизует все файлы в указанных директориях.
     Обновляет SQLite БД для новых/измененных файлов (отслеживание по SHA256), удаляет для удаленных.
+    Измененные файлы обновляются по чанкам (diff), force переписывает их целиком.
 
     Args:
         openai_api_key: API ключ OpenAI
@@ -397,14 +1173,15 @@ async def vectorize_all_files(
     Returns:
         Dict[str, List[str]]: Словарь с информацией об обработанных файлах
     """
-    if not db_conn:
+    db = await _get_db_async()
+    if not db:
         logger.warning("SQLite database not available, skipping vectorization")
         await call_callback(on_message, "Vector store not available (SQLite not configured)")
         return {"upserted": [], "deleted": []}
 
     # Сканируем текущие файлы и загружаем предыдущие метаданные
     current = scan_files(path_patterns)
-    previous = load_vector_meta()
+    previous = await db.run_read(load_vector_meta)
 
     # Определяем измененные, новые и удаленные файлы (по SHA256)
     changed = [f for f in current if (force or current[f] != previous.get(f))]
@@ -416,6 +1193,25 @@ async def vectorize_all_files(
         await call_callback(on_message, "Vector store already up to date (no SHA256 changes detected)")
         return {"upserted": [], "deleted": []}
 
+    store_state.begin_indexing()
+    try:
+        return await _vectorize_changes(
+            openai_api_key, current, changed, new, removed, force, on_message
+        )
+    finally:
+        store_state.end_indexing()
+
+async def _vectorize_changes(
+    openai_api_key: str,
+    current: Dict[str, str],
+    changed: List[str],
+    new: List[str],
+    removed: List[str],
+    force: bool,
+    on_message: Optional[Callable[[str], Any]]
+) -> Dict[str, List[str]]:
+    """Векторизует измененные файлы и удаляет векторы удаленных (часть vectorize_all_files)."""
+    db = get_db()
     upserted_ids = []
     tasks = []
 
@@ -425,7 +1221,7 @@ async def vectorize_all_files(
             continue
 
         # Добавляем задачу для асинхронной обработки
-        tasks.append(vectorize_file(fname, openai_api_key, current[fname], on_message))
+        tasks.append(vectorize_file(fname, openai_api_key, current[fname], on_message, diff=not force))
 
     # Запускаем все задачи конкурентно и собираем результаты
     if tasks:
@@ -439,16 +1235,14 @@ async def vectorize_all_files(
     # Удаляем векторы для удаленных файлов
     deleted_ids = []
     if removed:
-        cursor = db_conn.cursor()
+        deleted_counts = await db.run_write(_commit_removed_files, removed)
         for fname in removed:
-            cursor.execute("DELETE FROM vectors WHERE file_path = ?", (fname,))
-            deleted_count = cursor.rowcount
             deleted_ids.append(fname)
-            await call_callback(on_message, f"Deleted vectors for {fname} ({deleted_count} chunks)")
-        db_conn.commit()
+            await call_callback(on_message, f"Deleted vectors for {fname} ({deleted_counts[fname]} chunks)")
 
     # Сохраняем обновленные метаданные
-    save_vector_meta(current)
+    await db.run_write(save_vector_meta, current)
+    await db.run_write(prune_embedding_cache)
 
     # Отправляем итоговое сообщение
     summary = (
@@ -462,6 +1256,53 @@ async def vectorize_all_files(
 
     return {"upserted": upserted_ids, "deleted": deleted_ids}
 
+def _exact_embeddings(candidates: List[Tuple[float, str, str, int, str]]) -> Dict[str, np.ndarray]:
+    """
+    Точные float32-эмбеддинги кандидатов: {id вектора: эмбеддинг}.
+    Берутся из vector_exact, а для строк, записанных в float32 до смены
+    формата хранения, - из самой таблицы vectors.
+    """
+    ids = [vector_id for _score, vector_id, _path, _idx, _text in candidates]
+    if not ids:
+        return {}
+
+    def query(conn: sqlite3.Connection) -> List[Tuple[str, bytes, Optional[str], Optional[bytes]]]:
+        placeholders = ",".join("?" * len(ids))
+        return conn.execute(f"""
+            SELECT v.id, v.embedding, v.embedding_format, e.embedding
+            FROM vectors v LEFT JOIN vector_exact e ON e.id = v.id
+            WHERE v.id IN ({placeholders})
+        """, ids).fetchall()
+
+    exact = {}
+    for vector_id, blob, storage, exact_blob in get_db().read(query):
+        if exact_blob is not None:
+            exact[vector_id] = decode_embedding(exact_blob, "float32")
+        elif storage in (None, "float32"):
+            exact[vector_id] = decode_embedding(blob, storage)
+    return exact
+
+def _search_index(
+    query_embedding: List[float],
+    top_k: int,
+    min_score: float
+) -> List[Tuple[float, str, str, int, str]]:
+    """
+    Поиск по резидентному индексу с точным пересчетом для квантованных
+    форматов, если включена VECTOR_EXACT_COPY; без нее сходство считается
+    по квантованным векторам. Выполняется в пуле чтения: матричное
+    произведение и блокировка индекса не задерживают цикл событий.
+    """
+    if not vector_index.quantized or not VECTOR_EXACT_COPY:
+        return vector_index.search(query_embedding, top_k=top_k, min_score=min_score)
+    # Грубый поиск по квантованным векторам, затем точный пересчет по float32 из vector_exact
+    candidates = vector_index.search(
+        query_embedding, top_k=top_k * RERANK_FACTOR, min_score=min_score - RERANK_MARGIN
+    )
+    exact = _exact_embeddings(candidates)
+    store_state.count_rerank(len(candidates), len(candidates) - len(exact))
+    return rerank(query_embedding, candidates, exact, top_k, min_score)
+
 async def semantic_search(
     query: str,
     openai_api_key: str,
@@ -481,49 +1322,25 @@ async def semantic_search(
     Returns:
         List[str]: Список найденных чанков текста
     """
-    if not db_conn:
+    db = await _get_db_async()
+    if not db:
         logger.warning("SQLite database not available, skipping semantic search")
         return []
 
     chunks = []
     try:
         # Получаем эмбеддинг для запроса
-        query_embedding = await get_embedding(query, openai_api_key)
+        query_embedding = await get_embedding_cached(query, openai_api_key)
 
-        # Загружаем все векторы из БД
-        cursor = db_conn.cursor()
-        cursor.execute("SELECT id, file_path, chunk_index, embedding, text FROM vectors")
-        rows = cursor.fetchall()
-
-        # Вычисляем сходство для каждого вектора
-        similarities = []
-        for row in rows:
-            vector_id, file_path, chunk_index, embedding_blob, text = row
-
-            # Преобразуем blob обратно в numpy array
-            embedding = np.frombuffer(embedding_blob, dtype=np.float32).tolist()
-
-            # Вычисляем косинусное сходство
-            similarity = cosine_similarity(query_embedding, embedding)
-
-            if similarity >= min_score:
-                similarities.append({
-                    "id": vector_id,
-                    "file_path": file_path,
-                    "chunk_index": chunk_index,
-                    "text": text,
-                    "score": similarity
-                })
-
-        # Сортируем по убыванию сходства и берем top_k
-        similarities.sort(key=lambda x: x["score"], reverse=True)
-        top_results = similarities[:top_k]
+        # Ищем по резидентному индексу (одно матрично-векторное произведение);
+        # и первая загрузка индекса, и сам поиск идут в пуле чтения
+        if not vector_index.loaded and not await db.run_read(ensure_index_loaded):
+            return []
+        top_results = await db.run_read(_search_index, query_embedding, top_k, min_score)
 
         # Форматируем результаты
-        for result in top_results:
-            file_name = os.path.basename(result["file_path"])
-            score = result["score"]
-            text = result["text"]
+        for score, _vector_id, file_path, _chunk_index, text in top_results:
+            file_name = os.path.basename(file_path)
             chunks.append(f"From {file_name} (score: {score:.2f}):\n{text}")
 
     except Exception as e:
@@ -534,18 +1351,28 @@ async def semantic_search(
 async def is_vector_store_available() -> bool:
     """
     Проверяет доступность векторного хранилища.
+    Ответ берется из счетчика в памяти; в базу идет только первый вызов.
 
     Returns:
         bool: True если хранилище доступно, False в противном случае
     """
-    if not db_conn:
-        return False
+    if not store_state.loaded:
+        db = await _get_db_async()
+        if db:
+            await db.run_read(ensure_state_loaded)
+    return store_state.loaded and store_state.available
 
-    try:
-        cursor = db_conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM vectors")
-        count = cursor.fetchone()[0]
-        return count > 0
-    except Exception as e:
-        logger.error(f"Error checking vector store availability: {e}")
-        return False
+async def vector_store_status() -> Dict[str, Any]:
+    """
+    Подробное состояние хранилища: готовность, идет ли индексация,
+    время последней индексации и число чанков по файлам. Как и
+    is_vector_store_available, в базу (в пуле чтения) идет только первый вызов.
+
+    Returns:
+        Dict[str, Any]: Состояние для /status
+    """
+    if not store_state.loaded:
+        db = await _get_db_async()
+        if db:
+            await db.run_read(ensure_state_loaded)
+    return store_state.snapshot()
@@ -4,6 +4,8 @@ from typing import Optional
 import httpx
 import openai
 
+from utils.http_client import get_client
+
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
@@ -13,23 +15,23 @@ async def download_telegram_file(file_id: str, dest_path: str) -> Optional[str]:
         print("TELEGRAM_TOKEN not configured")
         return None
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getFile",
-                params={"file_id": file_id},
-            )
-            resp.raise_for_status()
-            file_path = resp.json().get("result", {}).get("file_path")
-            if not file_path:
-                return None
-            file_url = (
-                f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file_path}"
-            )
-            file_resp = await client.get(file_url)
-            file_resp.raise_for_status()
-            with open(dest_path, "wb") as f:
-                f.write(file_resp.content)
-            return dest_path
+        client = get_client("telegram")
+        resp = await client.get(
+            f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getFile",
+            params={"file_id": file_id},
+        )
+        resp.raise_for_status()
+        file_path = resp.json().get("result", {}).get("file_path")
+        if not file_path:
+            return None
+        file_url = (
+            f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file_path}"
+        )
+        file_resp = await client.get(file_url)
+        file_resp.raise_for_status()
+        with open(dest_path, "wb") as f:
+            f.write(file_resp.content)
+        return dest_path
     except Exception as e:
         print(f"Error downloading telegram file: {e}")
         return None